@@ -4,10 +4,14 @@ for the application, including IP address, Selenium server URL, Amazon URLs, and
 """
 
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Directory of the state kept between runs (ASIN mirror)
+DATA_PATH = os.getenv("DATA_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
 config = {
     "ip": os.getenv("IP"),
     "selenium_url": os.getenv("SELENIUM_URL"),
@@ -24,5 +28,127 @@ config = {
         "reset": '\033[0m'
     },
     "brands": [],
-    "credentials": os.getenv("CREDENTIALS_PATH")
+    "credentials": os.getenv("CREDENTIALS_PATH"),
+    "login": {
+        "email": os.getenv("SCRAPER_EMAIL"),
+        "password": os.getenv("SCRAPER_PASSWORD"),
+        "file": os.getenv("SCRAPER_LOGIN_FILE")
+    },
+    # Without a refresh endpoint (or when the refresh fails) the scraper logs in again
+    "refresh_endpoint": os.getenv("REFRESH_ENDPOINT"),
+    "token_refresh_margin": int(os.getenv("TOKEN_REFRESH_MARGIN") or 60),
+    "concurrency": int(os.getenv("CONCURRENCY") or 0),
+    "profile": os.getenv("BROWSER_PROFILE") or "default",
+    "profiles": {
+        "default": [],
+        "headless": [
+            "--headless=new",
+            "--window-size=1920,1080"
+        ],
+        "light": [
+            "--headless=new",
+            "--window-size=1920,1080",
+            "--disable-gpu",
+            "--blink-settings=imagesEnabled=false"
+        ]
+    },
+    # Maximum of WebDriver commands per page kind (product, search, top). In strict mode
+    # a page over its budget fails the run (the benchmark uses it as a regression test).
+    "command_budgets": json.loads(os.getenv("COMMAND_BUDGETS") or "{}"),
+    "command_budget_strict": os.getenv("COMMAND_BUDGET_STRICT", "0") == "1",
+    # Cookies of a session past the interstitial pages, reused by the new sessions
+    # (disabled when the path is not set). The ttl is in minutes.
+    "session_store": {
+        "path": os.getenv("SESSION_STORE_PATH"),
+        "ttl": float(os.getenv("SESSION_STORE_TTL") or 720)
+    },
+    # "browser" reads every page with the browser, "hybrid" reads the product and search pages
+    # with an HTTP client that takes the cookies of the browser session
+    "transport": os.getenv("TRANSPORT") or "browser",
+    "http_timeout": float(os.getenv("HTTP_TIMEOUT") or 20),
+    "session_retries": int(os.getenv("SESSION_RETRIES") or 2),
+    # Tabs of each data scraper session; the next products load in the other tabs
+    # while the current one is read (1 disables the pipelining)
+    "tabs": int(os.getenv("TABS_PER_SESSION") or 1),
+    # Sessions are recycled after a number of pages, minutes, MB of JS heap or DOM nodes
+    # (0 disables each limit, all of them are disabled by default). The page and minute limits
+    # of each session are lowered by up to `jitter` (a fraction), so the sessions don't recycle
+    # at the same time. The memory is read every `check_every` pages, and the old session
+    # is closed when its replacement is not ready after `grace_pages` more pages.
+    "recycle": {
+        "pages": int(os.getenv("RECYCLE_PAGES") or 0),
+        "minutes": float(os.getenv("RECYCLE_MINUTES") or 0),
+        "heap_mb": float(os.getenv("RECYCLE_HEAP_MB") or 0),
+        "dom_nodes": int(os.getenv("RECYCLE_DOM_NODES") or 0),
+        "jitter": float(os.getenv("RECYCLE_JITTER") or 0.25),
+        "check_every": int(os.getenv("RECYCLE_CHECK_PAGES", 25)),
+        "grace_pages": int(os.getenv("RECYCLE_GRACE_PAGES", 20))
+    },
+    # Page load and item deadlines in seconds, phase deadline and run budget in minutes (0 means no limit).
+    # The upload reserve is the part of the run budget kept for the uploads.
+    "deadlines": {
+        "page_load": float(os.getenv("PAGE_LOAD_TIMEOUT") or 30),
+        "item": float(os.getenv("ITEM_DEADLINE") or 90),
+        "phase": float(os.getenv("PHASE_DEADLINE") or 0),
+        "run_budget": float(os.getenv("RUN_BUDGET") or 0),
+        "upload_reserve": float(os.getenv("RUN_BUDGET_RESERVE") or 5)
+    },
+    "prewarm": os.getenv("PREWARM_SESSIONS", "0") == "1",
+    # Seconds between the progress lines (0 disables them), status file, local HTTP port
+    # of the status (0 disables it) and seconds of throughput used for the ETA
+    "progress": {
+        "interval": float(os.getenv("PROGRESS_INTERVAL") or 30),
+        "path": os.getenv("PROGRESS_FILE"),
+        "port": int(os.getenv("PROGRESS_PORT") or 0),
+        "window": float(os.getenv("PROGRESS_WINDOW") or 300)
+    },
+    # Directory of the run traces (disabled when it is not set), sampling interval
+    # of the threads in milliseconds (0 disables it) and tracemalloc snapshots per phase
+    "profiling": {
+        "path": os.getenv("TRACE_PATH"),
+        "sample_interval": float(os.getenv("PROFILE_SAMPLE_MS") or 0),
+        "tracemalloc": os.getenv("PROFILE_TRACEMALLOC", "0") == "1"
+    },
+    "parser_workers": int(os.getenv("PARSER_WORKERS") or 0),
+    "asin_mirror": {
+        "path": os.getenv("ASIN_MIRROR_PATH") or os.path.join(DATA_PATH, "asin_mirror.db"),
+        "page_size": int(os.getenv("ASINS_PAGE_SIZE") or 1000),
+        # Hours between the full syncs that remove the ASINs deleted from the API
+        "reconcile_hours": float(os.getenv("ASINS_RECONCILE_HOURS") or 24)
+    },
+    # Refresh tiers, from the hottest to the default one. The interval is in minutes
+    # and the budget is the maximum of ASINs per run (0 means no limit).
+    "refresh_tiers": json.loads(os.getenv("REFRESH_TIERS") or "null") or [
+        {"name": "hot", "max_ranking": 100, "min_volatility": 0.5, "interval": 0, "budget": 0},
+        {"name": "warm", "min_volatility": 0.1, "interval": 360, "budget": 0},
+        {"name": "frozen", "max_volatility": 0, "min_scrapes": 5, "interval": 10080, "budget": 0},
+        {"name": "cold", "interval": 1440, "budget": 0}
+    ],
+    "archive": {
+        "path": os.getenv("ARCHIVE_PATH"),
+        "max_bytes": int(os.getenv("ARCHIVE_MAX_MB") or 2048) * 1024 * 1024,
+        "max_age_days": int(os.getenv("ARCHIVE_MAX_AGE_DAYS") or 7),
+        "segment_bytes": int(os.getenv("ARCHIVE_SEGMENT_MB") or 64) * 1024 * 1024
+    },
+    "retry": {
+        "max_attempts": int(os.getenv("RETRY_MAX_ATTEMPTS") or 3),
+        "base_delay": float(os.getenv("RETRY_BASE_DELAY") or 15),
+        "max_delay": float(os.getenv("RETRY_MAX_DELAY") or 120)
+    },
+    "spool": {
+        "path": os.getenv("SPOOL_PATH"),
+        "batch_size": int(os.getenv("UPLOAD_BATCH_SIZE") or 500)
+    },
+    "work_queue": {
+        "url": os.getenv("WORK_QUEUE_URL"),
+        "visibility_timeout": int(os.getenv("WORK_QUEUE_VISIBILITY") or 600),
+        "lease_size": int(os.getenv("WORK_QUEUE_LEASE") or 10),
+        "dedup_window": int(os.getenv("WORK_QUEUE_DEDUP_WINDOW") or 3600),
+        "max_attempts": int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS") or 3)
+    },
+    "benchmark": {
+        "host": os.getenv("FIXTURE_HOST") or "host.docker.internal",
+        "port": int(os.getenv("FIXTURE_PORT") or 8765),
+        "nodes": int(os.getenv("BENCHMARK_NODES") or 2)
+    }
 }
@@ -1 +1,2 @@
-from .auth_exceptions import *
\ No newline at end of file
+from .auth_exceptions import *
+from .scraping_exceptions import *
\ No newline at end of file
@@ -0,0 +1,30 @@
+""""Custom exceptions for scraping errors."""
+
+
+class ScrapingError(Exception):
+    """Base class for scraping errors."""
+
+    pass
+
+
+class TransientScrapingError(ScrapingError):
+    """It raises when a page couldn't be read but a later attempt may succeed
+    (timeouts, interstitial loops, partially loaded pages)."""
+
+    pass
+
+
+class ScraperNotCreated(ScrapingError):
+    """It raises when the browser session of a worker couldn't be created (grid full,
+    session not created). It carries the items of the worker, so they are not lost."""
+
+    def __init__(self, items, *args):
+        super().__init__(*args)
+        self.items = items
+
+
+class CommandBudgetExceeded(ScrapingError):
+    """It raises in strict mode when a page needed more WebDriver commands than its budget."""
+
+    pass
+
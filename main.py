@@ -2,13 +2,18 @@
 This module serves as the entry point for the Amazon scraping application. It initializes the
 AmazonScraperManager with specific scraper classes and provides a menu-driven interface
 for users to log in, manage tokens, and perform scraping tasks.
+When it is called with a subcommand (update, brands, top100) it runs without prompts,
+so it can be used from cron or systemd. Run `python main.py --help` for the options.
 """
 import sys
 import os
 import json
+import signal
+import argparse
 import traceback
 
 from time import sleep
+from datetime import datetime
 from getpass import getpass
 from config import config
 from pathlib import Path
@@ -18,6 +23,7 @@ from custom_exceptions import (
     InvalidCredentials)
 from scrapers import (
     AmazonScraperManager,
+    BaseAmazonScraper,
     AmazonAsinScraper,
     AmazonDataScraper,
     AmazonTopScraper
@@ -36,6 +42,25 @@ def save_tokens(scraper: AmazonScraperManager, file: Path):
         f"\n{config["colors"]["green"]}Tokens have been saved.{config["colors"]["reset"]}")
 
 
+# Exit codes of the non-interactive mode
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_AUTH = 3
+EXIT_INTERRUPTED = 130
+
+
+def load_tokens(scraper: AmazonScraperManager, file: Path):
+    if not file.exists():
+        return
+
+    with file.open('r') as f:
+        read_tokens = json.load(f)
+        scraper.set_credentials(
+            read_tokens.get("access_token") or "",
+            read_tokens.get("refresh_token") or ""
+        )
+
+
 def menu(scraper: AmazonScraperManager, file: Path):
     if not file.exists():
         with file.open('w') as f:
@@ -99,6 +124,7 @@ def menu(scraper: AmazonScraperManager, file: Path):
                     print("Finishing new brands search.")
             case 3:
                 save_tokens(scraper=scraper, file=file)
+                scraper.shutdown()
                 sys.exit(0)
             case _:
                 print("Invalid option.")
@@ -106,7 +132,261 @@ def menu(scraper: AmazonScraperManager, file: Path):
         print("Finishing program...")
 
 
+def parse_date(value: str) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date: {value}")
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Amazon scraper. Without a subcommand it starts the interactive menu.")
+    parser.add_argument(
+        "--profile",
+        choices=list(config["profiles"].keys()),
+        default=config["profile"],
+        help="Browser profile used to create the sessions.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=config["concurrency"],
+        help="Number of concurrent browser sessions (default: CPU count).")
+    parser.add_argument(
+        "--login-file",
+        default=config["login"]["file"],
+        help="JSON file with the email and password used to log in.")
+    parser.add_argument(
+        "--transport",
+        choices=["browser", "hybrid"],
+        default=config["transport"],
+        help="Read the pages with the browser, or over HTTP with the browser session (hybrid).")
+    parser.add_argument(
+        "--tabs",
+        type=int,
+        default=config["tabs"],
+        help="Tabs of each product scraper session, loading the next products ahead (default: TABS_PER_SESSION).")
+    parser.add_argument(
+        "--trace",
+        default=config["profiling"]["path"],
+        help="Directory where a Chrome trace of every run is written (default: TRACE_PATH).")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=config["deadlines"]["run_budget"],
+        help="Time budget of each run in minutes, uploads included (default: RUN_BUDGET, "
+             "or the interval in daemon mode).")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = subparsers.add_parser(
+        "update", help="Regular update of the tracked products.")
+    update_parser.add_argument(
+        "--brands",
+        help="Comma separated brands to search (default: brands from the API).")
+    update_parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and repeat the update on an interval.")
+    update_parser.add_argument(
+        "--interval",
+        type=int,
+        default=60,
+        help="Minutes between updates in daemon mode (default: 60).")
+
+    brands_parser = subparsers.add_parser(
+        "brands", help="Search new brands or a specific brand.")
+    brands_parser.add_argument(
+        "--brands",
+        required=True,
+        help="Comma separated brands to search.")
+
+    subparsers.add_parser(
+        "top100", help="Update only the top 100 products and their variants.")
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Re-run the parsers over the archived pages (ARCHIVE_PATH).")
+    replay_parser.add_argument(
+        "--since",
+        type=parse_date,
+        help="Only pages archived from this date (ISO format).")
+    replay_parser.add_argument(
+        "--until",
+        type=parse_date,
+        help="Only pages archived until this date (ISO format).")
+    replay_parser.add_argument(
+        "--export",
+        help="Write the products to this JSONL file instead of uploading them.")
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="Measure the throughput of several worker counts against a local fixture site.")
+    benchmark_parser.add_argument(
+        "--workers",
+        default="4,8,16",
+        help="Comma separated worker counts (default: 4,8,16).")
+    benchmark_parser.add_argument(
+        "--profiles",
+        default=config["profile"],
+        help="Comma separated browser profiles (default: the --profile option).")
+    benchmark_parser.add_argument(
+        "--items",
+        type=int,
+        default=100,
+        help="Products scraped in each case (default: 100).")
+    benchmark_parser.add_argument(
+        "--export",
+        help="Write the results to this JSON file.")
+    benchmark_parser.add_argument(
+        "--command-budget",
+        type=int,
+        help="Fail if a product page needs more WebDriver commands than this.")
+
+    return parser.parse_args(argv)
+
+
+def load_login(login_file: str | None) -> tuple:
+    """Read the login credentials from the environment or from a JSON file."""
+    email = config["login"]["email"]
+    password = config["login"]["password"]
+    if login_file:
+        with Path(login_file).open('r') as f:
+            login = json.load(f)
+        email = login.get("email") or email
+        password = login.get("password") or password
+    return email, password
+
+
+def authenticate(scraper: AmazonScraperManager, file: Path, login_file: str | None):
+    """Load the saved tokens or log in with the stored credentials."""
+    email, password = load_login(login_file)
+    if email and password:
+        scraper.set_login_credentials(email, password)
+
+    load_tokens(scraper=scraper, file=file)
+    if scraper.token:
+        return
+
+    if not (email and password):
+        raise InvalidCredentials(
+            "No saved tokens and no credentials (SCRAPER_EMAIL/SCRAPER_PASSWORD or --login-file).")
+    scraper.login(email, password)
+    if not scraper.token:
+        raise InvalidCredentials("Login failed.")
+
+
+def run_command(scraper: AmazonScraperManager, args: argparse.Namespace):
+    match args.command:
+        case "update":
+            scraper.get_asins()
+            if args.brands:
+                scraper.update_brands(
+                    [brand.strip() for brand in args.brands.split(",") if brand.strip()])
+            else:
+                scraper.restore_brands()
+            scraper.main()
+        case "brands":
+            scraper.update_brands(
+                [brand.strip() for brand in args.brands.split(",") if brand.strip()])
+            scraper.main()
+        case "top100":
+            scraper.top_100_update()
+        case "replay":
+            scraper.replay(
+                since=args.since, until=args.until, export_path=args.export)
+        case "benchmark":
+            if args.command_budget:
+                config["command_budgets"]["product"] = args.command_budget
+                BaseAmazonScraper.command_stats.strict = True
+            scraper.benchmark(
+                workers_list=[int(workers) for workers in args.workers.split(",")],
+                profiles=[profile.strip() for profile in args.profiles.split(",")],
+                items=args.items,
+                export_path=args.export
+            )
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt(f"Signal {signum} received.")
+
+
+def run_cli(argv: list) -> int:
+    """Non-interactive entry point. It returns the exit code of the program."""
+    args = parse_args(argv)
+    config["profile"] = args.profile
+    config["concurrency"] = args.concurrency
+    config["deadlines"]["run_budget"] = args.budget
+    config["profiling"]["path"] = args.trace
+    config["transport"] = args.transport
+    config["tabs"] = max(args.tabs, 1)
+    if not args.budget and args.command == "update" and args.daemon:
+        # Every update of the daemon must end before the next one
+        config["deadlines"]["run_budget"] = args.interval
+    signal.signal(signal.SIGTERM, _terminate)
+
+    scraper = AmazonScraperManager(
+        AmazonAsinScraper,
+        AmazonDataScraper,
+        AmazonTopScraper
+    )
+    scraper.interactive = False
+    # The tokens file is only used by the commands that call the API
+    file = None
+
+    try:
+        # Exporting a replay and the benchmark don't use the API
+        if not (args.command == "replay" and args.export) and args.command != "benchmark":
+            if not config["credentials"]:
+                raise InvalidCredentials("CREDENTIALS_PATH is not set.")
+            file = Path(config["credentials"])
+            authenticate(scraper=scraper, file=file,
+                         login_file=args.login_file)
+            save_tokens(scraper=scraper, file=file)
+
+        while True:
+            try:
+                run_command(scraper=scraper, args=args)
+            except (TokenExpiredError, InvalidCredentials):
+                raise
+            except Exception:
+                if not (args.command == "update" and args.daemon):
+                    raise
+                # A failed update must not stop the daemon
+                print(f"{config["colors"]["red"]}Update failed:")
+                traceback.print_exc()
+                print(f"{config["colors"]["reset"]}")
+            finally:
+                if file is not None and scraper.token:
+                    save_tokens(scraper=scraper, file=file)
+
+            if not (args.command == "update" and args.daemon):
+                return EXIT_OK
+            print(
+                f"{config["colors"]["purple"]}Next update in {args.interval} minutes.{config["colors"]["reset"]}")
+            sleep(args.interval * 60)
+
+    except (TokenExpiredError, InvalidCredentials) as e:
+        print(
+            f"{config["colors"]["red"]}Authentication error: {str(e)}{config["colors"]["reset"]}")
+        return EXIT_AUTH
+    except KeyboardInterrupt:
+        print(
+            f"\n{config["colors"]["red"]}[Interrupted] Closing main program...{config["colors"]["reset"]}")
+        return EXIT_INTERRUPTED
+    except Exception:
+        print(f"{config["colors"]["red"]}Error:")
+        traceback.print_exc()
+        print(f"{config["colors"]["reset"]}")
+        return EXIT_ERROR
+    finally:
+        scraper.shutdown()
+
+
 def main():
+    if not config["credentials"]:
+        print(
+            f"{config["colors"]["red"]}CREDENTIALS_PATH is not set.{config["colors"]["reset"]}")
+        return
+
     amazon_scrapper_manager = AmazonScraperManager(
         AmazonAsinScraper,
         AmazonDataScraper,
@@ -118,11 +398,15 @@ def main():
         menu(scraper=amazon_scrapper_manager, file=file)
     except KeyboardInterrupt as e:
         save_tokens(scraper=amazon_scrapper_manager, file=file)
+        amazon_scrapper_manager.shutdown()
         raise KeyboardInterrupt(e)
 
 
 # Run the main function if this script is executed directly
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+
     try:
         main()
     except KeyboardInterrupt:
@@ -3,3 +3,5 @@ from .amazon_scraper_manager import AmazonScraperManager
 from .amazon_asin_scraper import AmazonAsinScraper
 from .amazon_data_scraper import AmazonDataScraper
 from .amazon_top_scraper import AmazonTopScraper
+from .html_parser import HtmlParserPool
+from .archive_replay import ArchiveReplayer
@@ -6,7 +6,11 @@ and scrapes the ASINs from the search results.
 """
 
 from time import sleep
-from .base_amazon_scraper import BaseAmazonScraper
+from custom_exceptions import TransientScrapingError
+from config import config
+from .base_amazon_scraper import BaseAmazonScraper, PAGE_EMPTY, PAGE_NORMAL
+from .html_parser import parse_search_next, parse_search_page
+from .http_transport import HttpTransport
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import (
     TimeoutException,
@@ -21,15 +25,54 @@ from selenium.webdriver.common.keys import Keys
 class AmazonAsinScraper(BaseAmazonScraper):
     """Main Amazon ASIN scraper class for scraping product data based on brand."""
 
-    def __init__(self, asins_to_update: list) -> None:
+    def __init__(self, asins_to_update: list, **kwargs) -> None:
         """Initialize the scraper with a Selenium WebDriver instance."""
-        super().__init__()
+        super().__init__(**kwargs)
         self.driver = self._create_driver(
             "--start-fullscreen",
             "--incognito"
         )
         self.current_link = ""
         self.asins_to_update_set = self._format_asins(asins_to_update)
+        if config["transport"] == "hybrid":
+            self.http_transport = HttpTransport()
+
+    def _http_search_pages(self, brand: str, asins_list: list, products_list: list) -> str | None:
+        """Read the search result pages over HTTP, starting from the page loaded in the browser.
+        It returns the URL of the first blocked page (None when every page was read)."""
+        url = self.driver.current_url
+        html = self.driver.page_source.encode()
+        while True:
+            self._read_search_page(brand, url, html, asins_list, products_list)
+
+            url = parse_search_next(html, self.amazon_url)
+            if url is None:
+                return None
+            sleep(4)  # Sleep to avoid overwhelming the server
+            state, html = self.http_transport.fetch(url)
+            if state != PAGE_NORMAL:
+                return url
+
+    def _read_search_page(
+            self,
+            brand: str,
+            url: str,
+            html: bytes,
+            asins_list: list,
+            products_list: list) -> None:
+        """Read the search cards from the HTML of a page: in the parser pool if there is one,
+        or here (a page fetched over HTTP without the pool)."""
+        self._archive_page("search", brand, url, html=html)
+        if self.parser_pool:
+            asins, products, logs = self.parser_pool.submit_search(
+                html, self.amazon_url, self.asins_to_update_set).result()
+        else:
+            asins, products, logs = parse_search_page(
+                html, self.amazon_url, self.asins_to_update_set)
+        if logs:
+            print(logs)
+        asins_list.extend(asins)
+        products_list.extend(products)
 
     def _format_asins(self, asins: list) -> set:
         """Method to format the ASINs into a dictionary."""
@@ -45,23 +88,53 @@ class AmazonAsinScraper(BaseAmazonScraper):
             'celulares y smartphones desbloqueados'
         ]
 
+        products_data = []
         for brand in brand_list:
+            # Stop taking new brands when the phase is over
+            if self.deadline.expired():
+                print(
+                    f"{self.colors['yellow']}Phase deadline reached, no more brands are searched.{self.colors['reset']}")
+                break
+            self._maybe_recycle()
             # Initialize the data list for the brand
+            # (a lost session restarts the brand from the search)
             asins_data = []
-            products_data = []
-            self.driver.get(self.amazon_url)
-            self._brand_search(brand)
-            self._brand_filtering(brand)
-            self._category_filtering(brand=brand)
-            main_page = self.driver.current_url
-            for category in categories:
-                if self._category_filtering(brand=brand, category=category):
-                    self._asins_scrape(brand, asins_data, products_data)
-                    self.driver.get(main_page)
+            brand_products_data = []
+            self._task_started()
+            try:
+                with self._span(brand, "item"):
+                    result = self._with_session_retry(
+                        self._brand_process, brand, categories, asins_data, brand_products_data)
+                if result is None:
+                    print(
+                        f"{self.colors['red']}[ERROR] Brand {brand} lost with its browser session.{self.colors['reset']}")
+                    self._task_finished("failed")
+                else:
+                    self._task_finished("done")
+            except TransientScrapingError as e:
+                # The deadline was reached in the middle of the brand, keep what was found
+                print(e)
+                self._task_finished("failed")
             asins_dict[brand] = asins_data
-            self._quit_driver()
+            products_data.extend(brand_products_data)
+        self._quit_driver()
         return asins_dict, products_data
 
+    def _brand_process(self, brand: str, categories: list, asins_data: list, products_data: list) -> bool:
+        """Search a brand and scrape the ASINs of every category."""
+        asins_data.clear()
+        products_data.clear()
+        self._load_page(self.amazon_url, kind="search", key=brand)
+        self._brand_search(brand)
+        self._brand_filtering(brand)
+        self._category_filtering(brand=brand)
+        main_page = self.driver.current_url
+        for category in categories:
+            if self._category_filtering(brand=brand, category=category):
+                self._asins_scrape(brand, asins_data, products_data)
+                self._load_page(main_page, kind="search", key=brand)
+        return True
+
     def _brand_search(self, brand: str):
         """Method to search for the brand on Amazon."""
 
@@ -183,32 +256,26 @@ class AmazonAsinScraper(BaseAmazonScraper):
             '(e5783-230a)', 'udio drc-15pf-15pf', 'me993lla', 'guía completa da61-00524a',
             'punto de acceso portátil', 'barra de surf'
         ]
-        # Handle any captcha or authentication issues
-        self._asin_captchats(url=self.amazon_url)
-        # Wait for the search results to load and find if the category is not empty
-        try:
-            WebDriverWait(self.driver, 1).until(
-                EC.visibility_of_element_located((By.XPATH, '//*[@id="search"]/div[1]/div[1]/div/span[1]/div[1]/div[2]/div/div/div/h3/span')))
+        # Handle any captcha or authentication issues and check if the category is empty
+        if self._asin_captchats(url=self.amazon_url) == PAGE_EMPTY:
             logs += f"{self.colors['red']}Empty results loaded successfully (exit).{self.colors['reset']}\n"
+            print(logs)
+            del logs
             return
-        except TimeoutException:
-            logs += f"{self.colors['green']}Search results not loaded (continue).{self.colors['reset']}\n"
-        except Exception:
-            logs += f"{self.colors['green']}[ERROR] Error loading search results (continue).{self.colors['reset']}\n"
-
-        # If the last element is not found, try to find the search results header
-        # This is to handle cases where the search results page structure might differ
-        try:
-            WebDriverWait(self.driver, 1).until(
-                EC.visibility_of_element_located((By.XPATH, '//*[@id="search"]/div[1]/div[1]/div/span[1]/div[1]/div[1]/div/div/div/h3/span')))
-            logs += f"{self.colors['red']}Empty results header found (exit).{self.colors['reset']}\n"
-            return
-        except TimeoutException:
-            logs += f"{self.colors['green']}Search results header not found (continue).{self.colors['reset']}\n"
-        except Exception:
-            logs += f"{self.colors['green']}[ERROR] Finding Empty results header (continue).{self.colors['reset']}\n"
-
-        while True:
+        logs += f"{self.colors['green']}Search results loaded (continue).{self.colors['reset']}\n"
+
+        browser_pages = True
+        if self.http_transport is not None and self.http_transport.ready:
+            # Read the result pages over HTTP, and go on with the browser from a blocked page
+            blocked_url = self._http_search_pages(brand, asins_list, products_list)
+            if blocked_url is None:
+                browser_pages = False
+            else:
+                self._load_page(blocked_url, kind="search", key=brand)
+                self._asin_captchats(url=self.amazon_url)
+                self._adopt_http_session()
+
+        while browser_pages:
             try:
                 # Search for the products count element to ensure the page has loaded
                 products_count = WebDriverWait(self.driver, 1).until(
@@ -221,7 +288,14 @@ class AmazonAsinScraper(BaseAmazonScraper):
 
             items = []
             sleep(4)
-            items = self.driver.find_elements(By.CLASS_NAME, "s-asin")
+            if self.parser_pool:
+                # Hand the page to the parser pool instead of reading every card through WebDriver
+                self._read_search_page(
+                    brand, self.driver.current_url, self.driver.page_source.encode(),
+                    asins_list, products_list)
+            else:
+                self._archive_page("search", brand, self.driver.current_url)
+                items = self.driver.find_elements(By.CLASS_NAME, "s-asin")
 
             # Iterate through the product items and collect their ASINs
             for item in items:
@@ -4,22 +4,147 @@ This module contains the Amazon data scraper class for scraping product data bas
 It initializes the Selenium WebDriver, scrapes product details such as title, price, images,
 and saving percentage, and handles potential pop-ups and login forms.
 """
-from random import randint
-from time import sleep
+import threading
 
-from .base_amazon_scraper import BaseAmazonScraper
+from time import sleep
+from collections import deque
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+from config import config
+from custom_exceptions import TransientScrapingError
+from utils import Deadline, QueueFeed
+from .base_amazon_scraper import BaseAmazonScraper, PAGE_AUTH, PAGE_INTERSTITIAL, PAGE_NORMAL, PAGE_THROTTLE
+from .html_parser import build_product, parse_product_page
+from .http_transport import HttpTransport
+from .tab_pool import TabPool
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support import expected_conditions as EC
 
+# Extract every product field in a single WebDriver round trip.
+# It returns the same raw fields as `html_parser.extract_product_fields`.
+# The text is the rendered text (`innerText`, like the `.text` of WebDriver),
+# without hidden elements or the contents of inline scripts.
+PRODUCT_EXTRACTION_SCRIPT = """
+const text = (element) => element
+    ? element.innerText.replace(/\\s+/g, ' ').trim() : null;
+const lines = (element) => {
+    if (!element) return null;
+    return element.innerText.split('\\n')
+        .map((line) => line.replace(/\\s+/g, ' ').trim())
+        .filter((line) => line)
+        .join('\\n');
+};
+const raw = {
+    breadcrumbs: text(document.getElementById('wayfinding-breadcrumbs_feature_div')),
+    title: text(document.getElementById('productTitle')),
+    image: null,
+    image_layout: null,
+    price: null,
+    basis_price: null,
+    twister: null,
+    variations: null,
+    overview: null,
+    opinions: null
+};
+
+const layouts = [
+    ['regular', document.querySelector('.regularAltImageViewLayout')],
+    ['alt', document.getElementById('altImages')]
+];
+for (const [layout, container] of layouts) {
+    if (!container) continue;
+    const images = container.getElementsByTagName('img');
+    if (images.length > 1) {
+        raw.image = {
+            src: images[1].getAttribute('src') || '',
+            alt: images[1].getAttribute('alt') || ''
+        };
+    }
+    raw.image_layout = layout;
+    break;
+}
+
+const priceContainer = document.getElementById('corePriceDisplay_desktop_feature_div');
+if (priceContainer) {
+    const whole = priceContainer.querySelector('.a-price-whole');
+    const fraction = priceContainer.querySelector('.a-price-fraction');
+    if (whole && fraction) {
+        // The decimal separator is rendered inside the whole part
+        const wholeText = Array.from(whole.childNodes)
+            .filter((node) => node.nodeType === Node.TEXT_NODE)
+            .map((node) => node.textContent).join('');
+        raw.price = {whole: wholeText.trim(), fraction: text(fraction)};
+    }
+    raw.basis_price = lines(priceContainer.querySelector('.basisPrice'));
+}
+
+const twisterPlus = document.getElementById('twister-plus-inline-twister');
+if (twisterPlus) {
+    raw.twister = [];
+    for (const option of twisterPlus.getElementsByTagName('ul')) {
+        const parts = (option.getAttribute('data-a-button-group') || '').split('"');
+        const type = parts.length > 1 ? parts[parts.length - 2] : '';
+        for (const item of option.getElementsByTagName('li')) {
+            const image = item.querySelector('img');
+            const swatch = item.querySelector('.swatch-title-text-container');
+            raw.twister.push({
+                type: type,
+                asin: item.getAttribute('data-asin'),
+                alt: image ? image.getAttribute('alt') : null,
+                swatch: swatch ? text(swatch) : null
+            });
+        }
+    }
+}
+
+for (const script of document.querySelectorAll('script:not([src])')) {
+    const source = script.textContent;
+    if (!source.includes('dimensionValuesDisplayData')) continue;
+    const values = source.match(/"dimensionValuesDisplayData"\\s*:\\s*(\\{[^{}]*\\})/);
+    const dimensions = source.match(/"dimensions"\\s*:\\s*(\\[[^\\]]*\\])/);
+    if (values && dimensions) {
+        try {
+            raw.variations = {dimensions: JSON.parse(dimensions[1]), values: JSON.parse(values[1])};
+        } catch (e) {}
+    }
+    break;
+}
+
+const featureContainer = document.getElementById('productOverview_feature_div');
+if (featureContainer) {
+    raw.overview = [];
+    for (const row of featureContainer.getElementsByTagName('tr')) {
+        const cells = row.getElementsByTagName('td');
+        if (cells.length > 1) raw.overview.push([text(cells[0]), text(cells[1])]);
+    }
+}
+
+const aditionalInfo = document.getElementById('productDetails_db_sections');
+if (aditionalInfo) {
+    raw.opinions = [];
+    for (const row of aditionalInfo.getElementsByTagName('tr')) {
+        const header = row.querySelector('th');
+        const value = row.querySelector('td');
+        if (header && value) raw.opinions.push([text(header), lines(value)]);
+    }
+}
+return raw;
+"""
+
 
 class AmazonDataScraper(BaseAmazonScraper):
     """Main amazon data scraper class"""
 
-    def __init__(self):
+    # Work queue tasks of the products in flight, {asin: (feed, task id)}. They are shared
+    # by the scrapers of a phase, as a retry can be taken by another scraper.
+    queue_tasks: dict = dict()
+    queue_tasks_lock = threading.Lock()
+
+    def __init__(self, **kwargs):
         """Initialize the scraper with a Selenium WebDriver instance."""
-        super().__init__()
+        super().__init__(**kwargs)
         self.driver = self._create_driver(
             "--disable-notifications",
             "--incognito",
@@ -29,381 +154,340 @@ class AmazonDataScraper(BaseAmazonScraper):
             },
             detach=True
         )
-
-    def main_method(self, products: list) -> list:
-        """Function to scrape data for a list of products."""
+        self.pending_pages = list()
+        self.item_seconds = config["deadlines"]["item"]
+        if config["transport"] == "hybrid":
+            self.http_transport = HttpTransport()
+        # Tabs of the session that load the next products ahead (multi-tab pipelining)
+        self.tabs = TabPool(config["tabs"]) if config["tabs"] > 1 else None
+
+    def main_method(self, products: Iterable) -> list:
+        """Function to scrape data for a list of products (or a work queue feed)."""
         data = list()
-        for product in products:
-            if isinstance(product, str):
-                self._scrap_products_data(
-                    asin=product, data=data)
-            elif isinstance(product, dict):
-                for asin in product.keys():
-                    self._scrap_products_data(
-                        asin=asin, data=data, ranking=product[asin])
-        self._quit_driver()
-        return data
-
-    def _twister_scraper(self, asin: str) -> None:
-        """Function to scrape twister data for a product identified by its ASIN."""
         try:
-            # Extract the twister container
-            twister_plus = self.driver.find_element(
-                By.ID, "twister-plus-inline-twister")
-
-            twister_options = twister_plus.find_elements(By.TAG_NAME, "ul")
-
-            twister_list = []
-            for option in twister_options:
-
-                options_dict = {}
-                option_attribute = option.get_attribute("data-a-button-group")
-                option_name = option_attribute.split('"')[-2]
-
-                options_dict["type"] = option_name
-
-                options_list = option.find_elements(By.TAG_NAME, "li")
-                for option_li in options_list:
-                    option_asin = option_li.get_attribute("data-asin")
-                    if option_asin == asin:
-                        continue
-                    options_dict["asin"] = option_asin
-
-                    if option_name == 'color_name':
-                        color_name = option_li.find_element(
-                            By.TAG_NAME, "img").get_attribute("alt")
-                        options_dict["name"] = color_name.lower().strip()
-                    else:
-                        option_swatch = option_li.find_element(
-                            By.CLASS_NAME, 'swatch-title-text-container').text.lower().strip()
-                        options_dict["name"] = option_swatch
-
-                    twister_list.append({**options_dict})
-
-            log = f'[{asin}] {self.colors["green"]}Twister.{self.colors["reset"]}\n'
-            if len(twister_list):
-                return (twister_list, log)
-            else:
-                raise NoSuchElementException(f'No Twister for {asin}.')
-        except NoSuchElementException:
-            return f'[{asin}] {self.colors["red"]}No Twister.{self.colors["reset"]}\n'
-        except Exception as e:
-            print(
-                f"{self.colors["red"]}[ERROR] Twisters: {e} {self.colors["reset"]}")
-
-    def _scrap_products_data(self, asin: str, data: list, **kwargs: int) -> None:
-        """Function to scrape data for a single product identified by its ASIN."""
-        forbidden_images = ['HomeCustomProduct', 'play-icon-overla']
-        logs = ''
-
-        # Define allowed breadcrumbs to identify celphones
-        allowed_breadcrums = [
-            'banda ancha móvil',
-            'celulares y smartphones de prepago',
-            'celulares y smartphones desbloqueados'
-        ]
-
-        # Define the link to the product page
-        link = f"{self.amazon_url}/dp/{asin}"
+            for asin, ranking, task_id, upcoming in self._iter_ahead(products):
+                # Stop taking new products when the phase is over
+                # (the tasks of a work queue feed go back to the queue)
+                if self.deadline.expired():
+                    print(
+                        f"{self.colors['yellow']}Phase deadline reached, no more products are taken.{self.colors['reset']}")
+                    break
+                self._maybe_recycle()
+                # Take a retry whose delay is over before the next new product
+                if self.retry_queue is not None:
+                    retry = self.retry_queue.pop_ready()
+                    if retry is not None:
+                        self._scrap_item(retry[0], data, retry[1])
+                if self.tabs is not None:
+                    self._prefetch_tabs([asin, *upcoming])
+                if task_id is not None:
+                    self._track_task(asin, products, task_id)
+                self._scrap_item(asin, data, ranking)
+                if self.result_sink is not None:
+                    self._collect_pages(data, wait=False)
+                    self._flush_results(data)
+
+            self._collect_pages(data)
+            self._process_retries(data)
+            self._flush_results(data)
+        finally:
+            # The tasks read ahead or not resolved go back to the queue
+            if isinstance(products, QueueFeed):
+                self._release_tasks(products)
 
-        # Initialize the product dictionary with default values
-        product = {
-            "asin": asin,
-            "price": 0,
-            "url": link,
-            "brand": "",
-            "image": "",
-            "ranking": kwargs.get("ranking", 0),
-
-        }
-        self.driver.get(link)
-
-        # Handle potential pop-ups and login forms
-        try:
-            # Wait for the continue button to appear and click it
-            continue_button = WebDriverWait(self.driver, randint(1, 4)).until(EC.visibility_of_element_located((
-                By.CLASS_NAME, "a-button-text")))
-            sleep(randint(1, 3))  # Sleep to avoid overwhelming the server
-            continue_button.click()
-            logs += f'[{asin}] {self.colors["green"]}Continue button.{self.colors["reset"]}\n'
-        except:
-            logs += f'[{asin}] {self.colors["red"]}No continue button.{self.colors["reset"]}\n'
+        self._quit_driver()
+        # Without a result sink the products reach it with the returned list
+        for product in data:
+            self._resolve_task(product.get("asin"), done=True)
+        return data
 
+    def _track_task(self, asin: str, feed: QueueFeed, task_id) -> None:
+        """Keep the task of a product until the product reaches the sink or fails."""
+        with self.queue_tasks_lock:
+            self.queue_tasks[asin] = (feed, task_id)
+
+    def _resolve_task(self, asin: str | None, done: bool) -> None:
+        """Acknowledge the task of a product that reached the sink,
+        or give it back to the queue when the product failed."""
+        with self.queue_tasks_lock:
+            task = self.queue_tasks.pop(asin, None)
+        if task is None:
+            return
+        feed, task_id = task
+        if done:
+            feed.ack(task_id)
+        else:
+            feed.fail(task_id)
+
+    def _release_tasks(self, feed: QueueFeed) -> None:
+        """Give back the tasks of the feed that were not resolved."""
+        with self.queue_tasks_lock:
+            for asin in [asin for asin, task in self.queue_tasks.items() if task[0] is feed]:
+                del self.queue_tasks[asin]
+        feed.release()
+
+    def _flush_results(self, data: list) -> None:
+        """Hand the scraped products to the result sink, so they are not kept in memory."""
+        if self.result_sink is None or not data:
+            return
+        self.result_sink(data[:])
+        for product in data:
+            self._resolve_task(product.get("asin"), done=True)
+        data.clear()
+
+    @staticmethod
+    def _iter_items(products: Iterable) -> Iterator[tuple]:
+        """Yield (asin, ranking) for the ASINs and {asin: ranking} items, as they are consumed."""
+        for product in products:
+            if isinstance(product, str):
+                yield product, 0
+            elif isinstance(product, dict):
+                yield from product.items()
+
+    def _iter_ahead(self, products: Iterable) -> Iterator[tuple]:
+        """Yield (asin, ranking, task id, upcoming) with the ASINs of the next items,
+        which are loaded ahead in the other tabs of the session. The tasks of a work queue
+        feed are read without acknowledging them (the task id is None for a list)."""
+        if isinstance(products, QueueFeed):
+            items = (
+                (asin, ranking, task_id)
+                for task_id, payload in products.tasks()
+                for asin, ranking in self._iter_items([payload]))
+        else:
+            items = ((asin, ranking, None) for asin, ranking in self._iter_items(products))
+        ahead = deque(islice(items, self.tabs.size if self.tabs is not None else 1))
+        while ahead:
+            asin, ranking, task_id = ahead.popleft()
+            yield asin, ranking, task_id, [item[0] for item in ahead]
+            ahead.extend(islice(items, 1))
+
+    def _prefetch_tabs(self, asins: list) -> None:
+        """Start loading the product pages in the free tabs of the session."""
+        # The pages read over HTTP are not loaded in the browser
+        if self.http_transport is not None and self.http_transport.ready:
+            return
         try:
-            # Wait for the login form to appear
-            WebDriverWait(self.driver, randint(1, 4)).until(EC.visibility_of_element_located((
-                By.CLASS_NAME, "auth-workflow")))
-            sleep(randint(1, 3))  # Sleep to avoid overwhelming the server
-            logs += f'[{asin}] {self.colors["green"]}Login form.{self.colors["reset"]}\n'
-            self.driver.get(link)
-        except TimeoutException:
-            logs += f'[{asin}] {self.colors["red"]}No login form.{self.colors["reset"]}\n'
+            self.tabs.bind(self.driver)
+            self.tabs.retain(asins)
+            for asin in asins:
+                if not self.tabs.prefetch(self.driver, asin, f"{self.amazon_url}/dp/{asin}"):
+                    break
         except Exception as e:
+            # A dead session is recreated by the item
             print(
-                f"{self.colors["red"]}[ERROR] Auth: {e}{self.colors["reset"]}")
-        
-        sleep(4)  # Sleep to avoid overwhelming the server
+                f"{self.colors['red']}[ERROR] Prefetching tabs: {str(e).splitlines()[0] if str(e) else e}{self.colors['reset']}")
 
-        # Check if the product belongs to the celphone category
+    def _scrap_item(self, asin: str, data: list, ranking: int = 0) -> None:
+        """Scrape a product and send it to the retry queue if it fails with a transient error."""
+        scraped = len(data)
+        self.item_deadline = Deadline(self.item_seconds, parent=self.deadline)
+        self._task_started()
         try:
-            # Wait for the breadcrumbs to appear
-            # and check if they contain the allowed breadcrumbs
-            breadcrumbs = WebDriverWait(self.driver, 10).until(EC.visibility_of_element_located((
-                By.ID, "wayfinding-breadcrumbs_feature_div")))
-
-            if any(breadcrumb in breadcrumbs.text.lower() for breadcrumb in allowed_breadcrums):
-                logs += f'[{asin}] {self.colors["green"]}Celphone.{self.colors["reset"]}\n'
-            else:
-                raise Exception('The item is not a celphone.')
-        except TimeoutException:
-            logs += f'[{asin}] {self.colors["green"]}No breadcrumbs.{self.colors["reset"]}\n'
-        except Exception:
-            logs += f'[{asin}] {self.colors["red"]}Not a celphone.{self.colors["reset"]}\n'
-            print(logs)
-            del logs
-            del product
+            with self._span(asin, "item"):
+                result = self._with_session_retry(
+                    self._scrap_products_data, asin=asin, data=data, ranking=ranking)
+        except TransientScrapingError as e:
+            print(e)
+            self._task_finished(
+                "retried" if self._retry_later(asin, ranking, e) else "failed")
+            return
+        finally:
+            self.item_deadline = self.deadline
+        self._task_finished("failed" if result is None else "done")
+        if result is None:
+            self._resolve_task(asin, done=False)
             return
 
-        # Scrape product details
-        # Product title
-        try:
-            product_title = WebDriverWait(self.driver, 1).until(
-                EC.presence_of_element_located((By.ID, "productTitle")))
-            if product_title.text == '':
-                raise NoSuchElementException('No title found.')
-            product["title"] = product_title.text.replace("\n", "").replace("''", "\"").strip()  # Store the product title
-            logs += f'[{asin}] {self.colors["green"]}Product title.{self.colors["reset"]}\n'
-
-        except TimeoutException:
-            logs += f'[{asin}] {self.colors["red"]}No load.{self.colors["reset"]}\n'
-            print(logs)
-            del logs
-            del product
+        # The parser pool reports the result when the page is collected
+        if self.parser_pool:
             return
-        except NoSuchElementException:
-            logs += f'[{asin}] {self.colors["red"]}Not a celphone.{self.colors["reset"]}\n'
-            print(logs)
-            del logs
-            del product
+        if len(data) == scraped:
+            self._resolve_task(asin, done=False)
+        if self.retry_queue is None:
             return
-        except Exception as e:
-            logs += f'[{asin}] {self.colors["red"]}Not a celphone.{self.colors["reset"]}\n'
-            print(logs)
-            del logs
-            del product
+        if len(data) > scraped:
+            self.retry_queue.succeeded(asin)
+        else:
+            self.retry_queue.failed_permanently(asin)
+
+    def _retry_later(self, asin: str, ranking: int, error: Exception) -> bool:
+        """Queue the product again. It returns False if it is not retried."""
+        queued = False
+        if self.retry_queue is not None:
+            reason = str(error).strip().splitlines()[-1] if str(error).strip() else type(error).__name__
+            queued = self.retry_queue.push(asin, ranking, reason)
+        # A product that is not retried gives its task back to the work queue
+        if not queued:
+            self._resolve_task(asin, done=False)
+        return queued
+
+    def _record_variants(self, product: dict) -> None:
+        """Add the twister of the product to the variant graph of the run,
+        or complete it from the siblings already scraped."""
+        if self.variant_graph is None:
             return
-
-        # Product images
-        try:
-            images_container = self.driver.find_element(
-                By.CLASS_NAME, 'regularAltImageViewLayout')
-            
-
-            # Image URLs
-            images = images_container.find_elements(By.TAG_NAME, "img")
-            alt = images[1].get_attribute("alt").strip()
-            if alt == '':
-                if len(product["title"]) > 100:
-                    alt_image =product['title'][:100].strip()
-                    splited_alt = alt_image.split(' ')
-                    final_alt = " ".join(splited_alt[:-1]).lower().strip() + ' image'
-                    product["alt"] = final_alt
-                else:
-                    product["alt"] = f"{product['title'].strip()}_image"
-            image_link = images[1].get_attribute("src")
-            if not any(forbidden_image in image_link for forbidden_image in forbidden_images):
-                image_split = image_link.split('_')
-                image_split[-2] = f"{image_split[-2][:2]}679"
-                image_link = '_'.join(image_split)
-                product["image"] = image_link
-
-            logs += f'[{asin}] {self.colors["green"]}Images.{self.colors["reset"]}\n'
-        except NoSuchElementException:
-            images_container = self.driver.find_element(
-                By.ID, 'altImages')
-
-            # Image URLs
-            images = images_container.find_elements(By.TAG_NAME, "img")
-            alt_images = images[1].get_attribute("alt").split(' ')
-            if alt_images == '':
-                if len(product["title"]) > 100:
-                    alt_image = product['title'][:100].strip()
-                    splited_alt = alt_image.split(' ')
-                    final_alt = " ".join(splited_alt[:-1]).lower().strip() + ' image'
-                    product["alt"] = final_alt
+        if product.get("twister"):
+            self.variant_graph.add(product["asin"], product["twister"])
+            return
+        twister = self.variant_graph.twister_of(product["asin"])
+        if twister:
+            product["twister"] = twister
+
+    def _collect_pages(self, data: list, wait: bool = True) -> None:
+        """Collect the pages sent to the parser pool. Without `wait`, only the parsed ones."""
+        pending = list()
+        for asin, ranking, future in self.pending_pages:
+            if not wait and not future.done():
+                pending.append((asin, ranking, future))
+                continue
+            try:
+                with self._span(asin, "parse_wait"):
+                    parsed_product, logs = future.result()
+            except TransientScrapingError as e:
+                print(e)
+                self._retry_later(asin, ranking, e)
+                continue
+            except Exception as e:
+                print(
+                    f"{self.colors["red"]}[ERROR] Parser: {e}{self.colors["reset"]}")
+                self._resolve_task(asin, done=False)
+                continue
+            print(logs)
+            if parsed_product:
+                self._record_variants(parsed_product)
+                data.append(parsed_product)
+            else:
+                self._resolve_task(asin, done=False)
+            if self.retry_queue is not None:
+                if parsed_product:
+                    self.retry_queue.succeeded(asin)
                 else:
-                    product["alt"] = f"{product['title'].strip()}_image"
-            image_link = images[1].get_attribute("src")
-            if not any(forbidden_image in image_link for forbidden_image in forbidden_images):
-                image_split = image_link.split('_')
-                image_split[-2] = f"{image_split[-2][:2]}679"
-                image_link = '_'.join(image_split)
-                product["image"] = image_link
-
-            logs += f'[{asin}] {self.colors["red"]}No images.{self.colors["reset"]}\n'
-        except Exception as e:
-            print(
-                f"{self.colors["red"]} [ERROR] Images: {e} {self.colors["reset"]}")
+                    self.retry_queue.failed_permanently(asin)
+        self.pending_pages = pending
 
-        # Product price
-        try:
-            price_container = self.driver.find_element(
-                By.ID, 'corePriceDisplay_desktop_feature_div')
-            product_price = price_container.find_element(
-                By.CLASS_NAME, "a-price-whole")
-            product_price_fraction = price_container.find_element(
-                By.CLASS_NAME, "a-price-fraction")
-
-            # Combine whole and fractional parts to form the complete price
-            final_price = float(
-                f"{product_price.text.replace(',', '')}.{product_price_fraction.text.replace('.', '')}")
-
-            product["price"] = final_price
-
-            logs += f'[{asin}] {self.colors["green"]}Price.{self.colors["reset"]}\n'
-        except NoSuchElementException:
-            logs += f'[{asin}] {self.colors["red"]}No price.{self.colors["reset"]}\n'
-        except Exception as e:
-            logs += f'[{asin}] {self.colors["red"]}No price.{self.colors["reset"]}\n'
-            print(logs)
-            del logs
-            del product
+    def _process_retries(self, data: list) -> None:
+        """Scrape the queued retries until the queue is empty.
+        The queue is shared, so this scraper also takes the retries of the others."""
+        if self.retry_queue is None:
             return
+        while not self.deadline.expired():
+            self._maybe_recycle()
+            retry = self.retry_queue.pop_ready()
+            if retry is not None:
+                self._scrap_item(retry[0], data, retry[1])
+                self._flush_results(data)
+                continue
+            # The parsed pages may add new retries
+            if self.pending_pages:
+                self._collect_pages(data)
+                self._flush_results(data)
+                continue
+            delay = self.retry_queue.next_delay()
+            if delay is None:
+                return
+            sleep(self.deadline.cap(min(delay, 5)))
+        # The pages already sent to the parser pool are still collected
+        self._collect_pages(data)
+
+    def _scrap_products_data(self, asin: str, data: list, **kwargs: int) -> bool:
+        """Function to scrape data for a single product identified by its ASIN.
+        It raises TransientScrapingError when the page could not be read."""
+        logs = ''
 
-        # Basis price and saving percentage
-        
-        try:
-            basis_price = self.driver.find_element(
-                By.ID, "corePriceDisplay_desktop_feature_div")
-            basis_price_text = basis_price.find_element(
-                By.CLASS_NAME, "basisPrice").text
-            # Store the basis price if available
-            basis_price_filtered = basis_price_text.split('\n')
-            product["basis_price"] = float(
-                basis_price_filtered[-1].replace('$', '').replace(',', ''))
-
-            logs += f'[{asin}] {self.colors["green"]}Basis price.{self.colors["reset"]}\n'
-        except NoSuchElementException:
-            logs += f'[{asin}] {self.colors["red"]}No basis price.{self.colors["reset"]}\n'
-        except Exception as e:
-            print(
-                f"{self.colors["red"]} [ERROR] Basis price: {e} {self.colors["reset"]}")
-
-        # Product twister ASIN
-        twister = self._twister_scraper(asin=asin)
-        if isinstance(twister, tuple):
-            twister_list, log = twister
-            product["twister"] = twister_list
-            logs += log
+        # Define the link to the product page
+        link = f"{self.amazon_url}/dp/{asin}"
+        ranking = kwargs.get("ranking", 0)
+
+        # Fetch the page over HTTP with the session of the browser (a blocked page goes to the browser)
+        if self.http_transport is not None and self.http_transport.ready:
+            with self._span(asin, "http"):
+                state, html = self.http_transport.fetch(
+                    link, timeout=self.item_deadline.cap(self.http_transport.timeout))
+            if state == PAGE_NORMAL:
+                return self._read_html(asin, link, html, data, ranking)
+
+        # The page may be loading in a tab of the session already
+        if self.tabs is not None and self.tabs.take(self.driver, asin):
+            self._await_page(link, kind="product", key=asin)
         else:
-            logs += twister
-        # Product overview
+            self._load_page(link, kind="product", key=asin)
+
+        # Handle potential pop-ups and login forms
+        state = self._asin_captchats(url=link)
+        if state in (PAGE_INTERSTITIAL, PAGE_AUTH, PAGE_THROTTLE):
+            raise TransientScrapingError(
+                f'[{asin}] {self.colors["red"]}Blocked page: {state}.{self.colors["reset"]}')
+        # The session is in a normal state, the next pages can go over HTTP
+        self._adopt_http_session()
+
+        self._sleep(4)  # Sleep to avoid overwhelming the server
+
+        # Wait for the product title so the page is complete before reading it
         try:
-            # Extract the product overview feature container
-            feature_container = self.driver.find_element(
-                By.ID, "productOverview_feature_div")
-            # Extract features from the PoExpander
+            with self._span("title", "wait"):
+                self._wait(10).until(EC.presence_of_element_located((
+                    By.ID, "productTitle")))
+        except TimeoutException:
+            pass
 
-            try:
-                feature_container.find_element(By.TAG_NAME, "a")
-                feature_container.click()  # Click to expand the features
-            except NoSuchElementException:
-                pass
-            except Exception as e:
-                print(
-                    f"{self.colors["red"]} [ERROR] PoExpander: {e} {self.colors["reset"]}")
-
-            # Extract the table containing product features
-            features_table = feature_container.find_elements(By.TAG_NAME, "tr")
-
-            # Find the espefied product features
-            specified_features = {
-                "marca": "brand",
-                "nombre del modelo": "model",
-                "color": "color"
-            }
-            # Iterate through the features and extract the specified ones
-            for feature_element in features_table:
-                feature_list = feature_element.find_elements(By.TAG_NAME, "td")
-                feature_name = feature_list[0].text.lower().strip()
-                feature = feature_list[1].text.lower().strip()
-                # Check if the feature name matches any of the specified features
-                for specified_feature in specified_features.keys():
-                    if specified_feature == feature_name:
-                        if specified_feature == "marca":
-                            if not any(default_brand in feature for default_brand in self.default_brands):
-                                raise Exception("Not a specified brand.")
-                            feature = feature.split(" ")[0]
-                        product[specified_features[specified_feature]] = feature
-
-            product_title_lower = product_title.text.lower()
-            if product["brand"] == "":
-                if "iphone" in product_title_lower:
-                    product["brand"] = "apple"
-                elif "poco" in product_title_lower:
-                    product["brand"] = "xiaomi"
-                else:
-                    for default_brand in self.default_brands:
-                        if default_brand in product_title_lower:
-                            product["brand"] = default_brand
-                            break
-
-            if product["brand"] == "":
-                print("Aún sin marca")
-                raise Exception("Not a specified brand.")
-
-            logs += f'[{asin}] {self.colors["green"]}Product overview.{self.colors["reset"]}\n'
-
-        except NoSuchElementException:
-            product_title_lower = product_title.text.lower()
-            if product["brand"] == "":
-                if "iphone" in product_title_lower:
-                    product["brand"] = "apple"
-                elif "poco" in product_title_lower:
-                    product["brand"] = "xiaomi"
-                else:
-                    for default_brand in self.default_brands:
-                        if default_brand in product_title_lower:
-                            product["brand"] = default_brand
-                            break
-            if product["brand"] == "":
-                print("Aún sin marca")
-                raise Exception("Not a specified brand.")
-
-            logs += f'[{asin}] {self.colors["red"]}No product overview.{self.colors["reset"]}\n'
-        except Exception as e:
-            logs += f'[{asin}] {self.colors["red"]}Not a specified brand.{self.colors["reset"]}\n'
-            print(logs)
-            del logs
-            del product
-            return
+        # Hand the raw page to the parser pool and move on to the next product
+        if self.parser_pool:
+            return self._read_html(asin, link, self.driver.page_source.encode(), data, ranking)
+
+        self._archive_page("product", asin, link)
 
-        # Product opinions
+        # Read every field of the page in a single call
         try:
-            # Extract the product details section
-            aditional_info = self.driver.find_element(
-                By.ID, "productDetails_db_sections")
-            aditional_info_table = aditional_info.find_elements(
-                By.TAG_NAME, "tr")
-            # Initialize the ranking variable
-            customers_opinion = 'opinión media de los clientes'
-
-            # Iterate through the additional info table to find the specified ranking
-            for info in aditional_info_table:
-                header = info.find_element(By.TAG_NAME, "th").text.lower()
-                if header == customers_opinion:
-                    customers_opinion = info.find_element(
-                        By.TAG_NAME, "td").text.lower().split('\n')[-1].split(' ')[0]
-                    product["customers_opinion"] = float(customers_opinion)
-
-            logs += f'[{asin}] {self.colors["green"]}Opinion.{self.colors["reset"]}\n'
-        except NoSuchElementException:
-            logs += f'[{asin}] {self.colors["red"]}No opinion.{self.colors["reset"]}\n'
+            raw = self.driver.execute_script(PRODUCT_EXTRACTION_SCRIPT)
         except Exception as e:
-            print(
-                f"{self.colors["red"]} [ERROR] Opinions: {e} {self.colors["reset"]}")
+            if self._is_session_error(e):
+                raise
+            logs += f'[{asin}] {self.colors["red"]}[ERROR] Extraction: {e}{self.colors["reset"]}\n'
+            raise TransientScrapingError(logs)
+
+        with self._span("build_product", "parse"):
+            product, product_logs = build_product(
+                raw,
+                asin=asin,
+                url=link,
+                default_brands=self.default_brands,
+                ranking=ranking
+            )
+        logs += product_logs
 
         # Print the logs for debugging
         print(logs)
         del logs
-        data.append(product)  # Append the product data to the list
+        if product:
+            self._record_variants(product)
+            data.append(product)  # Append the product data to the list
+        return True
+
+    def _read_html(self, asin: str, link: str, html: bytes, data: list, ranking: int) -> bool:
+        """Read the product from the HTML of its page: in the parser pool if there is one,
+        or here (a page fetched over HTTP without the pool)."""
+        self._archive_page("product", asin, link, html=html)
+        if self.parser_pool:
+            self.pending_pages.append((asin, ranking, self.parser_pool.submit_product(
+                html,
+                asin=asin,
+                url=link,
+                default_brands=self.default_brands,
+                ranking=ranking
+            )))
+            return True
+
+        with self._span("parse_product_page", "parse"):
+            product, logs = parse_product_page(
+                html,
+                asin=asin,
+                url=link,
+                default_brands=self.default_brands,
+                ranking=ranking
+            )
+        print(logs)
+        if product:
+            self._record_variants(product)
+            data.append(product)
+        return True
+
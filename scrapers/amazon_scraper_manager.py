@@ -5,20 +5,42 @@ It initializes the scrapers, processes the product data, and saves the results t
 """
 
 import os
+import socket
 import requests
 import threading
 import json
 
 from getpass import getpass
-from time import sleep
-from collections.abc import Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import sleep, time
+from datetime import datetime, timezone
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Type, TypeVar
 from requests.exceptions import JSONDecodeError
 
 from config import config
-from custom_exceptions import InvalidCredentials
+from custom_exceptions import InvalidCredentials, ScraperNotCreated, TokenExpiredError
+from utils import (
+    AsinMirror,
+    Deadline,
+    PageArchive,
+    ProgressTracker,
+    RunProfiler,
+    SessionStore,
+    QueueFeed,
+    RefreshScheduler,
+    ResultAggregator,
+    ResultSpool,
+    RetryQueue,
+    TokenManager,
+    VariantGraph,
+    WorkQueue,
+    open_work_queue
+)
 from .base_amazon_scraper import BaseAmazonScraper
+from .html_parser import HtmlParserPool
+from .archive_replay import ArchiveReplayer
+from .concurrency_benchmark import ConcurrencyBenchmark
 
 T = TypeVar("T", bound="BaseAmazonScraper")
 
@@ -30,10 +52,11 @@ class AmazonScraperManager():
         """Initialize the AmazonScraperManager with configuration settings."""
         self.colors: dict = config["colors"]
         self.ip: str = config["ip"]
-        self.threads: int = os.cpu_count()
-        self.token: str = str()
-        self.refresh_token: str = str()
-        self.header: dict = dict()
+        self.threads: int = config["concurrency"] or os.cpu_count()
+        self.interactive: bool = True
+        self.credentials: dict = dict()
+        self.tokens: TokenManager = TokenManager(
+            login_callback=self._login_again)
         self.brands: list = config["brands"]
         self.asins_to_search: dict = dict()
         self.products: list = list()
@@ -41,14 +64,57 @@ class AmazonScraperManager():
         self.amazon_data_scraper: Type[T] = asin_scraper
         self.top_scraper: Type[T] = top_scraper
         self.top_100_asins: dict = dict()
+        self.variant_graph: VariantGraph = VariantGraph()
+        self.asin_mirror: AsinMirror = AsinMirror(config["asin_mirror"]["path"])
+        self.asins_page_size: int = config["asin_mirror"]["page_size"]
+        self.asins_reconcile_hours: float = config["asin_mirror"]["reconcile_hours"]
+        self.refresh_scheduler: RefreshScheduler = RefreshScheduler(
+            self.asin_mirror)
+        self.parser_workers: int = config["parser_workers"]
+        self.parser_pool: HtmlParserPool | None = None
+        self.archive_path: str | None = config["archive"]["path"]
+        self.page_archive: PageArchive | None = None
+        self.upload_batch_size: int = config["spool"]["batch_size"]
+        self.work_queue: WorkQueue | None = open_work_queue(
+            config["work_queue"]["url"]) if config["work_queue"]["url"] else None
+        self.worker_id: str = f"{socket.gethostname()}-{os.getpid()}"
+        self.prewarm: bool = config["prewarm"]
+        self.prewarmed: dict = dict()
+        self.prewarm_lock = threading.Lock()
+        self.prewarm_executor: ThreadPoolExecutor | None = None
+        self.deadlines: dict = config["deadlines"]
+        self.run_deadline: Deadline = Deadline()
+        self.work_deadline: Deadline = Deadline()
+        self.progress: ProgressTracker = ProgressTracker()
+        self.profiler: RunProfiler = RunProfiler()
+        self.session_store: SessionStore | None = SessionStore(
+            config["session_store"]["path"]) if config["session_store"]["path"] else None
+
+    @property
+    def token(self) -> str:
+        return self.tokens.token
+
+    @property
+    def refresh_token(self) -> str:
+        return self.tokens.refresh_token
+
+    @property
+    def header(self) -> dict:
+        """Authorization header, refreshed shortly before the token expires."""
+        return self.tokens.get_header()
 
     def _api_request(
         self, func: Callable[..., requests.Response],
             endpoint: str,
             **options: dict) -> dict:
-        """Make a request to the API. Handle token expiration and re-authentication."""
+        """Make a request to the API. Handle token expiration and re-authentication.
+        A rejected token is refreshed once per request, then TokenExpiredError is raised."""
+        refreshed = False
         while True:
             options["url"] = f"{self.ip}{endpoint}"
+            if "headers" in options:
+                options["headers"] = self.header
+            used_token = self.tokens.token
             response = func(**options)
 
             try:
@@ -58,7 +124,7 @@ class AmazonScraperManager():
                     f"{self.colors['red']}Error decoding JSON response: {response.text}{self.colors['reset']}")
                 return {}
 
-            if not response_json.get("error"):
+            if not isinstance(response_json, dict) or not response_json.get("error"):
                 return response_json
 
             messages = [
@@ -66,25 +132,43 @@ class AmazonScraperManager():
                 "The token has expired",
                 "Token not provided"
             ]
-            if response_json["message"] in messages:
-                if self.refresh_token:
-                    self.token = self.refresh_token
-                    self.refresh_token = str()
-                    self.header["Authorization"] = f"Bearer {self.token}"
-                else:
-                    self.token = str()
-                    while not self.token:
-                        print("Login required:")
-                        email = input("Email: ")
-                        password = getpass("Password: ")
-                        try:
-                            self.login(email, password)
+            if response_json.get("message") not in messages or endpoint == "/api/login":
+                return response_json
 
-                        except InvalidCredentials as e:
-                            print(
-                                f"{config["colors"]["red"]}{str(e)}{config["colors"]["reset"]}")
-                        sleep(3)
-                options["headers"] = self.header
+            if refreshed:
+                raise TokenExpiredError(
+                    f"The API rejected the refreshed token: {response_json.get('message')}")
+
+            # Refresh the token (or log in again) and repeat the request
+            self.tokens.invalidate(used_token)
+            refreshed = True
+
+    def _login_again(self) -> None:
+        """Log in again when both tokens are no longer valid."""
+        if not self.interactive:
+            # Unattended runs log in with the stored credentials
+            # and fail instead of waiting for a prompt
+            if not self.credentials.get("email"):
+                raise TokenExpiredError(
+                    "The token has expired and there are no credentials to log in again.")
+            try:
+                self.login(
+                    self.credentials["email"], self.credentials["password"])
+            except InvalidCredentials as e:
+                raise TokenExpiredError(f"Login failed: {str(e)}") from e
+            return
+
+        while not self.token:
+            print("Login required:")
+            email = input("Email: ")
+            password = getpass("Password: ")
+            try:
+                self.login(email, password)
+
+            except InvalidCredentials as e:
+                print(
+                    f"{config["colors"]["red"]}{str(e)}{config["colors"]["reset"]}")
+            sleep(3)
 
     def login(self, email: str, password: str) -> str:
         """Log in to the API and retrieve an access token."""
@@ -99,14 +183,57 @@ class AmazonScraperManager():
         )
 
         if not login_response.get("access_token"):
-            if login_response["status"] == "Unauthorized":
+            if login_response.get("status") == "Unauthorized":
                 raise InvalidCredentials(f"{login_response["status"]}")
         else:
-            self.token = login_response["access_token"]
-            self.refresh_token = login_response["refresh_token"]
-            self.header["Authorization"] = f"Bearer {self.token}"
+            self.tokens.set_tokens(
+                login_response["access_token"],
+                login_response["refresh_token"]
+            )
             print(f"{self.colors["green"]}Login success{self.colors["reset"]}")
 
+    def _get_parser_pool(self) -> HtmlParserPool | None:
+        """Return the HTML parser pool, starting it on first use if it is enabled."""
+        if self.parser_workers and self.parser_pool is None:
+            self.parser_pool = HtmlParserPool(workers=self.parser_workers)
+        return self.parser_pool
+
+    def _get_page_archive(self) -> PageArchive | None:
+        """Return the raw page archive, opening it on first use if it is enabled."""
+        if self.archive_path and self.page_archive is None:
+            self.page_archive = PageArchive(self.archive_path)
+        return self.page_archive
+
+    def _scraper_kwargs(self) -> dict:
+        """Shared resources passed to every scraper instance."""
+        return {
+            "parser_pool": self._get_parser_pool(),
+            "page_archive": self._get_page_archive(),
+            "variant_graph": self.variant_graph,
+            "progress": self.progress,
+            "profiler": self.profiler,
+            "session_store": self.session_store
+        }
+
+    def shutdown(self) -> None:
+        """Release the resources shared between runs."""
+        if self.parser_pool is not None:
+            self.parser_pool.close()
+            self.parser_pool = None
+        if self.page_archive is not None:
+            self.page_archive.close()
+            self.page_archive = None
+        self._discard_prewarmed()
+        if self.prewarm_executor is not None:
+            self.prewarm_executor.shutdown(wait=True)
+            self.prewarm_executor = None
+        if self.work_queue is not None:
+            self.work_queue.close()
+            self.work_queue = None
+        self.progress.close()
+        self.profiler.end_run()
+        self.asin_mirror.close()
+
     def _get_brands(self) -> list:
         """Get the list of brands."""
         brands = [
@@ -156,31 +283,102 @@ class AmazonScraperManager():
         self.brands = config["brands"] = new_brands
         print(
             f"{self.colors['purple']}Brands have been updated.{self.colors['reset']}")
-        sleep(2)
+        self._pause(2)
+
+    def _pause(self, seconds: int) -> None:
+        """Give the user time to read the output. Skipped in unattended runs."""
+        if self.interactive:
+            sleep(seconds)
+
+    def set_login_credentials(self, email: str, password: str) -> None:
+        """Store the credentials used to log in again in unattended runs."""
+        self.credentials = {
+            "email": email,
+            "password": password
+        }
 
     def set_credentials(self, token: str, refresh_token: str):
-        self.token = token
-        self.refresh_token = refresh_token
-        self.header["Authorization"] = f"Bearer {self.token}"
+        self.tokens.set_tokens(token, refresh_token)
+
+    def _sync_asins(self) -> None:
+        """Refresh the local ASIN mirror with the changes since the last sync. A full sync
+        runs on the first sync and every `reconcile_hours`, to remove the deleted ASINs."""
+        since = self.asin_mirror.last_sync
+        started = time()
+        last_full_sync = self.asin_mirror.last_full_sync
+        if last_full_sync is None or started - last_full_sync >= self.asins_reconcile_hours * 3600:
+            since = None
+        seen = set()
+        added = 0
+        page = 1
+        while True:
+            params = {
+                "page": page,
+                "limit": self.asins_page_size
+            }
+            if since is not None:
+                params["since"] = datetime.fromtimestamp(
+                    since, tz=timezone.utc).isoformat()
+            asins_response = self._api_request(
+                func=requests.get,
+                endpoint="/api/products/amazon/id",
+                headers=self.header,
+                params=params
+            )
+            if "asins" not in asins_response:
+                print(
+                    f"{self.colors['red']}ASINs sync failed, using the local mirror.{self.colors['reset']}")
+                return
+            if since is not None and "deleted" not in asins_response:
+                # The deleted ASINs can only be found by a full sync
+                since = None
+                seen.clear()
+                added = 0
+                page = 1
+                continue
+
+            # Stop when a page brings nothing new (the API may ignore the pagination)
+            new_asins = [
+                asin for asin in asins_response["asins"] if asin not in seen]
+            seen.update(new_asins)
+            added += self.asin_mirror.upsert(new_asins)
+            if asins_response.get("deleted"):
+                self.asin_mirror.deactivate(asins_response["deleted"])
+
+            # Without pagination metadata the API returned the whole list
+            if "total" in asins_response:
+                has_next_page = page * self.asins_page_size < asins_response["total"]
+            else:
+                has_next_page = bool(asins_response.get("next_page"))
+            if not new_asins or not has_next_page:
+                break
+            page += 1
+
+        if since is None:
+            removed = self.asin_mirror.deactivate_missing(seen)
+            print(
+                f"{self.colors['purple']}ASINs full sync: {len(seen)} tracked, {removed} removed.{self.colors['reset']}")
+            self.asin_mirror.set_last_full_sync(started)
+        else:
+            print(
+                f"{self.colors['purple']}ASINs delta sync: {added} new.{self.colors['reset']}")
+        self.asin_mirror.set_last_sync(started)
 
     def get_asins(self) -> None:
-        """Get the list of ASINs."""
+        """Get the list of ASINs due for a refresh, by tier and staleness."""
         print(
             f"{self.colors['purple']}Loading ASINs to update...{self.colors['reset']}")
 
-        asins_response = self._api_request(
-            func=requests.get,
-            endpoint="/api/products/amazon/id",
-            headers=self.header
-        )
+        self._sync_asins()
+        asins = self.refresh_scheduler.due_asins()
 
-        if asins_response.get("asins"):
-            self.asins_to_search["to_update"] = asins_response["asins"]
+        if asins:
+            self.asins_to_search["to_update"] = asins
             print(
                 f"{self.colors['purple']}ASINs to update found: {len(self.asins_to_search['to_update'])}.{self.colors['reset']}")
             print(
                 f"{self.colors['purple']}ASINs to update loaded.{self.colors['reset']}")
-            sleep(2)
+            self._pause(2)
             return
 
         self.asins_to_search.clear()
@@ -190,85 +388,121 @@ class AmazonScraperManager():
         self.asins_to_search.clear()
         print(
             f"{self.colors['purple']}ASINs list cleared.{self.colors['reset']}")
-        sleep(2)
+        self._pause(2)
 
     def _scraper_process(
             self, list_to_split: list,
             scraper_class: Type[T],
             data: list | dict,
-            **kwargs: list) -> list | dict:
-        """Function to process the ASINs using multiple threads.
-        It initializes the AmazonAsinScraper for each thread and scrapes the ASINs"""
-
-        scrapers_list = list()
-
-        # Check if the products list is empty
-        items = len(list_to_split) // self.threads
-        difference_count = len(list_to_split) % self.threads
-        if items == 0:
-            workers = len(list_to_split)
+            **kwargs: list) -> None:
+        """Function to process the items of a phase using multiple threads.
+        It creates a scraper of `scraper_class` for each thread. The results are merged
+        into `data` (or the aggregator, or the result sink) instead of being returned."""
+
+        retry_queue = None
+        task_kind = kwargs.get("task_kind")
+        phase = kwargs.get("task_group") or task_kind or scraper_class.__name__
+        # The phase ends at its own deadline or when the work time of the run is over
+        phase_deadline = Deadline(
+            self.deadlines["phase"] * 60, parent=self.work_deadline)
+
+        if self.work_queue is not None and task_kind:
+            # Publish the items, so the other managers can take part of them
+            added = self.work_queue.put(
+                task_kind, kwargs.get("task_group"), list_to_split)
+            workers = min(self.work_queue.available(
+                task_kind, kwargs.get("task_group")), self.threads)
+            print(
+                f"{self.colors['purple']}Work queue: {added} {task_kind} tasks added, {workers} workers.{self.colors['reset']}")
         else:
-            workers = self.threads
-
-        # Create scrapers
-        for _ in range(workers):
-            if isinstance(data, dict):
-                scraper_instance = scraper_class(
-                    asins_to_update=data.get("to_update", [])
-                )
-            elif isinstance(data, list):
-                scraper_instance = scraper_class()
-            scrapers_list.append(scraper_instance)
+            task_kind = None
+            # Check if the products list is empty
+            workers = min(len(list_to_split), self.threads)
+        self.profiler.start_phase(phase)
+        self.progress.start_phase(
+            phase, len(list_to_split) if task_kind is None else self.work_queue.available(
+                task_kind, kwargs.get("task_group")))
+
+        if isinstance(data, list):
+            # The product scrapers of the phase share a queue for the failed ASINs
+            retry_queue = RetryQueue()
+
+        def create_scraper() -> T:
+            """Take a pre-warmed scraper or create a new one (in the worker thread)."""
+            scraper_instance = self._take_prewarmed(scraper_class)
+            if scraper_instance is None:
+                if isinstance(data, dict):
+                    # The known ASINs are not new products, even when they are not due
+                    scraper_instance = scraper_class(
+                        asins_to_update=kwargs.get("known_asins", data.get("to_update", [])),
+                        **self._scraper_kwargs()
+                    )
+                elif isinstance(data, list):
+                    scraper_instance = scraper_class(**self._scraper_kwargs())
+                scraper_instance.warm_up()
+            scraper_instance.deadline = phase_deadline
+            scraper_instance.item_deadline = phase_deadline
+            if isinstance(data, list):
+                scraper_instance.retry_queue = retry_queue
+                scraper_instance.result_sink = kwargs.get("result_sink")
+            return scraper_instance
 
         # Use ThreadPoolExecutor to manage threads
         try:
-            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            # The worker threads are named after the phase (one track each in the trace)
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix=phase) as executor:
                 executor_list = []
-                step = 0
-                for scraper in scrapers_list:
-                    start = step
-                    step = start + items
-                    if difference_count > 0:
-                        step += 1
-                        difference_count -= 1
-
-                    splited_list = list_to_split[start:step]
+                # Items of the workers whose session couldn't be created
+                orphans = []
+                for index in range(workers):
+                    if task_kind:
+                        # Lease the items from the work queue while there are any left
+                        splited_list = QueueFeed(
+                            self.work_queue,
+                            task_kind,
+                            owner=f"{self.worker_id}-{index}",
+                            group=kwargs.get("task_group")
+                        )
+                    else:
+                        # Interleave the items, so every worker follows the order of the list
+                        # (the stalest ASINs are refreshed first by all the workers)
+                        splited_list = list_to_split[index::workers]
+                    # The sessions are created concurrently and every worker
+                    # starts as soon as its own session is ready
                     executor_list.append(
-                        executor.submit(scraper.main_method,
+                        executor.submit(self._run_scraper,
+                                        create_scraper,
                                         splited_list)
                     )
-                # Wait for all threads to complete
-                lock = threading.Lock()
-                for future in as_completed(executor_list):
-                    try:
-                        result = future.result()
-                        if isinstance(result, tuple):
-                            products_asins, products_to_patch = result
-                            with lock:
-                                for key, value in products_asins.items():
-                                    for v in value:
-                                        if v in self.top_100_asins.keys():
-                                            value.remove(v)
-                                            print(
-                                                f"{self.colors["purple"]} Value Removed: {v}{self.colors["reset"]}")
-                                    data[key] = value
-
-                                for product in products_to_patch:
-                                    if product["asin"] in self.top_100_asins.keys():
-                                        print(
-                                            f"{self.colors['purple']}Scraped product {product['asin']}{self.colors['reset']}")
-                                        product["ranking"] = self.top_100_asins[product["asin"]]
-                                        self.top_100_asins.pop(product["asin"])
-
-                                kwargs["products_data"].extend(
-                                    products_to_patch)
-
-                        elif isinstance(result, list):
-                            with lock:
+                # The results are merged in this thread, as the workers complete
+                pending = set(executor_list)
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            result = future.result()
+                            if isinstance(result, tuple):
+                                kwargs["aggregator"].merge(*result)
+                            elif isinstance(result, list):
                                 data.extend(result)
-                    except Exception as e:
-                        print(
-                            f"{self.colors['red']}Error en scraper: {e}{self.colors['reset']}")
+                        except ScraperNotCreated as e:
+                            orphans.append(e.items)
+                            continue
+                        except Exception as e:
+                            print(
+                                f"{self.colors['red']}Error en scraper: {e}{self.colors['reset']}")
+                            continue
+                        # The worker freed its grid slot, a new one takes the orphaned items
+                        if orphans:
+                            pending.add(executor.submit(
+                                self._run_scraper, create_scraper, orphans.pop(0)))
+                for items in orphans:
+                    if isinstance(items, QueueFeed):
+                        # Nothing was leased, the tasks stay in the work queue
+                        continue
+                    BaseAmazonScraper._count_session_event("lost_items", len(items))
+                    print(
+                        f"{self.colors['red']}[ERROR] No browser session for a worker, {len(items)} items not scraped.{self.colors['reset']}")
         except KeyboardInterrupt:
             print(
                 f"{self.colors['red']}Process interrupted by user.{self.colors['reset']}")
@@ -284,134 +518,405 @@ class AmazonScraperManager():
             print(
                 f"{self.colors['red']}ThreadPoolExecutor error: {e}{self.colors['reset']}")
 
-    def _start_scrapers(self) -> list:
-        """Main function to start the scraping process."""
-
-        products_list = list()
+        self._discard_prewarmed(scraper_class)
+        self.progress.end_phase()
+        self.profiler.end_phase()
 
-        print(f"Searching for this brands:")
-        for brand_to_search in self.brands:
+        if retry_queue is not None:
+            report = retry_queue.report()
             print(
-                f"{self.colors['blue']}{brand_to_search}{self.colors['reset']}")
-
-        # Start the ASIN scraper
-        self._scraper_process(
-            list_to_split=self.brands,
-            scraper_class=self.amazon_asin_scraper,
-            data=self.asins_to_search,
-            products_data=products_list
-        )  # Scrape ASINs
-
-        # Patch the products that need to be updated
-        patch_response = self._api_request(
-            func=requests.patch,
-            endpoint="/api/products/amazon",
-            json=products_list,
-            headers=self.header
-        )
-        print(
-            f"{self.colors['purple']}{patch_response}{self.colors['reset']}")
-
-        products_to_search_set = {
-            asin for asin in self.asins_to_search.get("to_update", [])}
+                f"{self.colors['purple']}Retries: {report['queued']} queued, {report['recovered']} recovered, {report['exhausted']} given up, {report['permanent']} discarded.{self.colors['reset']}")
 
-        print(f"self.asins_to_search: {len(products_to_search_set)}")
-        print("Removing already updated ASINs...")
+    def _run_scraper(self, create_scraper: Callable[[], T], items: Iterable) -> list | tuple:
+        """Create (or take) the scraper of a worker and run it. The creation is retried like
+        a lost session; if it still fails, the items are handed back to the phase."""
+        retries = config["session_retries"]
+        for attempt in range(retries + 1):
+            try:
+                scraper_instance = create_scraper()
+                break
+            except Exception as e:
+                print(
+                    f"{self.colors['red']}[ERROR] Creating browser session ({attempt + 1}/{retries + 1}): {str(e).splitlines()[0] if str(e) else e}{self.colors['reset']}")
+                if attempt == retries:
+                    raise ScraperNotCreated(items) from e
+                sleep(5 * 2 ** attempt)
+        return scraper_instance.main_method(items)
+
+    def _prewarm(self, scraper_class: Type[T], count: int, **scraper_kwargs) -> None:
+        """Create and warm up scrapers in the background for the next phase."""
+        if count <= 0:
+            return
+        if self.prewarm_executor is None:
+            self.prewarm_executor = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="prewarm")
+
+        def create() -> T:
+            scraper_instance = scraper_class(
+                **scraper_kwargs, **self._scraper_kwargs())
+            scraper_instance.warm_up()
+            return scraper_instance
+
+        futures = self.prewarmed.setdefault(scraper_class, list())
+        for _ in range(count):
+            futures.append(self.prewarm_executor.submit(create))
+        print(
+            f"{self.colors['purple']}Warming up {count} sessions for {scraper_class.__name__}...{self.colors['reset']}")
 
-        # Remove the ASINs that were updated from the
-        for product in products_list:
-            asin = product.get("asin")
-            if asin in products_to_search_set:
-                products_to_search_set.remove(asin)
+    def _take_prewarmed(self, scraper_class: Type[T]) -> T | None:
+        """Return a pre-warmed scraper of the class, if there is any left."""
+        while True:
+            with self.prewarm_lock:
+                futures = self.prewarmed.get(scraper_class)
+                if not futures:
+                    return None
+                future = futures.pop(0)
+            try:
+                return future.result()
+            except Exception as e:
+                print(
+                    f"{self.colors['red']}[ERROR] Pre-warmed session: {e}{self.colors['reset']}")
+
+    def _discard_prewarmed(self, scraper_class: Type[T] | None = None) -> None:
+        """Close the pre-warmed scrapers that were not used."""
+        with self.prewarm_lock:
+            if scraper_class is None:
+                futures = [future for futures in self.prewarmed.values() for future in futures]
+                self.prewarmed.clear()
+            else:
+                futures = self.prewarmed.pop(scraper_class, [])
+        for future in futures:
+            try:
+                future.result()._quit_driver()
+            except Exception:
+                pass
 
-        self.asins_to_search["to_update"] = list(products_to_search_set)
+    def _start_run(self) -> None:
+        """Start the run budget. A reserve of it is kept for the uploads, so the scraping
+        phases end earlier and the results of the run are always uploaded."""
+        budget = self.deadlines["run_budget"] * 60
+        reserve = self.deadlines["upload_reserve"] * 60
+        self.run_deadline = Deadline(budget)
+        # With a reserve as long as the budget, half of it is left for the scraping
+        self.work_deadline = Deadline(max(budget - reserve, budget / 2))
+        self.progress.start_run()
+        self.profiler.start_run()
+        if budget:
+            print(
+                f"{self.colors['purple']}Run budget: {self.deadlines['run_budget']:g} minutes.{self.colors['reset']}")
 
+    def _budget_low(self, work: str) -> bool:
+        """Check if the work time of the run is over, so no new work is started."""
+        if not self.work_deadline.expired():
+            return False
         print(
-            f"{self.colors['purple']}self.asins_to_search: {len(self.asins_to_search.get('to_update', []))}{self.colors['reset']}")
+            f"{self.colors['yellow']}Run budget low, skipping {work}.{self.colors['reset']}")
+        return True
 
-        # Prints the number of products found
-        first_acc = 0
-        for brand, asins in self.asins_to_search.items():
-            first_acc += len(asins)
+    def _start_scrapers(self) -> ResultSpool:
+        """Main function to start the scraping process."""
 
-        print(
-            f"{self.colors['purple']}Products found: {self.colors['blue']}{first_acc}{self.colors['reset']}.")
+        # The scrapers write the products to the spool as they get them
+        spool = ResultSpool()
+        try:
+            # The top 100 go first, so the brands don't scrape their variants again
+            self._scrap_top_100(spool)
 
-        # Append the ASINs to the data list
-        final_dict = {}
+            aggregator = ResultAggregator(self.top_100_asins)
+            aggregator.mark_scraped(spool.iter_group("top_100"))
+
+            print(f"Searching for this brands:")
+            for brand_to_search in self.brands:
+                print(
+                    f"{self.colors['blue']}{brand_to_search}{self.colors['reset']}")
+
+            # Start the ASIN scraper
+            if not self._budget_low("the brand search"):
+                self._scraper_process(
+                    list_to_split=self.brands,
+                    scraper_class=self.amazon_asin_scraper,
+                    data=self.asins_to_search,
+                    aggregator=aggregator,
+                    known_asins=self.asin_mirror.active_asins(),
+                    task_kind="brand"
+                )  # Scrape ASINs
+                self.asins_to_search.update(aggregator.brand_asins())
+
+            # Patch the products that need to be updated
+            products_list = aggregator.cards_to_patch()
+            if products_list:
+                patch_response = self._api_request(
+                    func=requests.patch,
+                    endpoint="/api/products/amazon",
+                    json=products_list,
+                    headers=self.header
+                )
+                print(
+                    f"{self.colors['purple']}{patch_response}{self.colors['reset']}")
+                self.asin_mirror.mark_scraped(products_list)
 
-        for brand, asins in self.asins_to_search.items():
             print(
-                f"Processing {self.colors['blue']}{brand.title()}: {len(asins)}{self.colors['reset']} products...")
-            products = list()
-            self._scraper_process(
-                list_to_split=asins,
-                scraper_class=self.amazon_data_scraper,
-                data=products
-            )  # Process the ASINs
-            final_dict[brand] = products
+                f"self.asins_to_search: {len(self.asins_to_search.get('to_update', []))}")
+            print("Removing already updated ASINs...")
+
+            # Remove the ASINs that were updated from the search cards or with the top 100
+            # (the stalest ASINs stay first)
+            self.asins_to_search["to_update"] = aggregator.pending(
+                self.asins_to_search.get("to_update", []))
+
             print(
-                f"{brand.title()} products processed: {self.colors['blue']}{len(products)}/{len(asins)}{self.colors['reset']}.")
+                f"{self.colors['purple']}self.asins_to_search: {len(self.asins_to_search.get('to_update', []))}{self.colors['reset']}")
 
-        # Finally, process the top 100 ASINs
-        print(
-            f"{self.colors['purple']}Processing top 100 ASINs...{self.colors['reset']}")
-        top_100_products = list()
-        self._scraper_process(
-            list_to_split=[{k: v}for k, v in self.top_100_asins.items()],
-            scraper_class=self.amazon_data_scraper,
-            data=top_100_products
-        )
-        final_dict["top_100"] = top_100_products
+            # Prints the number of products found
+            first_acc = len(self.top_100_asins)
+            for brand, asins in self.asins_to_search.items():
+                first_acc += len(asins)
+
+            print(
+                f"{self.colors['purple']}Products found: {self.colors['blue']}{first_acc}{self.colors['reset']}.")
+
+            groups = dict(self.asins_to_search)
+            if self.work_queue is not None:
+                # Also help with the brands found by the other managers
+                for group in self.work_queue.groups("asin"):
+                    groups.setdefault(group, [])
+
+            for brand, asins in groups.items():
+                # The groups go in priority order (the ASINs due for a refresh first)
+                if self._budget_low(f"{brand} and the next groups"):
+                    break
+                print(
+                    f"Processing {self.colors['blue']}{brand.title()}: {len(asins)}{self.colors['reset']} products...")
+                self._scraper_process(
+                    list_to_split=asins,
+                    scraper_class=self.amazon_data_scraper,
+                    data=list(),
+                    result_sink=spool.sink(brand),
+                    task_kind="asin",
+                    task_group=brand
+                )  # Process the ASINs
+                self._mark_scraped(spool, brand)
+                print(
+                    f"{brand.title()} products processed: {self.colors['blue']}{spool.count(brand)}/{len(asins)}{self.colors['reset']}.")
+        except BaseException:
+            spool.close()
+            raise
 
         self.clear_asins()  # Clear the ASINs dictionary to free memory
 
-        last_acc = 0
-        for brand, asins in final_dict.items():
-            last_acc += len(asins)
         # Print the final results
         print(
-            f"Products scraped: {self.colors["blue"]}{last_acc}/{first_acc}{self.colors["reset"]}.")
-
-        return final_dict
+            f"Products scraped: {self.colors["blue"]}{spool.count()}/{first_acc}{self.colors["reset"]}.")
 
-    def main(self) -> None:
-        """Main entry point for the scraper manager. It handles the login, scraping process, and saving the results."""
+        return spool
 
-        self.top_100_asins = self.top_scraper().main_method()
+    def _scrap_top_100(self, spool: ResultSpool) -> None:
+        """Scrape the top 100 products and then the variants found in their twister,
+        with the ranking of the top product. Each variant is visited once."""
+        print(
+            f"{self.colors['purple']}Processing top 100 ASINs...{self.colors['reset']}")
+        top_asins = dict(self.top_100_asins)
+        to_scrape = dict(top_asins)
+        while to_scrape:
+            self._scraper_process(
+                list_to_split=[{k: v}for k, v in to_scrape.items()],
+                scraper_class=self.amazon_data_scraper,
+                data=list(),
+                result_sink=spool.sink("top_100"),
+                task_kind="top_100"
+            )
+            # The variants of the top products that were not scraped yet
+            to_scrape = {
+                asin: ranking for asin, ranking in self.variant_graph.expand(top_asins).items()
+                if asin not in self.top_100_asins}
+            if to_scrape and self._budget_low("the top 100 variants"):
+                break
+            self.top_100_asins.update(to_scrape)
+            if to_scrape:
+                print(
+                    f"{self.colors['purple']}Top 100 variants found: {len(to_scrape)}{self.colors['reset']}")
+        self._mark_scraped(spool, "top_100")
+
+    def _mark_scraped(self, spool: ResultSpool, group: str) -> None:
+        """Record the scraped products of a group in the ASIN mirror."""
+        for products in spool.batches(group, self.upload_batch_size):
+            self.asin_mirror.mark_scraped(products)
+
+    def _upload_products(self, spool: ResultSpool) -> None:
+        """Update the scraped products in the API and create the new ones.
+        The products are read from the spool in batches."""
+        self.profiler.start_phase("upload")
+        self.progress.start_phase("upload", sum(
+            -(-spool.count(key) // self.upload_batch_size) for key in spool.groups()))
+        for key in spool.groups():
+            for value in spool.batches(key, self.upload_batch_size):
+                self.progress.task_started()
+                with self.profiler.span(key, "upload", products=len(value)):
+                    self._upload_batch(key, value)
+                self.progress.task_finished("done")
+        self.progress.end_phase()
+        self.profiler.end_phase()
+
+    def _upload_batch(self, key: str, value: list) -> None:
+        """Update a batch of products and create the ones the API doesn't have."""
+        post_list = list()
+        put_response = self._api_request(
+            func=requests.put,
+            endpoint="/api/products/amazon",
+            json=value,
+            headers=self.header
+        )
         print(
-            f"{self.colors['purple']}Top 100 ASINs found: {len(self.top_100_asins)}{self.colors['reset']}")
+            f"{self.colors['purple']}{key}: {put_response}{self.colors['reset']}")
 
-        products_dict = self._start_scrapers()
+        if put_response.get("to_create"):
+            to_create = put_response["to_create"]
+            if not len(to_create):
+                return
 
-        for key, value in products_dict.items():
+            for v in value:
+                if v["asin"] in to_create:
+                    post_list.append(v)
+            print(
+                f"{self.colors['purple']}Products to create: {len(post_list)}{self.colors['reset']}")
 
-            post_list = list()
-            put_response = self._api_request(
-                func=requests.put,
+            post_response = self._api_request(
+                func=requests.post,
                 endpoint="/api/products/amazon",
-                json=value,
+                json=post_list,
                 headers=self.header
             )
             print(
-                f"{self.colors['purple']}{key}: {put_response}{self.colors['reset']}")
+                f"{self.colors['purple']}{post_response}{self.colors['reset']}")
 
-            if put_response.get("to_create"):
-                to_create = put_response["to_create"]
-                if not len(to_create):
-                    continue
+    def _print_session_report(self) -> None:
+        """Print the browser sessions that died during the run and the items lost with them,
+        and the WebDriver commands of the run."""
+        report = BaseAmazonScraper.session_report(reset=True)
+        color = self.colors['red'] if report["lost_items"] else self.colors['purple']
+        print(
+            f"{color}Browser sessions crashed: {report['crashes']}, recreated: {report['recreated']}, recycled: {report['recycled']}, items lost: {report['lost_items']}.{self.colors['reset']}")
+        print(self.progress.status_line())
+        commands = BaseAmazonScraper.command_report(reset=True)
+        BaseAmazonScraper.command_stats.print_report(commands)
+        remaining = self.run_deadline.remaining()
+        if remaining is not None:
+            print(
+                f"{self.colors['purple']}Run budget left: {remaining / 60:.1f} minutes.{self.colors['reset']}")
+        # In strict mode a page over its command budget fails the run
+        BaseAmazonScraper.command_stats.check(commands)
+
+    def top_100_update(self) -> None:
+        """Scrape and upload only the top 100 products and their variants."""
+        self._start_run()
+        self.variant_graph = VariantGraph()
+        try:
+            self.profiler.start_phase("top_100_ranking")
+            self.top_100_asins = self.top_scraper(
+                **self._scraper_kwargs()).main_method()
+            print(
+                f"{self.colors['purple']}Top 100 ASINs found: {len(self.top_100_asins)}{self.colors['reset']}")
 
-                for v in value:
-                    if v["asin"] in to_create:
-                        post_list.append(v)
+            spool = ResultSpool()
+            try:
+                self._scrap_top_100(spool)
                 print(
-                    f"{self.colors['purple']}Products to create: {len(post_list)}{self.colors['reset']}")
+                    f"Products scraped: {self.colors["blue"]}{spool.count()}/{len(self.top_100_asins)}{self.colors["reset"]}.")
+
+                self._upload_products(spool)
+            finally:
+                spool.close()
+        finally:
+            self.progress.end_run()
+            self.profiler.end_run()
+        self._print_session_report()
+
+    def replay(
+            self,
+            since: float | None = None,
+            until: float | None = None,
+            export_path: str | None = None) -> None:
+        """Re-run the parsers over the archived pages and upload or export the products."""
+        if not self.archive_path:
+            raise ValueError("The page archive is not configured (ARCHIVE_PATH).")
+
+        replayer = ArchiveReplayer(
+            self.archive_path,
+            asins_to_update=self.asin_mirror.active_asins(),
+            parser_pool=self._get_parser_pool()
+        )
+        products_dict, products_data, new_asins = replayer.main_method(
+            since=since, until=until)
+        print(
+            f"{self.colors['purple']}New ASINs in the archived search pages: {len(new_asins)}{self.colors['reset']}")
+
+        if export_path:
+            with open(export_path, "w") as f:
+                for product in products_data:
+                    f.write(json.dumps({"group": "cards", **product}) + "\n")
+                for key, products in products_dict.items():
+                    for product in products:
+                        f.write(json.dumps({"group": key, **product}) + "\n")
+            print(
+                f"{self.colors['purple']}Replayed products exported to {export_path}.{self.colors['reset']}")
+            return
 
-                post_response = self._api_request(
-                    func=requests.post,
-                    endpoint="/api/products/amazon",
-                    json=post_list,
-                    headers=self.header
-                )
-                print(
-                    f"{self.colors['purple']}{post_response}{self.colors['reset']}")
+        if products_data:
+            patch_response = self._api_request(
+                func=requests.patch,
+                endpoint="/api/products/amazon",
+                json=products_data,
+                headers=self.header
+            )
+            print(
+                f"{self.colors['purple']}{patch_response}{self.colors['reset']}")
+
+        spool = ResultSpool()
+        try:
+            for key, products in products_dict.items():
+                spool.append(key, products)
+            self._upload_products(spool)
+        finally:
+            spool.close()
+
+    def benchmark(
+            self,
+            workers_list: list,
+            profiles: list,
+            items: int = 100,
+            export_path: str | None = None) -> list:
+        """Measure the data scraper against the local fixture site with several
+        worker counts and browser profiles."""
+        benchmark = ConcurrencyBenchmark(
+            items=items, parser_pool=self._get_parser_pool())
+        return benchmark.main_method(workers_list, profiles, export_path=export_path)
+
+    def main(self) -> None:
+        """Main entry point for the scraper manager. It handles the login, scraping process, and saving the results."""
+        self._start_run()
+        self.variant_graph = VariantGraph()
+
+        if self.prewarm:
+            # The sessions of the brand search are ready when the top 100 phase ends
+            self._prewarm(
+                self.amazon_asin_scraper,
+                min(len(self.brands), self.threads),
+                asins_to_update=self.asin_mirror.active_asins()
+            )
+
+        try:
+            self.profiler.start_phase("top_100_ranking")
+            self.top_100_asins = self.top_scraper(
+                **self._scraper_kwargs()).main_method()
+            print(
+                f"{self.colors['purple']}Top 100 ASINs found: {len(self.top_100_asins)}{self.colors['reset']}")
+
+            spool = self._start_scrapers()
+            try:
+                self._upload_products(spool)
+            finally:
+                spool.close()
+        finally:
+            self.progress.end_run()
+            self.profiler.end_run()
+        self._print_session_report()
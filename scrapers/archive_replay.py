@@ -0,0 +1,145 @@
+"""
+archive_replay.py
+This module contains the archive replayer. It feeds the pages stored in the page archive
+through the current product, search and top 100 parsers, without any browser or network.
+The worker processes read the frames straight from the memory-mapped segments, so only
+the index entries travel between processes.
+"""
+from custom_exceptions import TransientScrapingError
+from utils import VariantGraph
+from utils.page_archive import PageArchiveReader, read_frame
+from .base_amazon_scraper import BaseAmazonScraper
+from .html_parser import (
+    HtmlParserPool,
+    parse_product_page,
+    parse_search_page,
+    parse_top_page
+)
+
+
+def _replay_product(entry: dict, default_brands: list) -> tuple:
+    """Parse an archived product page inside a parser process."""
+    html = read_frame(
+        entry["segment"], entry["offset"], entry["length"], entry["codec"])
+    return parse_product_page(
+        html,
+        asin=entry["key"],
+        url=entry["url"].split("?")[0],
+        default_brands=default_brands
+    )
+
+
+def _replay_search(entry: dict, amazon_url: str, asins_to_update: frozenset) -> tuple:
+    """Parse an archived search page inside a parser process."""
+    html = read_frame(
+        entry["segment"], entry["offset"], entry["length"], entry["codec"])
+    return parse_search_page(html, amazon_url, asins_to_update)
+
+
+def _replay_top(entry: dict) -> dict:
+    """Parse an archived top 100 page inside a parser process."""
+    html = read_frame(
+        entry["segment"], entry["offset"], entry["length"], entry["codec"])
+    return parse_top_page(html)
+
+
+class ArchiveReplayer(BaseAmazonScraper):
+    """Replay the archived pages through the parsers."""
+
+    def __init__(self, archive_path: str, asins_to_update: list | None = None, **kwargs):
+        """Initialize the replayer. It needs a parser pool to parse in parallel."""
+        super().__init__(**kwargs)
+        if self.parser_pool is None:
+            self.parser_pool = HtmlParserPool()
+            self.own_parser_pool = True
+        else:
+            self.own_parser_pool = False
+        self.reader = PageArchiveReader(archive_path)
+        self.asins_to_update_set = frozenset(asins_to_update or [])
+
+    def _latest(self, kind: str, since: float | None, until: float | None) -> dict:
+        """Return the latest archived page of each key."""
+        latest = dict()
+        for entry in self.reader.iter_index(kinds=(kind,), since=since, until=until):
+            key = entry["key"] if kind == "product" else entry["url"]
+            latest[key] = entry
+        return latest
+
+    def main_method(self, since: float | None = None, until: float | None = None) -> tuple:
+        """Replay the archive. It returns the products by brand, the search cards data
+        and the new ASINs found in the search pages."""
+        products_dict = dict()
+        products_data = list()
+        new_asins = set()
+        rankings = dict()
+
+        try:
+            # Parse every kind of page at the same time
+            top_futures = [
+                self.parser_pool.submit(_replay_top, entry)
+                for entry in self._latest("top", since, until).values()
+            ]
+            search_futures = [
+                self.parser_pool.submit(
+                    _replay_search, entry, self.amazon_url, frozenset())
+                for entry in self._latest("search", since, until).values()
+            ]
+            product_futures = [
+                self.parser_pool.submit(
+                    _replay_product, entry, self.default_brands)
+                for entry in self._latest("product", since, until).values()
+            ]
+            print(
+                f"{self.colors['purple']}Replaying {len(top_futures)} top 100, {len(search_futures)} search and {len(product_futures)} product pages...{self.colors['reset']}")
+
+            for future in top_futures:
+                rankings.update(future.result())
+
+            products = list()
+            variant_graph = VariantGraph()
+            for future in product_futures:
+                try:
+                    product, logs = future.result()
+                except TransientScrapingError as e:
+                    # The archived page was not fully loaded
+                    print(e)
+                    continue
+                print(logs)
+                if not product:
+                    continue
+                if product.get("twister"):
+                    variant_graph.add(product["asin"], product["twister"])
+                products.append(product)
+
+            # The variants of the top 100 take the ranking of their family, like in a run
+            while True:
+                variants = variant_graph.expand(rankings)
+                if not variants:
+                    break
+                rankings.update(variants)
+
+            cards = dict()
+            for future in search_futures:
+                asins, cards_data, logs = future.result()
+                if logs:
+                    print(logs)
+                # The known ASINs are filtered here, not sent with every page
+                new_asins.update(asin for asin in asins if asin not in self.asins_to_update_set)
+                for card in cards_data:
+                    cards[card["asin"]] = card
+            for card in cards.values():
+                card["ranking"] = rankings.get(card["asin"], 0)
+            products_data.extend(cards.values())
+
+            for product in products:
+                product["ranking"] = rankings.get(product["asin"], 0)
+                key = "top_100" if product["ranking"] else product["brand"]
+                products_dict.setdefault(key, list()).append(product)
+        finally:
+            if self.own_parser_pool:
+                self.parser_pool.close()
+
+        replayed = sum(len(products) for products in products_dict.values())
+        print(
+            f"{self.colors['purple']}Products replayed: {self.colors['blue']}{replayed}/{len(product_futures)}{self.colors['reset']}.")
+        return products_dict, products_data, list(new_asins)
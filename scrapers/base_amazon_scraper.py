@@ -3,20 +3,124 @@ This module contains the base class for Amazon scrapers using Selenium WebDriver
 It provides methods to create a WebDriver instance, handle captchas, and quit the driver.
 """
 
+import os
+import random
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from time import monotonic, sleep
 from selenium import webdriver
 from config import config
+from custom_exceptions import TransientScrapingError
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from utils import CommandStats, Deadline
+from .tab_pool import PAGE_READY_SCRIPT
 
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import InvalidSessionIdException, TimeoutException
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    NoSuchWindowException,
+    TimeoutException,
+    WebDriverException
+)
+
+# Messages of the WebDriver errors raised when the browser session is gone
+SESSION_ERROR_MESSAGES = [
+    "invalid session id",
+    "session deleted",
+    "session not created",
+    "chrome not reachable",
+    "disconnected",
+    "tab crashed",
+    "target window already closed",
+    "no such session"
+]
+
+# Page states returned by `_probe_page`
+PAGE_NORMAL = "normal"
+PAGE_INTERSTITIAL = "interstitial"
+PAGE_AUTH = "auth"
+PAGE_THROTTLE = "throttle"
+PAGE_EMPTY = "empty"
+
+# Classify the current page in a single WebDriver round trip
+PAGE_PROBE_SCRIPT = """
+const visible = (element) => !!element && !!(
+    element.offsetWidth || element.offsetHeight || element.getClientRects().length);
+const xpath = (path) => document.evaluate(
+    path, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const navbar = document.querySelector('#navbar, #nav-main, #nav-belt');
+
+if (visible(document.querySelector('.auth-workflow'))) {
+    return 'auth';
+}
+if (!navbar && visible(document.querySelector('pre'))) {
+    return 'throttle';
+}
+if (document.querySelector('form[action*="validateCaptcha"]')
+        || (!navbar && visible(document.querySelector('.a-button-text')))) {
+    return 'interstitial';
+}
+if (visible(xpath('//*[@id="search"]/div[1]/div[1]/div/span[1]/div[1]/div[2]/div/div/div/h3/span'))
+        || visible(xpath('//*[@id="search"]/div[1]/div[1]/div/span[1]/div[1]/div[1]/div/div/div/h3/span'))) {
+    return 'empty';
+}
+return 'normal';
+"""
+
+# JS heap and DOM nodes of the page, when the grid doesn't forward CDP commands
+SESSION_METRICS_SCRIPT = """
+return [
+    performance.memory ? performance.memory.usedJSHeapSize : 0,
+    document.getElementsByTagName('*').length
+];
+"""
 
 
 class BaseAmazonScraper():
     """Base amazon scraper class"""
 
-    def __init__(self):
+    # Session health counters shared by every scraper of the run
+    session_stats: dict = {"crashes": 0, "recreated": 0, "recycled": 0, "lost_items": 0}
+    session_stats_lock = threading.Lock()
+    # The replacements of the recycled sessions are created and warmed up in the background
+    # (one thread per worker of the run, created with the first replacement)
+    recycle_executor: ThreadPoolExecutor | None = None
+    recycle_executor_lock = threading.Lock()
+    # WebDriver commands of every session of the run, by type, method and page
+    command_stats = CommandStats()
+
+    def __init__(
+            self,
+            parser_pool=None,
+            page_archive=None,
+            retry_queue=None,
+            result_sink=None,
+            variant_graph=None,
+            deadline=None,
+            progress=None,
+            profiler=None,
+            session_store=None):
         self.colors = config["colors"]
+        self.parser_pool = parser_pool
+        self.page_archive = page_archive
+        self.retry_queue = retry_queue
+        self.result_sink = result_sink
+        self.variant_graph = variant_graph
+        self.progress = progress
+        self.profiler = profiler
+        self.session_store = session_store
+        # Replacement of the session being created in the background (recycling)
+        self.replacement: Future | None = None
+        self.recycle_policy: dict = config["recycle"]
+        # HTTP client of the hybrid transport (created by the scrapers that use it)
+        self.http_transport = None
+        # Deadline of the phase, and of the item being scraped (never later than the phase)
+        self.deadline = deadline or Deadline()
+        self.item_deadline = self.deadline
+        self.page_load_timeout = config["deadlines"]["page_load"]
         self.default_brands = config.get("brands") or [
             'samsung',
             'apple',
@@ -33,6 +137,7 @@ class BaseAmazonScraper():
         ]
         self.selenium_url = config["selenium_url"]
         self.amazon_url = config["amazon_url"]
+        self.session_retries = config["session_retries"]
 
     def _create_driver(self, *arguments: str, **kwargs: dict | bool) -> webdriver.Remote:
         """Function to create and return a Selenium WebDriver instance."""
@@ -41,6 +146,10 @@ class BaseAmazonScraper():
         for argument in arguments:
             chrome_options.add_argument(argument)
 
+        # Extra arguments of the selected browser profile
+        for argument in config["profiles"].get(config["profile"], []):
+            chrome_options.add_argument(argument)
+
         for key, value in kwargs.items():
             chrome_options.add_experimental_option(name=key, value=value)
 
@@ -48,55 +157,455 @@ class BaseAmazonScraper():
             command_executor=self.selenium_url,  # URL of the remote server
             options=chrome_options
         )
+        if self.progress is not None:
+            self.progress.session_opened()
+        self.command_stats.wrap_driver(driver, os.path.dirname(__file__))
+        if self.profiler is not None:
+            self.profiler.wrap_driver(driver)
+
+        # A new session has no cookies (the stored ones are added by `warm_up`)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        driver.scraper_page_load_timeout = self.page_load_timeout
 
-        driver.delete_all_cookies()
+        # Keep the options to recreate the session from the same profile
+        driver.scraper_options = (arguments, kwargs)
+        # Age, pages and memory checks of the session (recycling policy)
+        driver.scraper_created_at = monotonic()
+        driver.scraper_pages = 0
+        driver.scraper_checked_pages = 0
+        driver.scraper_recycle_pages = None
+        # Each session recycles a bit earlier than the limits, so they don't all do it at once
+        driver.scraper_recycle_factor = 1 - random.uniform(0, self.recycle_policy["jitter"])
+        driver.scraper_closed = False
+        # The CDP commands are not part of the Remote driver (None: not tried yet)
+        driver.command_executor.add_command(
+            "executeCdpCommand", "POST", "/session/$sessionId/goog/cdp/execute")
+        driver.scraper_cdp = None
 
         return driver
 
-    def _asin_captchats(self, url: str):
-        """Method to handle captcha or authentication issues."""
+    @staticmethod
+    def _is_session_error(error: Exception) -> bool:
+        """Check if an error means that the browser session is dead."""
+        if isinstance(error, (InvalidSessionIdException, NoSuchWindowException, Urllib3HTTPError, ConnectionError)):
+            return True
+        if isinstance(error, WebDriverException):
+            message = str(error).lower()
+            return any(session_error in message for session_error in SESSION_ERROR_MESSAGES)
+        return False
 
-        logs = f"{self.colors['green']}Handling captcha or authentication issues.{self.colors['reset']}\n"
-        # Wait for the continue button and click it if it appears
-        # This is to handle any pop-ups or modals that might appear
-        # when accessing the Amazon homepage
+    @classmethod
+    def _count_session_event(cls, event: str, count: int = 1) -> None:
+        with cls.session_stats_lock:
+            cls.session_stats[event] += count
+
+    @classmethod
+    def command_report(cls, reset: bool = False) -> dict:
+        """Return the WebDriver command counters of the run."""
+        return cls.command_stats.report(reset)
+
+    @classmethod
+    def session_report(cls, reset: bool = False) -> dict:
+        """Return the session health counters of the run."""
+        with cls.session_stats_lock:
+            report = {**cls.session_stats}
+            if reset:
+                for event in cls.session_stats:
+                    cls.session_stats[event] = 0
+        return report
+
+    def _close_session(self, driver: webdriver.Remote) -> None:
+        """Quit a session (once), ignoring the errors of a dead one."""
+        if getattr(driver, "scraper_closed", False):
+            return
+        driver.scraper_closed = True
+        self.command_stats.end_page(driver)
         try:
-            continue_button = WebDriverWait(self.driver, 1).until(EC.visibility_of_element_located((
-                By.CLASS_NAME, "a-button-text")))
-            continue_button.click()
-            logs += f"{self.colors['green']}Continue button clicked successfully.{self.colors['reset']}\n"
-            logs = f"{self.colors['red']}Captcha detected.{self.colors['reset']}\n"
-        except TimeoutException:
-            logs += f"{self.colors['green']}Continue button not found.{self.colors['reset']}\n"
+            driver.quit()
         except Exception:
-            logs += f"{self.colors['red']}[ERROR] Error clicking continue button.{self.colors['reset']}\n"
+            pass
+        if self.progress is not None:
+            self.progress.session_closed()
+
+    def _recreate_driver(self, driver: webdriver.Remote | None = None) -> webdriver.Remote:
+        """Replace a dead session with a new one created from the same profile."""
+        old_driver = driver or self.driver
+        arguments, options = old_driver.scraper_options
+        self._close_session(old_driver)
+
+        new_driver = self._create_driver(*arguments, **options)
+        if old_driver is getattr(self, "driver", None):
+            self.driver = new_driver
+        self._count_session_event("recreated")
+        print(
+            f"{self.colors['yellow']}Browser session recreated.{self.colors['reset']}")
+        return new_driver
 
-        # Wait for the authentication workflow to complete
-        # This is to ensure that the page is fully loaded before performing any actions
+    def _with_session_retry(self, function, *args, **kwargs):
+        """Run a function that uses `self.driver`. If the session dies, recreate it
+        and retry the function, so one crash doesn't lose the rest of the slice."""
+        for attempt in range(self.session_retries + 1):
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if not self._is_session_error(e):
+                    raise
+                self._count_session_event("crashes")
+                print(
+                    f"{self.colors['red']}[ERROR] Browser session lost: {str(e).splitlines()[0]}{self.colors['reset']}")
+                try:
+                    self._recreate_driver()
+                except Exception as create_error:
+                    print(
+                        f"{self.colors['red']}[ERROR] Recreating session: {create_error}{self.colors['reset']}")
+                    break
+                if attempt == self.session_retries:
+                    break
+
+        self._count_session_event("lost_items")
+        return None
+
+    def _load_page(
+            self,
+            url: str,
+            driver: webdriver.Remote | None = None,
+            kind: str = "page",
+            key: str | None = None,
+            deadline: Deadline | None = None) -> None:
+        """Load a page within the page load timeout and the time left of the item
+        (or of the given deadline). A page that doesn't finish loading is stopped and read
+        as it is. The next WebDriver commands of the session are counted in the page."""
+        driver = driver or self.driver
+        self.command_stats.start_page(driver, kind, key or url)
+        driver.scraper_pages = getattr(driver, "scraper_pages", 0) + 1
+        timeout = (deadline or self.item_deadline).cap(self.page_load_timeout)
+        if timeout <= 0:
+            raise TransientScrapingError(
+                f"{self.colors['red']}Deadline exceeded before loading {url}.{self.colors['reset']}")
+        # Only send the timeout to the browser when it changes
+        if abs(timeout - getattr(driver, "scraper_page_load_timeout", 0)) >= 1:
+            driver.set_page_load_timeout(timeout)
+            driver.scraper_page_load_timeout = timeout
         try:
-            WebDriverWait(self.driver, 1).until(EC.visibility_of_element_located((
-                By.CLASS_NAME, "auth-workflow")))
-            self.driver.get(url)
-            logs += f"{self.colors['green']}Authentication workflow completed successfully.{self.colors['reset']}\n"
+            driver.get(url)
         except TimeoutException:
-            logs += f"{self.colors['green']}Authentication workflow not found.{self.colors['reset']}\n"
-        except Exception:
-            logs += f"{self.colors['red']}[ERROR] Error waiting for authentication workflow.{self.colors['reset']}\n"
+            print(
+                f"{self.colors['yellow']}Page load timeout ({timeout:.0f}s): {url}{self.colors['reset']}")
+            driver.execute_script("window.stop();")
+
+    def _await_page(
+            self,
+            url: str,
+            driver: webdriver.Remote | None = None,
+            kind: str = "page",
+            key: str | None = None) -> None:
+        """Wait for a page that is loading in the current tab (prefetched), within the same
+        timeouts as `_load_page`. A page that doesn't finish loading is stopped and read as it is."""
+        driver = driver or self.driver
+        self.command_stats.start_page(driver, kind, key or url)
+        driver.scraper_pages = getattr(driver, "scraper_pages", 0) + 1
+        timeout = self.item_deadline.cap(self.page_load_timeout)
+        if timeout <= 0:
+            raise TransientScrapingError(
+                f"{self.colors['red']}Deadline exceeded before loading {url}.{self.colors['reset']}")
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=0.25).until(
+                lambda driver: driver.execute_script(PAGE_READY_SCRIPT))
+        except TimeoutException:
+            print(
+                f"{self.colors['yellow']}Page load timeout ({timeout:.0f}s): {url}{self.colors['reset']}")
+            driver.execute_script("window.stop();")
+
+    def _wait(self, timeout: float, driver: webdriver.Remote | None = None) -> WebDriverWait:
+        """WebDriverWait capped by the time left of the item."""
+        return WebDriverWait(driver or self.driver, self.item_deadline.cap(timeout))
+
+    def _sleep(self, seconds: float) -> None:
+        """Sleep, but not past the deadline of the item."""
+        with self._span("sleep", "wait"):
+            sleep(self.item_deadline.cap(seconds))
+
+    def _span(self, name: str, category: str, **args):
+        """Profiling span of the current thread (a no-op when the run is not profiled)."""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.span(name, category, **args)
+
+    def _task_started(self) -> None:
+        if self.progress is not None:
+            self.progress.task_started()
+
+    def _task_finished(self, status: str) -> None:
+        if self.progress is not None:
+            self.progress.task_finished(status)
+
+    def _probe_page(self, driver: webdriver.Remote | None = None) -> str:
+        """Classify the current page as normal, interstitial, auth, throttle or empty results."""
+        driver = driver or self.driver
+        try:
+            return driver.execute_script(PAGE_PROBE_SCRIPT) or PAGE_NORMAL
+        except Exception as e:
+            if self._is_session_error(e):
+                raise
+            print(
+                f"{self.colors['red']}[ERROR] Page probe: {e}{self.colors['reset']}")
+            return PAGE_NORMAL
+
+    def _asin_captchats(self, url: str, driver: webdriver.Remote | None = None) -> str:
+        """Method to handle captcha or authentication issues.
+        It returns the state of the page once it has been handled."""
+        driver = driver or self.driver
 
+        logs = f"{self.colors['green']}Handling captcha or authentication issues.{self.colors['reset']}\n"
+        state = self._probe_page(driver)
+
+        # The stored cookies didn't get the session past the interstitial pages
+        if state in (PAGE_INTERSTITIAL, PAGE_AUTH) and getattr(driver, "session_restored", False):
+            self.session_store.invalidate(f"{state} page")
+            driver.session_restored = False
+
+        # Click the continue button of the interstitial page
+        if state == PAGE_INTERSTITIAL:
+            logs += f"{self.colors['red']}Captcha detected.{self.colors['reset']}\n"
+            try:
+                driver.find_element(By.CLASS_NAME, "a-button-text").click()
+                logs += f"{self.colors['green']}Continue button clicked successfully.{self.colors['reset']}\n"
+            except Exception as e:
+                if self._is_session_error(e):
+                    raise
+                logs += f"{self.colors['red']}[ERROR] Error clicking continue button.{self.colors['reset']}\n"
+            state = self._probe_page(driver)
+
+        # Leave the authentication workflow loading the page again
+        if state == PAGE_AUTH:
+            try:
+                driver.get(url)
+                logs += f"{self.colors['green']}Authentication workflow completed successfully.{self.colors['reset']}\n"
+            except Exception as e:
+                if self._is_session_error(e):
+                    raise
+                logs += f"{self.colors['red']}[ERROR] Error leaving authentication workflow.{self.colors['reset']}\n"
+            state = self._probe_page(driver)
+
+        logs += f"{self.colors['green']}Page state: {state}.{self.colors['reset']}\n"
         print(logs)  # Print logs for debugging
         del logs  # Clear logs after printing
+        return state
+
+    def _restore_session_state(self, driver: webdriver.Remote) -> bool:
+        """Add the stored cookies to the session (the landing page must be loaded)."""
+        cookies = self.session_store.get() if self.session_store is not None else None
+        if not cookies:
+            return False
+        for cookie in cookies:
+            try:
+                driver.add_cookie(cookie)
+            except Exception as e:
+                if self._is_session_error(e):
+                    raise
+        # The session started with the stored cookies
+        driver.session_restored = True
+        return True
+
+    def _capture_session_state(self, driver: webdriver.Remote) -> None:
+        """Store the cookies of the session, if there is no valid state stored."""
+        if self.session_store is None or getattr(driver, "session_restored", False) \
+                or self.session_store.get():
+            return
+        try:
+            self.session_store.save(driver.get_cookies())
+        except Exception as e:
+            if self._is_session_error(e):
+                raise
+            print(
+                f"{self.colors['red']}[ERROR] Storing session state: {e}{self.colors['reset']}")
+
+    def _adopt_http_session(self, driver: webdriver.Remote | None = None) -> None:
+        """Hand the cookies and headers of the session to the HTTP transport (hybrid mode)."""
+        if self.http_transport is None or self.http_transport.ready:
+            return
+        try:
+            self.http_transport.adopt(driver or self.driver)
+        except Exception as e:
+            if self._is_session_error(e):
+                raise
+            print(
+                f"{self.colors['red']}[ERROR] HTTP transport: {e}{self.colors['reset']}")
+
+    def warm_up(self, driver: webdriver.Remote | None = None) -> None:
+        """Load the landing page and get past the interstitial before the first item.
+        The session starts with the stored cookies, or stores its own once it is ready."""
+        driver = driver or self.driver
+        try:
+            self._load_page(self.amazon_url, driver, kind="landing", deadline=self.deadline)
+            if self._restore_session_state(driver):
+                # Load the page again with the stored cookies
+                self._load_page(self.amazon_url, driver, kind="landing", deadline=self.deadline)
+            if self._asin_captchats(url=self.amazon_url, driver=driver) == PAGE_NORMAL:
+                self._capture_session_state(driver)
+                # A replacement session hands its cookies to the HTTP client once it takes over
+                if driver is self.driver:
+                    self._adopt_http_session(driver)
+        except Exception as e:
+            # A dead session is recreated by the first item
+            print(
+                f"{self.colors['red']}[ERROR] Warm-up: {str(e).splitlines()[0] if str(e) else e}{self.colors['reset']}")
+
+    def _cdp(self, driver: webdriver.Remote, command: str, **params) -> dict:
+        return driver.execute("executeCdpCommand", {"cmd": command, "params": params})["value"]
+
+    def _session_metrics(self, driver: webdriver.Remote) -> tuple:
+        """Return the JS heap (in MB) and the DOM nodes of the session, from the CDP
+        performance metrics (or from the page, when the grid doesn't forward CDP commands)."""
+        if driver.scraper_cdp is not False:
+            try:
+                if driver.scraper_cdp is None:
+                    self._cdp(driver, "Performance.enable")
+                    driver.scraper_cdp = True
+                metrics = {
+                    metric["name"]: metric["value"]
+                    for metric in self._cdp(driver, "Performance.getMetrics")["metrics"]
+                }
+                return metrics.get("JSHeapUsedSize", 0) / 1024 ** 2, int(metrics.get("Nodes", 0))
+            except Exception as e:
+                if self._is_session_error(e):
+                    raise
+                driver.scraper_cdp = False
+        heap, nodes = driver.execute_script(SESSION_METRICS_SCRIPT)
+        return heap / 1024 ** 2, nodes
+
+    def _recycle_reason(self, driver: webdriver.Remote) -> str | None:
+        """Return why the session has to be recycled (None while it is within the policy)."""
+        policy = self.recycle_policy
+        factor = driver.scraper_recycle_factor
+        if policy["pages"] and driver.scraper_pages >= policy["pages"] * factor:
+            return f"{driver.scraper_pages} pages"
+        age = (monotonic() - driver.scraper_created_at) / 60
+        if policy["minutes"] and age >= policy["minutes"] * factor:
+            return f"{age:.0f} minutes old"
+        if not (policy["heap_mb"] or policy["dom_nodes"]) \
+                or driver.scraper_pages - driver.scraper_checked_pages < policy["check_every"]:
+            return None
+        driver.scraper_checked_pages = driver.scraper_pages
+        heap_mb, nodes = self._session_metrics(driver)
+        if policy["heap_mb"] and heap_mb >= policy["heap_mb"]:
+            return f"{heap_mb:.0f} MB of JS heap"
+        if policy["dom_nodes"] and nodes >= policy["dom_nodes"]:
+            return f"{nodes} DOM nodes"
+        return None
+
+    @classmethod
+    def _recycle_executor(cls) -> ThreadPoolExecutor:
+        with cls.recycle_executor_lock:
+            if cls.recycle_executor is None:
+                cls.recycle_executor = ThreadPoolExecutor(
+                    max_workers=config["concurrency"] or os.cpu_count(),
+                    thread_name_prefix="recycle")
+            return cls.recycle_executor
+
+    def _create_replacement(self, options: tuple) -> webdriver.Remote:
+        """Create and warm up the session that replaces a recycled one (in the background)."""
+        arguments, kwargs = options
+        driver = self._create_driver(*arguments, **kwargs)
+        self.warm_up(driver)
+        return driver
+
+    def _maybe_recycle(self) -> None:
+        """Recycle the session when it is past the recycling policy. The replacement is
+        created in the background while the session keeps scraping, and it takes over
+        between items once it is ready. When the grid has no free slot for it, the old
+        session is closed after the grace pages so the replacement can take its slot."""
+        driver = getattr(self, "driver", None)
+        if driver is None:
+            return
+        try:
+            if self.replacement is None:
+                reason = self._recycle_reason(driver)
+                if reason is not None:
+                    print(
+                        f"{self.colors['yellow']}Recycling browser session ({reason}).{self.colors['reset']}")
+                    driver.scraper_recycle_pages = driver.scraper_pages
+                    self.replacement = self._recycle_executor().submit(
+                        self._create_replacement, driver.scraper_options)
+                return
+            if not self.replacement.done():
+                if driver.scraper_pages - driver.scraper_recycle_pages < self.recycle_policy["grace_pages"]:
+                    return
+                print(
+                    f"{self.colors['yellow']}Replacement session not ready, closing the old one.{self.colors['reset']}")
+                self._close_session(driver)
+            replacement, self.replacement = self.replacement, None
+            try:
+                new_driver = replacement.result()
+            except Exception as e:
+                print(
+                    f"{self.colors['red']}[ERROR] Replacement session: {e}{self.colors['reset']}")
+                if driver.scraper_closed:
+                    self._recreate_driver(driver)
+                return
+            self.driver = new_driver
+            self._close_session(driver)
+            self._count_session_event("recycled")
+            if self.http_transport is not None:
+                self.http_transport.ready = False
+                self._adopt_http_session(new_driver)
+        except Exception as e:
+            # A dead session is recreated by the next item
+            print(
+                f"{self.colors['red']}[ERROR] Session recycling: {str(e).splitlines()[0] if str(e) else e}{self.colors['reset']}")
+
+    def _discard_replacement(self) -> None:
+        """Close the replacement of the session, also when it is still being created."""
+        if self.replacement is None:
+            return
+        replacement, self.replacement = self.replacement, None
+
+        def close(future: Future) -> None:
+            if future.exception() is None:
+                self._close_session(future.result())
+
+        if not replacement.cancel():
+            replacement.add_done_callback(close)
+
+    def _archive_page(
+            self,
+            kind: str,
+            key: str,
+            url: str,
+            html: str | bytes | None = None,
+            driver: webdriver.Remote | None = None) -> None:
+        """Store the HTML of the current page in the page archive, if it is enabled."""
+        if self.page_archive is None:
+            return
+        driver = driver or self.driver
+        try:
+            self.page_archive.add(
+                kind, key, url, html if html is not None else driver.page_source)
+        except Exception as e:
+            if self._is_session_error(e):
+                raise
+            print(
+                f"{self.colors['red']}[ERROR] Archiving page: {e}{self.colors['reset']}")
 
     def _quit_driver(self):
+        self._discard_replacement()
         try:
-            if hasattr(self, "driver") and self.driver:
+            if hasattr(self, "driver") and self.driver and not self.driver.scraper_closed:
+                self.driver.scraper_closed = True
+                self.command_stats.end_page(self.driver)
                 self.driver.quit()
                 print(
                     f"{self.colors['purple']}Driver cerrado.{self.colors['reset']}")
             else:
                 print("No hay driver para cerrar")
+                return
         except InvalidSessionIdException:
             print(
                 f"{self.colors['red']}Driver session already closed.{self.colors['reset']}")
         except Exception as e:
             print(
                 f"{self.colors['red']}Error quitting driver: {e}{self.colors['reset']}")
+        if self.progress is not None:
+            self.progress.session_closed()
+        if self.http_transport is not None:
+            self.http_transport.close()
@@ -0,0 +1,204 @@
+"""
+concurrency_benchmark.py
+This module contains the concurrency benchmark. It runs the data scraper against the local
+fixture site with a series of worker counts and browser profiles, and measures the throughput,
+the latency percentiles, the failures and the memory of the grid nodes of each case.
+The results are printed as a table with the recommended number of sessions.
+"""
+import json
+import math
+import subprocess
+import threading
+
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+from utils import FixtureSite
+from .amazon_data_scraper import AmazonDataScraper
+
+# Failure rate over which a case is not recommended
+MAX_FAILURE_RATE = 0.05
+
+
+class BenchmarkDataScraper(AmazonDataScraper):
+    """Data scraper that records the duration and the result of every product."""
+
+    def __init__(self, fixture_url: str, samples: list, samples_lock: threading.Lock, **kwargs):
+        super().__init__(**kwargs)
+        self.amazon_url = fixture_url
+        self.samples = samples
+        self.samples_lock = samples_lock
+
+    def _scrap_item(self, asin: str, data: list, ranking: int = 0) -> None:
+        scraped = len(data) + len(self.pending_pages)
+        start = perf_counter()
+        super()._scrap_item(asin, data, ranking)
+        duration = perf_counter() - start
+        with self.samples_lock:
+            self.samples.append((duration, len(data) + len(self.pending_pages) > scraped))
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def node_memory() -> float | None:
+    """Memory used by the Chrome node containers in MB (None if docker is not available)."""
+    try:
+        output = subprocess.run(
+            ["docker", "stats", "--no-stream", "--format", "{{.Name}} {{.MemUsage}}"],
+            capture_output=True, text=True, timeout=20, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    units = {"B": 1 / 1024 ** 2, "KiB": 1 / 1024, "MiB": 1, "GiB": 1024}
+    total = 0.0
+    for line in output.splitlines():
+        name, _, usage = line.partition(" ")
+        if "chrome" not in name:
+            continue
+        used = usage.split("/")[0].strip()
+        for unit, factor in units.items():
+            if used.endswith(unit):
+                total += float(used[:-len(unit)]) * factor
+                break
+    return total
+
+
+class ConcurrencyBenchmark():
+    """Measure the data scraper with several worker counts and browser profiles."""
+
+    def __init__(self, items: int = 100, nodes: int | None = None, **kwargs):
+        """Initialize the benchmark. The kwargs are passed to the scrapers (parser pool, archive...)."""
+        self.colors: dict = config["colors"]
+        self.items = items
+        self.nodes: int = nodes or config["benchmark"]["nodes"]
+        self.scraper_kwargs = kwargs
+        self.results: list = list()
+        self.violations: list = list()
+
+    def _sample_memory(self, stop: threading.Event, peak: list) -> None:
+        while not stop.is_set():
+            memory = node_memory()
+            if memory is None:
+                return
+            peak[0] = max(peak[0] or 0, memory)
+            stop.wait(5)
+
+    def run_case(self, fixture: FixtureSite, workers: int, profile: str) -> dict:
+        """Scrape the fixture products with a number of workers and a browser profile."""
+        print(
+            f"{self.colors['purple']}Benchmark: {workers} workers, {profile} profile...{self.colors['reset']}")
+        config["profile"] = profile
+        samples = list()
+        samples_lock = threading.Lock()
+        asins = fixture.asins(self.items)
+
+        # The sessions are created before the clock starts
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            scrapers = list(executor.map(
+                lambda _: BenchmarkDataScraper(
+                    fixture.url, samples, samples_lock, **self.scraper_kwargs),
+                range(workers)))
+
+        stop = threading.Event()
+        peak = [None]
+        sampler = threading.Thread(
+            target=self._sample_memory, args=(stop, peak), daemon=True)
+        sampler.start()
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(scraper.main_method, asins[index::workers])
+                for index, scraper in enumerate(scrapers)
+            ]
+            products = 0
+            for future in futures:
+                try:
+                    products += len(future.result())
+                except Exception as e:
+                    print(
+                        f"{self.colors['red']}[ERROR] Benchmark scraper: {e}{self.colors['reset']}")
+        elapsed = perf_counter() - start
+        stop.set()
+        sampler.join()
+        commands = AmazonDataScraper.command_report(reset=True)
+        product_pages = commands["pages"].get("product", {"pages": 0, "commands": 0, "max": 0})
+        self.violations.extend(commands["violations"])
+
+        durations = [duration for duration, _ in samples]
+        failures = sum(1 for _, succeeded in samples if not succeeded)
+        result = {
+            "workers": workers,
+            "profile": profile,
+            "items": len(asins),
+            "products": products,
+            "seconds": round(elapsed, 1),
+            "per_minute": round(products / elapsed * 60, 1) if elapsed else 0.0,
+            "p50": round(percentile(durations, 0.5), 2),
+            "p90": round(percentile(durations, 0.9), 2),
+            "p99": round(percentile(durations, 0.99), 2),
+            "failure_rate": round((len(asins) - products) / len(asins), 3) if asins else 0.0,
+            "failures": failures,
+            "commands_per_page": round(product_pages["commands"] / product_pages["pages"], 1) if product_pages["pages"] else 0.0,
+            "max_commands": product_pages["max"],
+            "node_memory_mb": round(peak[0]) if peak[0] is not None else None
+        }
+        self.results.append(result)
+        # Let the grid release the sessions before the next case
+        sleep(5)
+        return result
+
+    def recommendation(self) -> dict | None:
+        """Return the case with the best throughput among the ones with few failures."""
+        valid = [
+            result for result in self.results if result["failure_rate"] <= MAX_FAILURE_RATE]
+        if not valid:
+            return None
+        return max(valid, key=lambda result: result["per_minute"])
+
+    def print_table(self) -> None:
+        header = f"{'workers':>8} {'profile':>9} {'prod/min':>9} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'failed':>7} {'cmd/page':>9} {'node MB':>8}"
+        print(f"{self.colors['purple']}{header}{self.colors['reset']}")
+        for result in self.results:
+            memory = result["node_memory_mb"] if result["node_memory_mb"] is not None else "-"
+            print(
+                f"{result['workers']:>8} {result['profile']:>9} {result['per_minute']:>9} {result['p50']:>7} {result['p90']:>7} {result['p99']:>7} {result['failure_rate']:>7.1%} {result['commands_per_page']:>9} {memory:>8}")
+
+        best = self.recommendation()
+        if best is None:
+            print(
+                f"{self.colors['red']}No case stayed under {MAX_FAILURE_RATE:.0%} failures.{self.colors['reset']}")
+            return
+        print(
+            f"{self.colors['green']}Recommended: CONCURRENCY={best['workers']} with the {best['profile']} profile "
+            f"(SE_NODE_MAX_SESSIONS={math.ceil(best['workers'] / self.nodes)} on {self.nodes} nodes).{self.colors['reset']}")
+
+    def main_method(self, workers_list: list, profiles: list, export_path: str | None = None) -> list:
+        """Run every combination of worker count and profile and print the results."""
+        unknown = [profile for profile in profiles if profile not in config["profiles"]]
+        if unknown:
+            raise ValueError(f"Unknown browser profiles: {', '.join(unknown)}")
+        fixture = FixtureSite(archive_path=config["archive"]["path"])
+        default_profile = config["profile"]
+        try:
+            for profile in profiles:
+                for workers in workers_list:
+                    self.run_case(fixture, workers, profile)
+        finally:
+            config["profile"] = default_profile
+            fixture.close()
+
+        self.print_table()
+        if export_path:
+            with open(export_path, "w") as f:
+                json.dump(self.results, f, indent=4)
+        # In strict mode a product page over its command budget fails the benchmark
+        AmazonDataScraper.command_stats.check({"violations": self.violations})
+        return self.results
@@ -0,0 +1,588 @@
+"""
+html_parser.py
+This module contains the HTML parsing stage for Amazon product and search pages.
+Raw HTML captured by the scrapers is parsed with BeautifulSoup inside a pool of worker
+processes, so the CPU-bound parsing does not compete for the GIL with the I/O threads.
+"""
+import os
+import re
+import json
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections.abc import Iterable
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from config import config
+from custom_exceptions import TransientScrapingError
+
+FORBIDDEN_IMAGES = ['HomeCustomProduct', 'play-icon-overla']
+
+# Define allowed breadcrumbs to identify celphones
+ALLOWED_BREADCRUMBS = [
+    'banda ancha móvil',
+    'celulares y smartphones de prepago',
+    'celulares y smartphones desbloqueados'
+]
+
+SPECIFIED_FEATURES = {
+    "marca": "brand",
+    "nombre del modelo": "model",
+    "color": "color"
+}
+
+CUSTOMERS_OPINION = 'opinión media de los clientes'
+
+# Variation data embedded in the scripts of the product page
+VARIATION_VALUES_PATTERN = re.compile(r'"dimensionValuesDisplayData"\s*:\s*(\{[^{}]*\})')
+VARIATION_DIMENSIONS_PATTERN = re.compile(r'"dimensions"\s*:\s*(\[[^\]]*\])')
+
+TITLES_FILTER = [
+    'funda', 'case', 'protector', 'cristal',
+    'glass', 'mica', 'cable', 'audífono', 'galaxy tab',
+    'headphone', 'earphone', 'bolígrafo',
+    'cover', 'ipad', 'tablet', 'watch', 'band',
+    'laptop', 'notebook', 'macbook', 'plan', 'cabezal',
+    'hotspot', 'router', 'fit3', 'smarttag', 'sobremesa', 'huawei 4g',
+    'computadora de bolsillo', 'galaxy book', 'carcasa', 'smarttag',
+    '(e5783-230a)', 'udio drc-15pf-15pf', 'me993lla', 'guía completa da61-00524a',
+    'punto de acceso portátil', 'barra de surf'
+]
+
+
+def _text(element, separator: str = " ") -> str:
+    """Return the normalized text of a BeautifulSoup element, without the contents
+    of its scripts and styles (like the rendered text read in the browser)."""
+    if element is None:
+        return ""
+    return separator.join(
+        string.strip() for string in element.find_all(string=True)
+        if string.strip() and string.parent.name not in ("script", "style"))
+
+
+def extract_product_fields(html: str | bytes) -> dict:
+    """Extract the raw product fields from a product page.
+    The returned dictionary has the same shape as the one produced in the browser,
+    so both paths share the same post-processing in `build_product`."""
+    soup = BeautifulSoup(html, "html.parser")
+    raw = {
+        "breadcrumbs": None,
+        "title": None,
+        "image": None,
+        "image_layout": None,
+        "price": None,
+        "basis_price": None,
+        "twister": None,
+        "variations": None,
+        "overview": None,
+        "opinions": None,
+    }
+
+    breadcrumbs = soup.find(id="wayfinding-breadcrumbs_feature_div")
+    if breadcrumbs is not None:
+        raw["breadcrumbs"] = _text(breadcrumbs)
+
+    title = soup.find(id="productTitle")
+    if title is not None:
+        raw["title"] = _text(title)
+
+    for layout, container in (
+            ("regular", soup.find(class_="regularAltImageViewLayout")),
+            ("alt", soup.find(id="altImages"))):
+        if container is None:
+            continue
+        images = container.find_all("img")
+        if len(images) > 1:
+            raw["image"] = {
+                "src": images[1].get("src") or "",
+                "alt": images[1].get("alt") or ""
+            }
+        raw["image_layout"] = layout
+        break
+
+    price_container = soup.find(id="corePriceDisplay_desktop_feature_div")
+    if price_container is not None:
+        whole = price_container.find(class_="a-price-whole")
+        fraction = price_container.find(class_="a-price-fraction")
+        if whole is not None and fraction is not None:
+            # The decimal separator is rendered inside the whole part
+            whole_text = "".join(
+                string for string in whole.find_all(string=True, recursive=False))
+            raw["price"] = {
+                "whole": whole_text.strip(),
+                "fraction": _text(fraction)
+            }
+        basis_price = price_container.find(class_="basisPrice")
+        if basis_price is not None:
+            raw["basis_price"] = _text(basis_price, "\n")
+
+    twister_plus = soup.find(id="twister-plus-inline-twister")
+    if twister_plus is not None:
+        raw["twister"] = list()
+        for option in twister_plus.find_all("ul"):
+            option_attribute = option.get("data-a-button-group") or ""
+            option_type = option_attribute.split('"')[-2] if '"' in option_attribute else ""
+            for option_li in option.find_all("li"):
+                image = option_li.find("img")
+                swatch = option_li.find(class_="swatch-title-text-container")
+                raw["twister"].append({
+                    "type": option_type,
+                    "asin": option_li.get("data-asin"),
+                    "alt": image.get("alt") if image is not None else None,
+                    "swatch": _text(swatch) if swatch is not None else None
+                })
+
+    for script in soup.find_all("script", src=False):
+        source = script.string or ""
+        if "dimensionValuesDisplayData" not in source:
+            continue
+        values = VARIATION_VALUES_PATTERN.search(source)
+        dimensions = VARIATION_DIMENSIONS_PATTERN.search(source)
+        if values and dimensions:
+            try:
+                raw["variations"] = {
+                    "dimensions": json.loads(dimensions.group(1)),
+                    "values": json.loads(values.group(1))
+                }
+            except json.JSONDecodeError:
+                pass
+        break
+
+    feature_container = soup.find(id="productOverview_feature_div")
+    if feature_container is not None:
+        raw["overview"] = list()
+        for row in feature_container.find_all("tr"):
+            cells = row.find_all("td")
+            if len(cells) > 1:
+                raw["overview"].append([_text(cells[0]), _text(cells[1])])
+
+    aditional_info = soup.find(id="productDetails_db_sections")
+    if aditional_info is not None:
+        raw["opinions"] = list()
+        for row in aditional_info.find_all("tr"):
+            header = row.find("th")
+            value = row.find("td")
+            if header is not None and value is not None:
+                raw["opinions"].append([_text(header), _text(value, "\n")])
+
+    return raw
+
+
+def _infer_brand(title: str, default_brands: list) -> str:
+    """Infer the brand of a product from its title."""
+    title_lower = title.lower()
+    if "iphone" in title_lower:
+        return "apple"
+    if "poco" in title_lower:
+        return "xiaomi"
+    for default_brand in default_brands:
+        if default_brand in title_lower:
+            return default_brand
+    return ""
+
+
+def _variation_twister(variations: dict | None, asin: str) -> list:
+    """Build the twister options from the embedded variation data.
+    The options are the variants that differ from the product in a single dimension,
+    the same ones the page shows in its twister."""
+    if not variations:
+        return []
+    dimensions = variations.get("dimensions") or []
+    values = variations.get("values") or {}
+    current = values.get(asin)
+    if not current or len(current) != len(dimensions):
+        return []
+
+    twister_list = list()
+    for option_asin, option_values in values.items():
+        if option_asin == asin or len(option_values) != len(dimensions):
+            continue
+        differences = [
+            index for index, (value, option_value) in enumerate(zip(current, option_values))
+            if value != option_value]
+        if len(differences) == 1:
+            twister_list.append({
+                "type": dimensions[differences[0]],
+                "asin": option_asin,
+                "name": option_values[differences[0]].lower().strip()
+            })
+    return twister_list
+
+
+def build_product(
+        raw: dict,
+        asin: str,
+        url: str,
+        default_brands: list,
+        ranking: int = 0) -> tuple:
+    """Build the product dictionary from the raw fields of a product page.
+    It returns a tuple with the product (or None if the product must be discarded) and the logs.
+    It raises TransientScrapingError, with the logs as message, if the page was not fully loaded."""
+    colors = config["colors"]
+    logs = ''
+
+    # Initialize the product dictionary with default values
+    product = {
+        "asin": asin,
+        "price": 0,
+        "url": url,
+        "brand": "",
+        "image": "",
+        "ranking": ranking,
+    }
+
+    # Check if the product belongs to the celphone category
+    breadcrumbs = raw.get("breadcrumbs")
+    if breadcrumbs is None:
+        logs += f'[{asin}] {colors["green"]}No breadcrumbs.{colors["reset"]}\n'
+    elif any(breadcrumb in breadcrumbs.lower() for breadcrumb in ALLOWED_BREADCRUMBS):
+        logs += f'[{asin}] {colors["green"]}Celphone.{colors["reset"]}\n'
+    else:
+        logs += f'[{asin}] {colors["red"]}Not a celphone.{colors["reset"]}\n'
+        return None, logs
+
+    # Product title
+    title = raw.get("title")
+    if title is None:
+        logs += f'[{asin}] {colors["red"]}No load.{colors["reset"]}\n'
+        raise TransientScrapingError(logs)
+    if title == '':
+        logs += f'[{asin}] {colors["red"]}Not a celphone.{colors["reset"]}\n'
+        return None, logs
+    product["title"] = title.replace("\n", "").replace("''", "\"").strip()
+    logs += f'[{asin}] {colors["green"]}Product title.{colors["reset"]}\n'
+
+    # Product images
+    image = raw.get("image")
+    if image is not None:
+        if image["alt"].strip() == '':
+            if len(product["title"]) > 100:
+                alt_image = product['title'][:100].strip()
+                splited_alt = alt_image.split(' ')
+                product["alt"] = " ".join(
+                    splited_alt[:-1]).lower().strip() + ' image'
+            else:
+                product["alt"] = f"{product['title'].strip()}_image"
+        image_link = image["src"]
+        if not any(forbidden_image in image_link for forbidden_image in FORBIDDEN_IMAGES):
+            image_split = image_link.split('_')
+            if len(image_split) > 1:
+                image_split[-2] = f"{image_split[-2][:2]}679"
+            product["image"] = '_'.join(image_split)
+    if raw.get("image_layout") == "regular":
+        logs += f'[{asin}] {colors["green"]}Images.{colors["reset"]}\n'
+    else:
+        logs += f'[{asin}] {colors["red"]}No images.{colors["reset"]}\n'
+
+    # Product price
+    price = raw.get("price")
+    if price is None:
+        logs += f'[{asin}] {colors["red"]}No price.{colors["reset"]}\n'
+    else:
+        try:
+            # Combine whole and fractional parts to form the complete price
+            product["price"] = float(
+                f"{price['whole'].replace(',', '').rstrip('.')}.{price['fraction'].replace('.', '')}")
+            logs += f'[{asin}] {colors["green"]}Price.{colors["reset"]}\n'
+        except ValueError:
+            logs += f'[{asin}] {colors["red"]}No price.{colors["reset"]}\n'
+            raise TransientScrapingError(logs)
+
+    # Basis price and saving percentage
+    basis_price = raw.get("basis_price")
+    if basis_price is None:
+        logs += f'[{asin}] {colors["red"]}No basis price.{colors["reset"]}\n'
+    else:
+        try:
+            basis_price_filtered = basis_price.split('\n')
+            product["basis_price"] = float(
+                basis_price_filtered[-1].replace('$', '').replace(',', ''))
+            logs += f'[{asin}] {colors["green"]}Basis price.{colors["reset"]}\n'
+        except ValueError as e:
+            logs += f'[{asin}] {colors["red"]}[ERROR] Basis price: {e}{colors["reset"]}\n'
+
+    # Product twister ASIN, from the variation data or else from the twister elements
+    twister_list = _variation_twister(raw.get("variations"), asin)
+    for option in [] if twister_list else raw.get("twister") or []:
+        if option["asin"] == asin:
+            continue
+        if option["type"] == 'color_name':
+            name = option.get("alt") or ""
+        else:
+            name = option.get("swatch") or ""
+        twister_list.append({
+            "type": option["type"],
+            "asin": option["asin"],
+            "name": name.lower().strip()
+        })
+    if len(twister_list):
+        product["twister"] = twister_list
+        logs += f'[{asin}] {colors["green"]}Twister.{colors["reset"]}\n'
+    else:
+        logs += f'[{asin}] {colors["red"]}No Twister.{colors["reset"]}\n'
+
+    # Product overview
+    overview = raw.get("overview")
+    for feature_name, feature in overview or []:
+        feature_name = feature_name.lower().strip()
+        feature = feature.lower().strip()
+        if feature_name not in SPECIFIED_FEATURES:
+            continue
+        if feature_name == "marca":
+            if not any(default_brand in feature for default_brand in default_brands):
+                logs += f'[{asin}] {colors["red"]}Not a specified brand.{colors["reset"]}\n'
+                return None, logs
+            feature = feature.split(" ")[0]
+        product[SPECIFIED_FEATURES[feature_name]] = feature
+
+    if product["brand"] == "":
+        product["brand"] = _infer_brand(product["title"], default_brands)
+    if product["brand"] == "":
+        logs += f'[{asin}] {colors["red"]}Not a specified brand.{colors["reset"]}\n'
+        return None, logs
+
+    if overview is None:
+        logs += f'[{asin}] {colors["red"]}No product overview.{colors["reset"]}\n'
+    else:
+        logs += f'[{asin}] {colors["green"]}Product overview.{colors["reset"]}\n'
+
+    # Product opinions
+    opinions = raw.get("opinions")
+    if opinions is None:
+        logs += f'[{asin}] {colors["red"]}No opinion.{colors["reset"]}\n'
+    else:
+        for header, value in opinions:
+            if header.lower() == CUSTOMERS_OPINION:
+                try:
+                    product["customers_opinion"] = float(
+                        value.lower().split('\n')[-1].split(' ')[0])
+                except ValueError as e:
+                    logs += f'[{asin}] {colors["red"]}[ERROR] Opinions: {e}{colors["reset"]}\n'
+        logs += f'[{asin}] {colors["green"]}Opinion.{colors["reset"]}\n'
+
+    return product, logs
+
+
+def parse_product_page(
+        html: str | bytes,
+        asin: str,
+        url: str,
+        default_brands: list,
+        ranking: int = 0) -> tuple:
+    """Parse a product page and return the product (or None) and the logs."""
+    return build_product(
+        extract_product_fields(html),
+        asin=asin,
+        url=url,
+        default_brands=default_brands,
+        ranking=ranking
+    )
+
+
+def parse_search_page(
+        html: str | bytes,
+        amazon_url: str,
+        asins_to_update: set | frozenset) -> tuple:
+    """Parse a search results page.
+    It returns the new ASINs found, the products data of the search cards and the logs."""
+    colors = config["colors"]
+    soup = BeautifulSoup(html, "html.parser")
+    logs = ''
+    asins_list = list()
+    products_list = list()
+
+    for item in soup.find_all(class_="s-asin"):
+        product = {
+            "asin": "",
+            "price": 0,
+            "url": "",
+            "image": "",
+            "basis_price": 0,
+            "alt": "",
+            "title": "",
+            "customers_opinion": 0,
+            "ranking": 0
+        }
+        data_asin = item.get("data-asin")
+        product["asin"] = data_asin
+
+        title_instructions = item.select_one('div[data-cy="title-recipe"]')
+        if title_instructions is None:
+            continue
+        title = _text(title_instructions.find("h2")).lower()
+        if any(word in title for word in TITLES_FILTER):
+            continue
+        product["title"] = title
+
+        if data_asin not in asins_to_update:
+            asins_list.append(data_asin)
+
+        link = title_instructions.find("a")
+        base_url = link.get("href") if link is not None else ""
+        if not base_url:
+            product["url"] = f"{amazon_url}/dp/{data_asin}"
+        else:
+            if base_url.startswith("/"):
+                base_url = f"{amazon_url}{base_url}"
+            product["url"] = "/".join(base_url.split("/")[0:6])
+
+        # Check for color variations of the product
+        for color in item.find_all(class_="s-color-swatch-pad"):
+            color_div = color.find("div")
+            color_link = color_div.get(
+                "data-csa-c-swatch-url") if color_div is not None else None
+            if not color_link:
+                continue
+            color_asin = color_link.split("/")[3]
+            if color_asin not in asins_to_update:
+                asins_list.append(color_asin)
+
+        image_element = item.find("img")
+        if image_element is not None:
+            product["image"] = image_element.get("src") or ""
+            product["alt"] = (image_element.get("alt") or "").replace(
+                'Anuncio patrocinado: ', '')
+
+        price_link = item.select_one("a[aria-describedby='price-link']")
+        if price_link is not None:
+            prices = price_link.find_all(class_="a-offscreen")
+            try:
+                product["price"] = float(
+                    _text(prices[0]).replace("$", "").replace(",", ""))
+                if len(prices) > 2:
+                    product["basis_price"] = float(
+                        _text(prices[2]).replace("$", "").replace(",", ""))
+            except (IndexError, ValueError) as e:
+                logs += f"{colors['red']}[ERROR] No price found ({data_asin}): {str(e)}.{colors['reset']}\n"
+
+        customers_opinion_raw = item.find(class_="a-icon-alt")
+        if customers_opinion_raw is not None:
+            try:
+                product["customers_opinion"] = float(
+                    _text(customers_opinion_raw).split(" ")[0])
+            except ValueError as e:
+                logs += f"{colors['red']}[ERROR] Error finding customers opinion({data_asin}): {str(e)}.{colors['reset']}\n"
+
+        products_list.append(product)
+
+    return asins_list, products_list, logs
+
+
+def parse_search_next(html: str | bytes, amazon_url: str) -> str | None:
+    """Return the URL of the next search results page (None on the last page)."""
+    soup = BeautifulSoup(html, "html.parser")
+    next_page = soup.select_one(".s-pagination-next")
+    if next_page is None or "s-pagination-disabled" in (next_page.get("class") or []) \
+            or not next_page.get("href"):
+        return None
+    return urljoin(amazon_url, next_page["href"])
+
+
+def parse_top_page(html: str | bytes) -> dict:
+    """Parse a top 100 page and return the ranking of each ASIN."""
+    soup = BeautifulSoup(html, "html.parser")
+    rankings = dict()
+    for top_element in soup.find_all(id="gridItemRoot"):
+        badge = top_element.find(class_="zg-bdg-text")
+        spans = top_element.find_all("span")
+        if badge is None or len(spans) < 2:
+            continue
+        asin_div = spans[1].find("div")
+        if asin_div is None or not asin_div.get("id"):
+            continue
+        try:
+            rankings[asin_div["id"]] = int(
+                _text(badge).lower().replace("#", ""))
+        except ValueError:
+            continue
+    return rankings
+
+
+def _warm_worker() -> None:
+    """Initializer for the parser processes. Import and exercise BeautifulSoup once."""
+    BeautifulSoup("<html><body></body></html>", "html.parser")
+
+
+def _noop() -> None:
+    """Task used to force the creation of the parser processes."""
+    return None
+
+
+class HtmlParserPool():
+    """Pool of worker processes to parse raw HTML pages."""
+
+    def __init__(self, workers: int | None = None):
+        """Initialize the parser pool and warm up its worker processes."""
+        self.colors = config["colors"]
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_warm_worker
+        )
+        # Start every worker process before the first page arrives
+        for future in [self.executor.submit(_noop) for _ in range(self.workers)]:
+            future.result()
+        print(
+            f"{self.colors['purple']}HTML parser pool started ({self.workers} processes).{self.colors['reset']}")
+
+    def submit(self, function, *args) -> Future:
+        """Run any picklable function in the parser processes."""
+        return self.executor.submit(function, *args)
+
+    def submit_product(
+            self,
+            html: bytes,
+            asin: str,
+            url: str,
+            default_brands: list,
+            ranking: int = 0) -> Future:
+        """Submit a product page to be parsed. The future returns (product, logs)."""
+        return self.executor.submit(
+            parse_product_page, html, asin, url, default_brands, ranking)
+
+    def submit_search(
+            self,
+            html: bytes,
+            amazon_url: str,
+            asins_to_update: set | frozenset) -> Future:
+        """Submit a search page to be parsed. The future returns (asins, products, logs).
+        The known ASINs are filtered out here, so the set is not sent with every page."""
+        result = Future()
+
+        def filter_known(future: Future) -> None:
+            try:
+                asins, products, logs = future.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            result.set_result(
+                ([asin for asin in asins if asin not in asins_to_update], products, logs))
+
+        self.executor.submit(
+            parse_search_page, html, amazon_url, frozenset()).add_done_callback(filter_known)
+        return result
+
+    def parse_products(self, pages: Iterable[dict], default_brands: list) -> list:
+        """Parse many product pages (dicts with html, asin, url and ranking) and return the products."""
+        products = list()
+        futures = [
+            self.submit_product(
+                page["html"], page["asin"], page["url"], default_brands, page.get("ranking", 0))
+            for page in pages
+        ]
+        for future in futures:
+            try:
+                product, logs = future.result()
+            except TransientScrapingError as e:
+                print(e)
+                continue
+            print(logs)
+            if product:
+                products.append(product)
+        return products
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        print(
+            f"{self.colors['purple']}HTML parser pool closed.{self.colors['reset']}")
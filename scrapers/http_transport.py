@@ -0,0 +1,87 @@
+"""
+http_transport.py
+This module contains the HTTP transport of the hybrid mode. A browser session gets the site
+session to a normal state (interstitial pages, locale) and its cookies and headers are handed
+to a keep-alive HTTP client, which fetches the product and search pages without the browser.
+The pages are classified like `PAGE_PROBE_SCRIPT` does in the browser, so the scrapers fall
+back to the browser when the HTTP client gets an interstitial page.
+"""
+import re
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from config import config
+from .base_amazon_scraper import (
+    PAGE_AUTH,
+    PAGE_INTERSTITIAL,
+    PAGE_NORMAL,
+    PAGE_THROTTLE
+)
+
+NAVBAR_PATTERN = re.compile(r'id="(?:navbar|nav-main|nav-belt)"')
+
+
+def classify_page(html: str, status: int = 200) -> str:
+    """Classify a page fetched without a browser as normal, interstitial, auth or throttle."""
+    if status in (429, 503):
+        return PAGE_THROTTLE
+    if "auth-workflow" in html:
+        return PAGE_AUTH
+    navbar = NAVBAR_PATTERN.search(html) is not None
+    if "validateCaptcha" in html or (not navbar and "a-button-text" in html):
+        return PAGE_INTERSTITIAL
+    if not navbar and "<pre" in html:
+        return PAGE_THROTTLE
+    return PAGE_NORMAL
+
+
+class HttpTransport():
+    """Keep-alive HTTP client with the cookies and headers of a browser session."""
+
+    def __init__(self, timeout: float | None = None):
+        self.colors: dict = config["colors"]
+        self.timeout: float = timeout or config["http_timeout"]
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        # The client has the cookies of a session in a normal state
+        self.ready: bool = False
+
+    def adopt(self, driver) -> None:
+        """Take the cookies and headers of a browser session."""
+        user_agent, language = driver.execute_script(
+            "return [navigator.userAgent, navigator.language];")
+        self.session.cookies.clear()
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"))
+        self.session.headers.update({
+            "User-Agent": user_agent,
+            "Accept-Language": f"{language},{language.split('-')[0]};q=0.9",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+        })
+        self.ready = True
+
+    def fetch(self, url: str, timeout: float | None = None) -> tuple:
+        """Fetch a page. It returns the state of the page and its HTML.
+        A page that is not normal sends the scraper back to the browser."""
+        try:
+            response = self.session.get(url, timeout=timeout or self.timeout)
+        except RequestException as e:
+            print(
+                f"{self.colors['red']}[ERROR] HTTP transport: {e}{self.colors['reset']}")
+            self.ready = False
+            return PAGE_THROTTLE, None
+        state = classify_page(response.text, response.status_code)
+        if state != PAGE_NORMAL:
+            print(
+                f"{self.colors['yellow']}HTTP transport got a {state} page, back to the browser.{self.colors['reset']}")
+            self.ready = False
+        return state, response.content
+
+    def close(self) -> None:
+        self.session.close()
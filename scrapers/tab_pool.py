@@ -0,0 +1,90 @@
+"""
+tab_pool.py
+This module contains the tab pool of the multi-tab pipelining. A browser session keeps several
+tabs (window handles) and the next products start loading in the free tabs while the scraper
+reads the current one, so the page loads of a session overlap with the waits and the extraction.
+The tabs don't take grid slots. The pool belongs to a single scraper thread and follows its
+current session: the tabs of a recycled or recreated session are dropped with it.
+"""
+
+# Start the navigation without waiting for the page. The flag tells the old document
+# from the new one, which doesn't have it.
+PREFETCH_SCRIPT = "window.scraperPrefetched = true; window.location.href = arguments[0];"
+
+# The new document of a prefetched tab finished loading
+PAGE_READY_SCRIPT = "return !window.scraperPrefetched && document.readyState === 'complete';"
+
+
+class TabPool():
+    """Window handles of a session, each one loading a page ahead of the scraper."""
+
+    def __init__(self, size: int):
+        self.size: int = size
+        self.driver = None
+        self.handles: list = list()
+        self.current: str | None = None
+        # key: handle of the tab where the page of the item is loading
+        self.loading: dict = dict()
+
+    def bind(self, driver) -> None:
+        """Follow the session of the scraper. A new session starts with its own tab only."""
+        if driver is self.driver:
+            return
+        self.driver = driver
+        self.current = driver.current_window_handle
+        self.handles = [self.current]
+        self.loading = dict()
+
+    def _switch(self, handle: str) -> None:
+        # Every switch is a round trip, so it is only sent when the tab changes
+        if handle != self.current:
+            self.driver.switch_to.window(handle)
+            self.current = handle
+
+    def _free_handle(self) -> str | None:
+        """Return a tab that is not loading an item (the current one first), opening one
+        while the pool is not full."""
+        busy = set(self.loading.values())
+        if self.current not in busy:
+            return self.current
+        for handle in self.handles:
+            if handle not in busy:
+                return handle
+        if len(self.handles) < self.size:
+            self.driver.switch_to.new_window("tab")
+            self.current = self.driver.current_window_handle
+            self.handles.append(self.current)
+            return self.current
+        return None
+
+    def retain(self, keys) -> None:
+        """Free the tabs of the items that are not among the keys (scraped another way)."""
+        for key in [key for key in self.loading if key not in keys]:
+            del self.loading[key]
+
+    def prefetch(self, driver, key: str, url: str) -> bool:
+        """Start loading the page of an item in a free tab. It returns False if there is none."""
+        self.bind(driver)
+        if key in self.loading:
+            return True
+        handle = self._free_handle()
+        if handle is None:
+            return False
+        self._switch(handle)
+        self.driver.execute_script(PREFETCH_SCRIPT, url)
+        self.loading[key] = handle
+        return True
+
+    def take(self, driver, key: str) -> bool:
+        """Switch to the tab of an item. It returns True if its page was prefetched there,
+        otherwise the tab is free for loading the page (the last prefetch is dropped if
+        every tab is busy)."""
+        self.bind(driver)
+        handle = self.loading.pop(key, None)
+        prefetched = handle is not None
+        if not prefetched:
+            handle = self._free_handle()
+            if handle is None:
+                handle = self.loading.pop(list(self.loading)[-1])
+        self._switch(handle)
+        return prefetched
@@ -0,0 +1,134 @@
+import pytest
+
+import scrapers.amazon_scraper_manager as manager_module
+from scrapers import AmazonScraperManager
+from utils import AsinMirror, TokenManager
+
+
+@pytest.fixture
+def mirror() -> AsinMirror:
+    mirror = AsinMirror()
+    yield mirror
+    mirror.close()
+
+
+class FakeApi():
+    """Pages of ASINs returned by the API, for the full and the delta syncs."""
+
+    def __init__(self, full: list, delta: dict | None = None, page_size: int = 2):
+        self.full = full
+        self.delta = delta
+        self.page_size = page_size
+        self.calls: list = list()
+
+    def __call__(self, func, endpoint, **options) -> dict:
+        params = options["params"]
+        self.calls.append(dict(params))
+        if "since" in params:
+            return self.delta
+        start = (params["page"] - 1) * self.page_size
+        return {
+            "asins": self.full[start:start + self.page_size],
+            "total": len(self.full)
+        }
+
+
+@pytest.fixture
+def manager(mirror) -> AmazonScraperManager:
+    manager = AmazonScraperManager.__new__(AmazonScraperManager)
+    manager.colors = {color: "" for color in ("red", "purple", "reset")}
+    manager.tokens = TokenManager()
+    manager.tokens.set_tokens("token")
+    manager.asin_mirror = mirror
+    manager.asins_page_size = 2
+    manager.asins_reconcile_hours = 24
+    return manager
+
+
+def test_upsert_and_deactivate(mirror):
+    assert mirror.upsert(["A1", "A2"]) == 2
+    assert mirror.upsert(["A2", "A3"]) == 1
+    mirror.deactivate(["A1"])
+    assert mirror.active_asins() == {"A2", "A3"}
+
+    # A deactivated ASIN returned again by the API is tracked again
+    assert mirror.upsert(["A1"]) == 0
+    assert mirror.active_asins() == {"A1", "A2", "A3"}
+
+
+def test_deactivate_missing(mirror):
+    mirror.upsert(["A1", "A2", "A3"])
+    assert mirror.deactivate_missing({"A1", "A3"}) == 1
+    assert mirror.active_asins() == {"A1", "A3"}
+
+
+def test_rows_ordered_by_staleness(mirror):
+    mirror.upsert(["A1", "A2", "A3"])
+    mirror.mark_scraped([{"asin": "A2", "price": 10}])
+    mirror.mark_scraped([{"asin": "A1", "price": 5}])
+    mirror.mark_scraped([{"asin": "A1", "price": 6}])
+    rows = mirror.rows()
+    assert [row["asin"] for row in rows] == ["A3", "A2", "A1"]
+    assert rows[2]["price_changes"] == 1
+    assert rows[2]["scrapes"] == 2
+
+
+def test_sync_times(mirror):
+    assert mirror.last_sync is None and mirror.last_full_sync is None
+    mirror.set_last_sync(10.0)
+    mirror.set_last_full_sync(5.0)
+    assert mirror.last_sync == 10.0
+    assert mirror.last_full_sync == 5.0
+
+
+def test_first_sync_is_full(manager, mirror):
+    mirror.upsert(["OLD"])
+    manager._api_request = FakeApi(["A1", "A2", "A3"])
+    manager._sync_asins()
+    assert mirror.active_asins() == {"A1", "A2", "A3"}
+    assert [call["page"] for call in manager._api_request.calls] == [1, 2]
+    assert mirror.last_full_sync is not None
+
+
+def test_delta_sync_applies_deleted(manager, mirror, monkeypatch):
+    monkeypatch.setattr(manager_module, "time", lambda: 1000.0)
+    mirror.upsert(["A1", "A2"])
+    mirror.set_last_sync(900.0)
+    mirror.set_last_full_sync(900.0)
+    manager._api_request = FakeApi(["A1"], delta={"asins": ["A3"], "deleted": ["A2"]})
+    manager._sync_asins()
+    assert "since" in manager._api_request.calls[0]
+    assert mirror.active_asins() == {"A1", "A3"}
+    assert mirror.last_sync == 1000.0
+    assert mirror.last_full_sync == 900.0
+
+
+def test_delta_without_deleted_falls_back_to_full_sync(manager, mirror, monkeypatch):
+    monkeypatch.setattr(manager_module, "time", lambda: 1000.0)
+    mirror.upsert(["A1", "A2"])
+    mirror.set_last_sync(900.0)
+    mirror.set_last_full_sync(900.0)
+    manager._api_request = FakeApi(["A1", "A3"], delta={"asins": ["A3"]})
+    manager._sync_asins()
+    assert "since" not in manager._api_request.calls[-1]
+    assert mirror.active_asins() == {"A1", "A3"}
+    assert mirror.last_full_sync == 1000.0
+
+
+def test_full_sync_after_the_reconcile_interval(manager, mirror, monkeypatch):
+    monkeypatch.setattr(manager_module, "time", lambda: 100000.0)
+    mirror.upsert(["A1", "A2"])
+    mirror.set_last_sync(99000.0)
+    mirror.set_last_full_sync(100000.0 - 24 * 3600)
+    manager._api_request = FakeApi(["A2"], delta={"asins": [], "deleted": []})
+    manager._sync_asins()
+    assert all("since" not in call for call in manager._api_request.calls)
+    assert mirror.active_asins() == {"A2"}
+
+
+def test_failed_sync_keeps_the_mirror(manager, mirror):
+    mirror.upsert(["A1"])
+    manager._api_request = lambda func, endpoint, **options: {"error": "unavailable"}
+    manager._sync_asins()
+    assert mirror.active_asins() == {"A1"}
+    assert mirror.last_sync is None
@@ -0,0 +1,30 @@
+import utils.deadline as deadline_module
+from utils import Deadline
+
+
+def test_without_seconds_it_never_expires():
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    assert not deadline.expired()
+    assert deadline.cap(30) == 30
+
+
+def test_child_never_ends_after_its_parent(monkeypatch):
+    monkeypatch.setattr(deadline_module, "monotonic", lambda: 100.0)
+    parent = Deadline(10)
+    assert Deadline(60, parent=parent).expires_at == 110.0
+    assert Deadline(5, parent=parent).expires_at == 105.0
+    assert Deadline(parent=parent).expires_at == 110.0
+
+
+def test_expiry_and_cap(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(deadline_module, "monotonic", lambda: now[0])
+    deadline = Deadline(10)
+    assert deadline.cap(30) == 10
+    now[0] = 108.0
+    assert deadline.cap(1) == 1
+    assert not deadline.expired()
+    now[0] = 111.0
+    assert deadline.expired()
+    assert deadline.remaining() == 0
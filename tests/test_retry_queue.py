@@ -0,0 +1,35 @@
+import utils.retry_queue as retry_queue_module
+from utils import RetryQueue
+
+
+def test_backoff_and_give_up(monkeypatch):
+    monkeypatch.setattr(retry_queue_module, "uniform", lambda low, high: 1.0)
+    monkeypatch.setattr(retry_queue_module, "time", lambda: 1000.0)
+    queue = RetryQueue(max_attempts=2, base_delay=10, max_delay=15)
+
+    assert queue.push("A1", 3, "timeout")
+    assert queue.next_delay(now=1000.0) == 10
+    assert queue.pop_ready(now=1005.0) is None
+    assert queue.pop_ready(now=1010.0) == ("A1", 3)
+
+    # The delay doubles up to its limit
+    assert queue.push("A1", 3, "timeout")
+    assert queue.next_delay(now=1000.0) == 15
+    assert queue.pop_ready(now=1015.0) == ("A1", 3)
+
+    assert not queue.push("A1", 3, "timeout")
+    assert len(queue) == 0
+    assert queue.report()["exhausted"] == 1
+
+
+def test_report():
+    queue = RetryQueue(max_attempts=3, base_delay=0.01, max_delay=0.01)
+    queue.push("A1", 0)
+    queue.succeeded("A1")
+    queue.succeeded("A2")
+    queue.failed_permanently("A3")
+    report = queue.report()
+    assert report["queued"] == 1
+    assert report["recovered"] == 1
+    assert report["permanent"] == 1
+    assert report["pending"] == 1
@@ -0,0 +1,57 @@
+import base64
+import json
+import threading
+
+import pytest
+
+from custom_exceptions import TokenExpiredError
+from utils import TokenManager
+
+
+def jwt(claims: dict) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def test_decode_expiry():
+    assert TokenManager.decode_expiry(jwt({"exp": 1700000000})) == 1700000000.0
+    assert TokenManager.decode_expiry(jwt({"sub": "user"})) is None
+    assert TokenManager.decode_expiry("not-a-jwt") is None
+    assert TokenManager.decode_expiry("a.%%%.c") is None
+
+
+def test_rejected_token_without_login_raises():
+    tokens = TokenManager()
+    tokens.refresh_endpoint = None
+    tokens.set_tokens("token", "refresh")
+    with pytest.raises(TokenExpiredError):
+        tokens.invalidate("token")
+    # The refresh token is never used as the access token
+    assert tokens.token != "refresh"
+
+
+def test_login_runs_once_and_without_the_token_lock():
+    logins = list()
+
+    def login():
+        assert not tokens.lock._is_owned()
+        logins.append(threading.current_thread().name)
+        tokens.set_tokens("new")
+
+    tokens = TokenManager(login_callback=login)
+    tokens.refresh_endpoint = None
+    tokens.set_tokens("old", "refresh")
+    threads = [threading.Thread(target=tokens.invalidate, args=("old",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(logins) == 1
+    assert tokens.get_header() == {"Authorization": "Bearer new"}
+
+
+def test_stale_invalidation_is_ignored():
+    tokens = TokenManager(login_callback=lambda: pytest.fail("unexpected login"))
+    tokens.set_tokens("current")
+    tokens.invalidate("previous")
+    assert tokens.token == "current"
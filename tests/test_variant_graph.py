@@ -0,0 +1,36 @@
+from utils import VariantGraph
+
+
+def option(asin: str, option_type: str, name: str) -> dict:
+    return {"asin": asin, "type": option_type, "name": name}
+
+
+def test_families_are_merged():
+    graph = VariantGraph()
+    graph.add("A", [option("B", "color", "Blue")])
+    graph.add("C", [option("D", "size", "L")])
+    assert graph.family_of("A") == {"A", "B"}
+    assert graph.family_of("X") == {"X"}
+
+    graph.add("B", [option("C", "size", "M")])
+    assert graph.family_of("D") == {"A", "B", "C", "D"}
+
+
+def test_twister_completed_from_the_siblings():
+    graph = VariantGraph()
+    graph.add("A", [option("B", "color", "Blue")])
+    graph.add("C", [option("A", "color", "Red")])
+    graph.add("B", [option("C", "color", "Green"), option("A", "color", "Red")])
+    assert graph.twister_of("B") == [option("C", "color", "Green"), option("A", "color", "Red")]
+    # A product scraped without its twister takes the options that point to it
+    graph.add("D", [])
+    graph.add("A", [option("D", "size", "L")])
+    assert graph.twister_of("D") == [option("A", "size", "")]
+
+
+def test_expand_keeps_the_best_ranking():
+    graph = VariantGraph()
+    graph.add("A", [option("V1", "color", "Blue"), option("B", "color", "Red")])
+    graph.add("B", [option("V1", "color", "Blue"), option("V2", "size", "L")])
+    assert graph.expand({"A": 3, "B": 1}) == {"V1": 1, "V2": 1}
+    assert graph.expand({"A": 3}) == {"V1": 3, "B": 3}
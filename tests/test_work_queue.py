@@ -0,0 +1,165 @@
+import pytest
+
+import utils.work_queue as work_queue
+from utils import QueueFeed, SqliteWorkQueue, open_work_queue
+
+
+class Clock():
+    """Replaces the time of the work queue module."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(work_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(clock) -> SqliteWorkQueue:
+    queue = SqliteWorkQueue(":memory:", visibility_timeout=60, dedup_window=3600)
+    yield queue
+    queue.close()
+
+
+def states(queue: SqliteWorkQueue) -> dict:
+    return dict(queue.connection.execute("SELECT key, state FROM tasks"))
+
+
+def test_lease_and_ack(queue):
+    assert queue.put("asin", "brand", ["A1", "A2", "A3"]) == 3
+    tasks = queue.lease("asin", "w1", limit=2, group="brand")
+    assert [task["key"] for task in tasks] == ["A1", "A2"]
+    assert all(task["attempts"] == 1 for task in tasks)
+    assert queue.available("asin", "brand") == 1
+
+    queue.ack([tasks[0]["id"]])
+    assert states(queue) == {"A1": "done", "A2": "leased", "A3": "pending"}
+    assert queue.groups("asin") == ["brand"]
+
+
+def test_release_makes_the_task_available(queue):
+    queue.put("asin", "brand", ["A1"])
+    task = queue.lease("asin", "w1")[0]
+    assert queue.lease("asin", "w2") == []
+
+    queue.release([task["id"]])
+    again = queue.lease("asin", "w2")
+    assert [t["key"] for t in again] == ["A1"]
+    assert again[0]["attempts"] == 2
+
+
+def test_expired_lease_is_leased_again(queue, clock):
+    queue.put("asin", "brand", ["A1"])
+    task = queue.lease("asin", "w1")[0]
+
+    clock.now += 30
+    assert queue.lease("asin", "w2") == []
+    clock.now += 31
+    again = queue.lease("asin", "w2")
+    assert [t["id"] for t in again] == [task["id"]]
+    assert again[0]["attempts"] == 2
+
+
+def test_extend_keeps_the_lease(queue, clock):
+    queue.put("asin", "brand", ["A1"])
+    task = queue.lease("asin", "w1")[0]
+
+    clock.now += 50
+    queue.extend([task["id"]])
+    clock.now += 50
+    assert queue.lease("asin", "w2") == []
+
+
+def test_release_ignores_done_tasks(queue):
+    queue.put("asin", "brand", ["A1"])
+    task = queue.lease("asin", "w1")[0]
+    queue.ack([task["id"]])
+    queue.release([task["id"]])
+    assert states(queue) == {"A1": "done"}
+
+
+def test_put_skips_queued_and_recently_done_tasks(queue, clock):
+    queue.put("asin", "brand", ["A1", {"A2": 5}])
+    assert queue.put("asin", "brand", ["A1", {"A2": 7}]) == 0
+
+    tasks = queue.lease("asin", "w1", limit=2)
+    queue.ack([task["id"] for task in tasks])
+    assert queue.put("asin", "brand", ["A1"]) == 0
+
+    # A task done before the dedup window belongs to an older run
+    clock.now += 3601
+    assert queue.put("asin", "brand", ["A1"]) == 1
+    again = queue.lease("asin", "w1")
+    assert [t["key"] for t in again] == ["A1"]
+    assert again[0]["attempts"] == 1
+
+
+def test_lease_by_group(queue):
+    queue.put("asin", "first", ["A1"])
+    queue.put("asin", "second", ["B1"])
+    assert [t["key"] for t in queue.lease("asin", "w1", group="second")] == ["B1"]
+    assert queue.available("asin", "first") == 1
+    assert queue.groups("asin") == ["first", "second"]
+
+
+def test_feed_acks_when_the_next_task_is_taken(queue):
+    queue.put("brand", None, ["b1", "b2"])
+    feed = iter(QueueFeed(queue, "brand", "w1", lease_size=2))
+    assert next(feed) == "b1"
+    assert states(queue) == {"b1": "leased", "b2": "leased"}
+    assert next(feed) == "b2"
+    assert states(queue)["b1"] == "done"
+    with pytest.raises(StopIteration):
+        next(feed)
+    assert states(queue) == {"b1": "done", "b2": "done"}
+
+
+def test_feed_releases_the_tasks_when_it_stops(queue):
+    queue.put("brand", None, ["b1", "b2", "b3"])
+    feed = iter(QueueFeed(queue, "brand", "w1", lease_size=3))
+    next(feed)
+    feed.close()
+    assert states(queue) == {"b1": "pending", "b2": "pending", "b3": "pending"}
+
+
+def test_feed_explicit_ack_and_release(queue):
+    queue.put("asin", "brand", ["A1", "A2", "A3"])
+    feed = QueueFeed(queue, "asin", "w1", group="brand", lease_size=3)
+    tasks = feed.tasks()
+    first_id, first = next(tasks)
+    next(tasks)
+    assert first == "A1"
+
+    feed.ack(first_id)
+    feed.release()
+    assert states(queue) == {"A1": "done", "A2": "pending", "A3": "pending"}
+    assert feed.pending == {}
+
+
+def test_feed_fail_gives_the_task_back_until_max_attempts(queue):
+    queue.put("asin", "brand", ["A1"])
+    feed = QueueFeed(queue, "asin", "w1", lease_size=1)
+    feed.max_attempts = 2
+
+    task_id, _ = next(feed.tasks())
+    feed.fail(task_id)
+    assert states(queue) == {"A1": "pending"}
+
+    task_id, _ = next(feed.tasks())
+    feed.fail(task_id)
+    assert states(queue) == {"A1": "done"}
+
+
+def test_open_work_queue(tmp_path):
+    queue = open_work_queue(f"sqlite:///{tmp_path / 'queue.db'}")
+    assert isinstance(queue, SqliteWorkQueue)
+    queue.close()
+    with pytest.raises(ValueError):
+        open_work_queue("redis://localhost/0")
@@ -0,0 +1,15 @@
+from .asin_mirror import AsinMirror
+from .command_stats import CommandStats
+from .deadline import Deadline
+from .token_manager import TokenManager
+from .page_archive import PageArchive, PageArchiveReader
+from .profiler import RunProfiler
+from .progress import ProgressTracker
+from .refresh_tiers import RefreshScheduler
+from .retry_queue import RetryQueue
+from .result_aggregator import ResultAggregator
+from .result_spool import ResultSpool
+from .session_store import SessionStore
+from .work_queue import QueueFeed, SqliteWorkQueue, WorkQueue, open_work_queue
+from .fixture_site import FixtureSite
+from .variant_graph import VariantGraph
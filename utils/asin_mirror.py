@@ -0,0 +1,152 @@
+"""
+ASIN Mirror
+This module keeps a local SQLite mirror of the ASINs tracked by the API, with the time of
+their last successful scrape. The mirror is refreshed by delta since the last sync, and the
+ASINs are returned ordered by staleness, so a run that is cut short has refreshed the
+oldest data first.
+"""
+
+import sqlite3
+import threading
+
+from pathlib import Path
+from time import time
+
+
+class AsinMirror():
+    """Local mirror of the tracked ASINs."""
+
+    def __init__(self, path: str = ":memory:"):
+        """Open (or create) the mirror database."""
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS asins (
+                    asin TEXT PRIMARY KEY,
+                    brand TEXT,
+                    active INTEGER NOT NULL DEFAULT 1,
+                    added_at REAL NOT NULL,
+                    last_scraped REAL,
+                    last_price REAL,
+                    price_changes INTEGER NOT NULL DEFAULT 0,
+                    scrapes INTEGER NOT NULL DEFAULT 0,
+                    ranking INTEGER NOT NULL DEFAULT 0
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )""")
+
+    def _get_time(self, key: str) -> float | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return float(row[0]) if row else None
+
+    def _set_time(self, key: str, timestamp: float) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, str(timestamp)))
+
+    @property
+    def last_sync(self) -> float | None:
+        """Time of the last successful sync with the API."""
+        return self._get_time("last_sync")
+
+    def set_last_sync(self, timestamp: float) -> None:
+        self._set_time("last_sync", timestamp)
+
+    @property
+    def last_full_sync(self) -> float | None:
+        """Time of the last full sync, the one that removes the ASINs deleted from the API."""
+        return self._get_time("last_full_sync")
+
+    def set_last_full_sync(self, timestamp: float) -> None:
+        self._set_time("last_full_sync", timestamp)
+
+    def upsert(self, asins: list) -> int:
+        """Add the ASINs to the mirror (or reactivate them). It returns how many were new."""
+        now = time()
+        with self.lock, self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO asins (asin, added_at) VALUES (?, ?)",
+                [(asin, now) for asin in asins])
+            added = self.connection.total_changes - before
+            self.connection.executemany(
+                "UPDATE asins SET active = 1 WHERE asin = ? AND active = 0",
+                [(asin,) for asin in asins])
+        return added
+
+    def deactivate(self, asins: list) -> None:
+        """Stop tracking the ASINs removed from the API."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE asins SET active = 0 WHERE asin = ?",
+                [(asin,) for asin in asins])
+
+    def deactivate_missing(self, asins: set) -> int:
+        """After a full sync, stop tracking the ASINs that the API no longer returns."""
+        with self.lock:
+            tracked = [row[0] for row in self.connection.execute(
+                "SELECT asin FROM asins WHERE active = 1")]
+        missing = [asin for asin in tracked if asin not in asins]
+        self.deactivate(missing)
+        return len(missing)
+
+    def mark_scraped(self, products: list) -> None:
+        """Record a successful scrape of the products (adding the ones not tracked yet)."""
+        now = time()
+        rows = [
+            (
+                product["asin"],
+                now,
+                now,
+                product.get("brand") or None,
+                product.get("price") or None,
+                product.get("ranking") or 0
+            )
+            for product in products if product.get("asin")
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany("""
+                INSERT INTO asins (asin, added_at, last_scraped, brand, last_price, scrapes, ranking)
+                VALUES (?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT (asin) DO UPDATE SET
+                    active = 1,
+                    last_scraped = excluded.last_scraped,
+                    brand = COALESCE(excluded.brand, brand),
+                    price_changes = price_changes + (
+                        excluded.last_price IS NOT NULL
+                        AND last_price IS NOT NULL
+                        AND excluded.last_price != last_price),
+                    last_price = COALESCE(excluded.last_price, last_price),
+                    scrapes = scrapes + 1,
+                    ranking = excluded.ranking
+            """, rows)
+
+    def active_asins(self) -> set:
+        """Return every active ASIN (the products that already exist in the API)."""
+        with self.lock:
+            return {row[0] for row in self.connection.execute(
+                "SELECT asin FROM asins WHERE active = 1")}
+
+    def rows(self) -> list:
+        """Return the active ASINs with their scrape history, ordered by staleness."""
+        with self.lock:
+            cursor = self.connection.execute("""
+                SELECT asin, last_scraped, ranking, price_changes, scrapes FROM asins
+                WHERE active = 1
+                ORDER BY last_scraped IS NOT NULL, last_scraped, added_at
+            """)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
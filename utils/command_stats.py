@@ -0,0 +1,131 @@
+"""
+Command Stats
+This module counts the WebDriver commands sent to the grid. Every command is an HTTP round
+trip to the hub, so the number of commands is most of the latency of a page. The commands and
+their time are counted by type, by scraper method and by page, and the pages of a kind can have
+a command budget (`COMMAND_BUDGETS`). In strict mode a page over its budget fails the run,
+so a round trip regression is caught by the benchmark before it reaches production.
+"""
+
+import sys
+import threading
+
+from time import perf_counter
+
+from config import config
+from custom_exceptions import CommandBudgetExceeded
+
+
+class CommandStats():
+    """Run-wide WebDriver command counters, with a command budget per page kind."""
+
+    def __init__(self, budgets: dict | None = None, strict: bool | None = None):
+        self.colors: dict = config["colors"]
+        self.budgets: dict = config["command_budgets"] if budgets is None else budgets
+        self.strict: bool = config["command_budget_strict"] if strict is None else strict
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        # name: [commands, seconds]
+        self.by_command: dict = dict()
+        self.by_method: dict = dict()
+        # kind: {pages, commands, max, seconds}
+        self.pages: dict = dict()
+        self.violations: list = list()
+
+    def wrap_driver(self, driver, scope: str) -> None:
+        """Count every command of a session. The method is the first caller
+        whose file is in the `scope` directory (the scrapers package)."""
+        execute = driver.execute
+        stats = self
+
+        def counted_execute(driver_command, params=None):
+            start = perf_counter()
+            try:
+                return execute(driver_command, params)
+            finally:
+                frame = sys._getframe(1)
+                while frame is not None and not frame.f_code.co_filename.startswith(scope):
+                    frame = frame.f_back
+                stats.record(
+                    driver,
+                    driver_command,
+                    frame.f_code.co_name if frame is not None else "-",
+                    perf_counter() - start)
+
+        driver.execute = counted_execute
+        driver.command_page = None
+
+    def record(self, driver, command: str, method: str, seconds: float) -> None:
+        with self.lock:
+            for counters, key in ((self.by_command, command), (self.by_method, method)):
+                counter = counters.setdefault(key, [0, 0.0])
+                counter[0] += 1
+                counter[1] += seconds
+            page = getattr(driver, "command_page", None)
+            if page is not None:
+                page["commands"] += 1
+                page["seconds"] += seconds
+
+    def start_page(self, driver, kind: str, key: str) -> None:
+        """Count the next commands of the session in a new page (it ends the current one)."""
+        self.end_page(driver)
+        driver.command_page = {"kind": kind, "key": key, "commands": 0, "seconds": 0.0}
+
+    def end_page(self, driver) -> None:
+        """Close the current page of the session and check its budget."""
+        page = getattr(driver, "command_page", None)
+        if page is None:
+            return
+        driver.command_page = None
+        budget = self.budgets.get(page["kind"])
+        with self.lock:
+            totals = self.pages.setdefault(
+                page["kind"], {"pages": 0, "commands": 0, "max": 0, "seconds": 0.0})
+            totals["pages"] += 1
+            totals["commands"] += page["commands"]
+            totals["max"] = max(totals["max"], page["commands"])
+            totals["seconds"] += page["seconds"]
+            if budget and page["commands"] > budget:
+                self.violations.append(page)
+        if budget and page["commands"] > budget:
+            print(
+                f"{self.colors['yellow']}[{page['key']}] {page['commands']} WebDriver commands in a {page['kind']} page (budget {budget}).{self.colors['reset']}")
+
+    def report(self, reset: bool = False) -> dict:
+        """Return the counters of the run."""
+        with self.lock:
+            report = {
+                "by_command": {key: list(value) for key, value in self.by_command.items()},
+                "by_method": {key: list(value) for key, value in self.by_method.items()},
+                "pages": {key: dict(value) for key, value in self.pages.items()},
+                "violations": list(self.violations)
+            }
+            if reset:
+                self._reset()
+        return report
+
+    def print_report(self, report: dict | None = None) -> None:
+        report = report or self.report()
+        for title, counters in (("command", report["by_command"]), ("method", report["by_method"])):
+            top = sorted(counters.items(), key=lambda item: item[1][1], reverse=True)[:8]
+            print(
+                f"{self.colors['purple']}WebDriver commands by {title}: " + ", ".join(
+                    f"{key} {count} ({seconds:.0f}s)" for key, (count, seconds) in top) + f"{self.colors['reset']}")
+        for kind, totals in report["pages"].items():
+            print(
+                f"{self.colors['purple']}{kind.title()} pages: {totals['pages']}, "
+                f"{totals['commands'] / totals['pages']:.1f} commands/page (max {totals['max']}), "
+                f"{totals['seconds'] / totals['pages']:.2f}s in commands/page{self.colors['reset']}")
+
+    def check(self, report: dict | None = None) -> None:
+        """In strict mode, fail if a page went over its command budget."""
+        report = report or self.report()
+        if not self.strict or not report["violations"]:
+            return
+        worst = max(report["violations"], key=lambda page: page["commands"])
+        raise CommandBudgetExceeded(
+            f"{len(report['violations'])} pages over their WebDriver command budget "
+            f"(worst: {worst['kind']} page {worst['key']} with {worst['commands']} commands, "
+            f"budget {self.budgets[worst['kind']]}).")
@@ -0,0 +1,32 @@
+"""
+Deadline
+This module contains the deadlines of the run. A deadline can be nested in a parent one
+(page load in the item, item in the phase, phase in the run budget) and it never ends after
+its parent, so every wait of a scraper can be capped by the time left of the whole run.
+"""
+
+from time import monotonic
+
+
+class Deadline():
+    """Point in time after which no new work is started. Without seconds it never expires."""
+
+    def __init__(self, seconds: float | None = None, parent: "Deadline | None" = None):
+        self.expires_at: float | None = monotonic() + seconds if seconds else None
+        if parent is not None and parent.expires_at is not None:
+            if self.expires_at is None or parent.expires_at < self.expires_at:
+                self.expires_at = parent.expires_at
+
+    def remaining(self) -> float | None:
+        """Seconds left (None if the deadline never expires)."""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - monotonic(), 0)
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and monotonic() >= self.expires_at
+
+    def cap(self, seconds: float) -> float:
+        """Cap a timeout to the time left."""
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
@@ -0,0 +1,129 @@
+"""
+Fixture Site
+This module serves product pages from a local HTTP server, so the scrapers can be measured
+without sending traffic to Amazon. The pages are the product pages of the page archive when
+it has any, or a synthetic product page with every field read by the scrapers.
+The grid nodes must be able to reach the server (`FIXTURE_HOST`).
+"""
+
+import re
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import config
+from .page_archive import PageArchiveReader
+
+SYNTHETIC_PRODUCT_PAGE = """<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+<div id="navbar">Fixture</div>
+<div id="wayfinding-breadcrumbs_feature_div">
+    <ul><li>Electrónicos</li><li>Celulares y Smartphones Desbloqueados</li></ul>
+</div>
+<span id="productTitle">{title}</span>
+<div class="regularAltImageViewLayout">
+    <img src="https://m.media-amazon.com/images/I/fixture._AC_US40_.jpg" alt="">
+    <img src="https://m.media-amazon.com/images/I/fixture._AC_US40_.jpg" alt="">
+</div>
+<div id="corePriceDisplay_desktop_feature_div">
+    <span class="a-price-whole">{whole}<span class="a-price-decimal">.</span></span>
+    <span class="a-price-fraction">{fraction}</span>
+    <span class="basisPrice">Precio de lista: <span>${basis}</span></span>
+</div>
+<div id="twister-plus-inline-twister">
+    <ul data-a-button-group='{{"name":"color_name"}}'>
+        <li data-asin="{asin}"><img alt="Negro"></li>
+        <li data-asin="{sibling}"><img alt="Azul"></li>
+    </ul>
+</div>
+<div id="productOverview_feature_div">
+    <table>
+        <tr><td>Marca</td><td>Samsung</td></tr>
+        <tr><td>Nombre del modelo</td><td>Galaxy Fixture</td></tr>
+        <tr><td>Color</td><td>Negro</td></tr>
+    </table>
+</div>
+</body>
+</html>
+"""
+
+
+def synthetic_asins(count: int) -> list:
+    return [f"FIX{index:07d}" for index in range(count)]
+
+
+class FixtureSite():
+    """Local HTTP server with product pages at `/dp/<asin>`."""
+
+    def __init__(self, archive_path: str | None = None, host: str | None = None, port: int | None = None):
+        """Load the archived product pages (if any) and start the server in a background thread."""
+        self.colors: dict = config["colors"]
+        self.pages: dict = dict()
+        if archive_path:
+            reader = PageArchiveReader(archive_path)
+            for entry in reader.iter_index(kinds=("product",)):
+                self.pages[entry["key"]] = entry
+            self.reader = reader
+
+        pages = self.pages
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = re.match(r"^/dp/([A-Z0-9]+)", self.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                body = site.page(match.group(1))
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                # Every visit must reach the server, as it would on the real site
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(
+            ("0.0.0.0", port or config["benchmark"]["port"]), Handler)
+        self.server.daemon_threads = True
+        self.url: str = f"http://{host or config['benchmark']['host']}:{self.server.server_address[1]}"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="fixture-site", daemon=True)
+        self.thread.start()
+        source = f"{len(pages)} archived pages" if pages else "synthetic pages"
+        print(
+            f"{self.colors['purple']}Fixture site at {self.url} ({source}).{self.colors['reset']}")
+
+    def asins(self, count: int) -> list:
+        """Return `count` ASINs to visit, repeating the archived ones if there are fewer."""
+        if not self.pages:
+            return synthetic_asins(count)
+        archived = list(self.pages)
+        return [archived[index % len(archived)] for index in range(count)]
+
+    def page(self, asin: str) -> bytes | None:
+        if asin in self.pages:
+            return self.reader.read(self.pages[asin])
+        if self.pages or not asin.startswith("FIX"):
+            return None
+        number = int(asin[3:])
+        return SYNTHETIC_PRODUCT_PAGE.format(
+            title=f"Samsung Galaxy Fixture {number} 128GB Negro",
+            asin=asin,
+            sibling=f"FIX{number + 1:07d}",
+            whole=f"{4000 + number % 1000:,}",
+            fraction="99",
+            basis=f"{5000 + number % 1000:,}.00"
+        ).encode()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
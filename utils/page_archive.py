@@ -0,0 +1,222 @@
+"""
+Page Archive
+This module stores the raw HTML of the scraped pages in compressed segment files.
+Every page is compressed as an independent frame (zstd if `zstandard` is installed, gzip otherwise)
+and appended to the current segment, and an index line with its ASIN/URL, offset and timestamp
+is written next to it. The writing happens in a background thread, so the scrapers only pay
+for putting the page in a queue. Old segments are removed following a retention and size policy.
+"""
+
+import os
+import gzip
+import json
+import mmap
+import queue
+import threading
+
+from time import time, strftime, gmtime
+from pathlib import Path
+
+from config import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_SUFFIXES = {
+    "zstd": ".zst",
+    "gzip": ".gz"
+}
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    """Compress a page as an independent frame."""
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Decompress a single frame."""
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+# Memory maps of the segments opened by the current process
+_segment_maps: dict = dict()
+
+
+def read_frame(segment: str, offset: int, length: int, codec: str) -> bytes:
+    """Read and decompress a page from a memory-mapped segment."""
+    segment_map = _segment_maps.get(segment)
+    if segment_map is None or offset + length > len(segment_map):
+        # The segment may have grown since it was mapped
+        if segment_map is not None:
+            segment_map.close()
+        with open(segment, "rb") as f:
+            segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _segment_maps[segment] = segment_map
+    return decompress(segment_map[offset:offset + length], codec)
+
+
+class PageArchiveReader():
+    """Read-only access to the pages of an archive."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def segments(self) -> list:
+        """Return the segment files of the archive, oldest first."""
+        return sorted(
+            segment for suffix in SEGMENT_SUFFIXES.values()
+            for segment in self.path.glob(f"pages-*{suffix}"))
+
+    def iter_index(
+            self,
+            kinds: tuple | None = None,
+            since: float | None = None,
+            until: float | None = None):
+        """Yield the index entries of the archived pages, oldest first.
+        Each entry has the segment path, so the page can be read with `read_frame`."""
+        for segment in self.segments():
+            index = segment.with_name(f"{segment.name.split('.')[0]}.idx.jsonl")
+            if not index.exists():
+                continue
+            with index.open("r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line may be incomplete while it is being written
+                        continue
+                    if kinds and entry["kind"] not in kinds:
+                        continue
+                    if since is not None and entry["timestamp"] < since:
+                        continue
+                    if until is not None and entry["timestamp"] > until:
+                        continue
+                    entry["segment"] = str(segment)
+                    yield entry
+
+    def read(self, entry: dict) -> bytes:
+        """Return the HTML of an index entry."""
+        return read_frame(
+            entry["segment"], entry["offset"], entry["length"], entry["codec"])
+
+
+class PageArchive(PageArchiveReader):
+    """Compressed archive of raw pages written by a background thread."""
+
+    def __init__(
+            self,
+            path: str,
+            max_bytes: int | None = None,
+            max_age_days: int | None = None,
+            segment_bytes: int | None = None,
+            queue_size: int = 1000):
+        """Initialize the archive directory and start the writer thread."""
+        super().__init__(path)
+        self.colors: dict = config["colors"]
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes: int = max_bytes or config["archive"]["max_bytes"]
+        self.max_age_days: int = max_age_days or config["archive"]["max_age_days"]
+        self.segment_bytes: int = segment_bytes or config["archive"]["segment_bytes"]
+        self.codec: str = "zstd" if zstandard is not None else "gzip"
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stored: int = 0
+        self.dropped: int = 0
+        self.segment: Path | None = None
+        self.segment_file = None
+        self.index_file = None
+        self.writer = threading.Thread(
+            target=self._writer, name="page-archive", daemon=True)
+        self.writer.start()
+
+    def add(self, kind: str, key: str, url: str, html: str | bytes) -> None:
+        """Queue a page to be archived. Pages are dropped instead of blocking the scraper."""
+        if isinstance(html, str):
+            html = html.encode()
+        try:
+            self.queue.put_nowait({
+                "kind": kind,
+                "key": key,
+                "url": url,
+                "timestamp": time(),
+                "html": html
+            })
+        except queue.Full:
+            self.dropped += 1
+
+    def _open_segment(self) -> None:
+        """Start a new segment file and its index."""
+        self._close_segment()
+        name = f"pages-{strftime('%Y%m%d-%H%M%S', gmtime())}-{os.getpid()}"
+        self.segment = self.path / f"{name}{SEGMENT_SUFFIXES[self.codec]}"
+        self.segment_file = self.segment.open("ab")
+        self.index_file = (self.path / f"{name}.idx.jsonl").open("a")
+
+    def _close_segment(self) -> None:
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.index_file.close()
+        self.segment_file = None
+        self.index_file = None
+
+    def _writer(self) -> None:
+        """Compress and append the queued pages to the current segment."""
+        while True:
+            page = self.queue.get()
+            if page is None:
+                self._close_segment()
+                self.queue.task_done()
+                return
+            try:
+                if self.segment_file is None or self.segment_file.tell() >= self.segment_bytes:
+                    self._open_segment()
+                    self._apply_retention()
+
+                frame = compress(page.pop("html"), self.codec)
+                page["offset"] = self.segment_file.tell()
+                page["length"] = len(frame)
+                page["codec"] = self.codec
+                self.segment_file.write(frame)
+                self.segment_file.flush()
+                self.index_file.write(json.dumps(page) + "\n")
+                self.index_file.flush()
+                self.stored += 1
+            except Exception as e:
+                print(
+                    f"{self.colors['red']}[ERROR] Page archive: {e}{self.colors['reset']}")
+            finally:
+                self.queue.task_done()
+
+    def _remove_segment(self, segment: Path) -> None:
+        index = segment.with_name(f"{segment.name.split('.')[0]}.idx.jsonl")
+        segment.unlink(missing_ok=True)
+        index.unlink(missing_ok=True)
+
+    def _apply_retention(self) -> None:
+        """Remove the segments older than the retention or over the size limit."""
+        oldest_allowed = time() - self.max_age_days * 24 * 60 * 60
+        segments = [
+            segment for segment in self.segments() if segment != self.segment]
+
+        for segment in list(segments):
+            if segment.stat().st_mtime < oldest_allowed:
+                self._remove_segment(segment)
+                segments.remove(segment)
+
+        total = sum(segment.stat().st_size for segment in segments)
+        while segments and total > self.max_bytes:
+            segment = segments.pop(0)
+            total -= segment.stat().st_size
+            self._remove_segment(segment)
+
+    def close(self) -> None:
+        """Write the pending pages and stop the writer thread."""
+        self.queue.put(None)
+        self.writer.join()
+        print(
+            f"{self.colors['purple']}Pages archived: {self.stored} (dropped: {self.dropped}).{self.colors['reset']}")
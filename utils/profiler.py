@@ -0,0 +1,202 @@
+"""
+Profiler
+This module records the timeline of a run when profiling is enabled (`TRACE_PATH`). The phases,
+the items, the waits, the uploads and every WebDriver command are recorded as spans of the
+thread that runs them, and streamed to a Chrome trace (JSON array format) that can be opened
+in Perfetto or chrome://tracing, with one track per worker thread.
+Optionally, the threads are sampled on an interval (folded stacks per phase, for flame graphs)
+and a tracemalloc snapshot is written at the end of every phase.
+"""
+
+import os
+import re
+import sys
+import json
+import threading
+import tracemalloc
+
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter_ns, strftime
+
+from config import config
+
+
+class RunProfiler():
+    """Span recorder with Chrome trace export. Without a path every span is a no-op."""
+
+    def __init__(
+            self,
+            path: str | None = None,
+            sample_interval: float | None = None,
+            trace_malloc: bool | None = None):
+        self.colors: dict = config["colors"]
+        self.path: str | None = path or config["profiling"]["path"]
+        # Sampling interval in milliseconds (0 disables the sampler)
+        self.sample_interval: float = sample_interval or config["profiling"]["sample_interval"]
+        self.trace_malloc: bool = config["profiling"]["tracemalloc"] if trace_malloc is None else trace_malloc
+        self.lock = threading.Lock()
+        self.file = None
+        self.run_name: str = ""
+        self.threads: set = set()
+        self.separator: str = ""
+        self.phase: tuple | None = None
+        self.samples: Counter = Counter()
+        self.stop_event = threading.Event()
+        self.sampler: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.file is not None
+
+    def _emit(self, event: dict) -> None:
+        event["pid"] = os.getpid()
+        with self.lock:
+            if self.file is None:
+                return
+            tid = event.setdefault("tid", threading.get_ident())
+            if tid not in self.threads:
+                # Name the track of the thread the first time it records a span
+                self.threads.add(tid)
+                self._write({
+                    "name": "thread_name", "ph": "M", "pid": event["pid"], "tid": tid,
+                    "args": {"name": threading.current_thread().name}})
+            self._write(event)
+
+    def _write(self, event: dict) -> None:
+        self.file.write(self.separator + json.dumps(event))
+        self.separator = ",\n"
+
+    def start_run(self) -> None:
+        """Open the trace of the run (a new file in the trace directory)."""
+        if not self.path or self.file is not None:
+            return
+        Path(self.path).mkdir(parents=True, exist_ok=True)
+        self.run_name = f"trace-{strftime('%Y%m%d-%H%M%S')}"
+        self.threads = set()
+        self.separator = ""
+        self.file = open(Path(self.path) / f"{self.run_name}.json", "w")
+        self.file.write("[\n")
+        if self.trace_malloc:
+            tracemalloc.start()
+        if self.sample_interval:
+            self.stop_event.clear()
+            self.sampler = threading.Thread(
+                target=self._sample_loop, name="profiler-sampler", daemon=True)
+            self.sampler.start()
+        print(
+            f"{self.colors['purple']}Profiling the run: {Path(self.path) / self.run_name}.json{self.colors['reset']}")
+
+    def end_run(self) -> None:
+        """Close the trace of the run."""
+        if self.file is None:
+            return
+        self.end_phase()
+        if self.sampler is not None:
+            self.stop_event.set()
+            self.sampler.join()
+            self.sampler = None
+        if self.trace_malloc:
+            tracemalloc.stop()
+        with self.lock:
+            self.file.write("\n]\n")
+            self.file.close()
+            self.file = None
+
+    def span(self, name: str, category: str, **args):
+        """Context manager that records a span of the current thread."""
+        if self.file is None:
+            return nullcontext()
+        return self._span(name, category, args)
+
+    @contextmanager
+    def _span(self, name: str, category: str, args: dict):
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._emit({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (perf_counter_ns() - start) / 1000,
+                "args": args
+            })
+
+    def start_phase(self, name: str) -> None:
+        if self.file is None:
+            return
+        self.end_phase()
+        with self.lock:
+            self.phase = (name, perf_counter_ns(), threading.get_ident())
+            self.samples = Counter()
+
+    def end_phase(self) -> None:
+        """Record the span of the current phase and write its samples and memory snapshot."""
+        with self.lock:
+            if self.phase is None:
+                return
+            (name, start, tid), self.phase = self.phase, None
+            samples, self.samples = self.samples, Counter()
+        self._emit({
+            "name": name,
+            "cat": "phase",
+            "ph": "X",
+            "ts": start / 1000,
+            "dur": (perf_counter_ns() - start) / 1000,
+            "tid": tid,
+            "args": {}
+        })
+        prefix = Path(self.path) / f"{self.run_name}-{re.sub(r'[^\w.-]+', '_', name)}"
+        if samples:
+            with open(f"{prefix}.folded", "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        if self.trace_malloc and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self._emit({
+                "name": "memory",
+                "ph": "C",
+                "ts": perf_counter_ns() / 1000,
+                "args": {"current_mb": round(current / 1024 ** 2, 1), "peak_mb": round(peak / 1024 ** 2, 1)}
+            })
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            with open(f"{prefix}.tracemalloc.txt", "w") as f:
+                for statistic in statistics[:30]:
+                    f.write(f"{statistic}\n")
+            tracemalloc.reset_peak()
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.sample_interval / 1000):
+            if self.phase is None:
+                continue
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            stacks = Counter()
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = list()
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[";".join([names.get(tid, str(tid))] + stack[::-1])] += 1
+            with self.lock:
+                self.samples.update(stacks)
+
+    def wrap_driver(self, driver) -> None:
+        """Record every WebDriver command of a session as a span."""
+        if self.file is None:
+            return
+        execute = driver.execute
+        profiler = self
+
+        def traced_execute(driver_command, params=None):
+            with profiler.span(driver_command, "webdriver"):
+                return execute(driver_command, params)
+
+        driver.execute = traced_execute
@@ -0,0 +1,228 @@
+"""
+Progress
+This module tracks the progress of a run: the tasks done, queued and in flight of each phase,
+the products per minute, the open browser sessions and the failure rate, with an ETA from
+the throughput of the last minutes. While a run is in progress, a status line is printed on
+an interval and the status is written to a JSON file and served on a local HTTP endpoint
+(when they are configured), so the grid can be resized in the middle of a run.
+"""
+
+import os
+import json
+import threading
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time
+
+from config import config
+
+
+class ProgressTracker():
+    """Thread-safe progress counters of a run, with a periodic reporter."""
+
+    def __init__(
+            self,
+            interval: float | None = None,
+            path: str | None = None,
+            port: int | None = None,
+            window: float | None = None):
+        """Initialize the tracker. The reporter starts with the run."""
+        self.colors: dict = config["colors"]
+        self.interval: float = interval or config["progress"]["interval"]
+        self.path: str | None = path or config["progress"]["path"]
+        self.port: int = port or config["progress"]["port"]
+        self.window: float = window or config["progress"]["window"]
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.reporter: threading.Thread | None = None
+        self.server: ThreadingHTTPServer | None = None
+        self.sessions: int = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self.started_at: float | None = None
+        self.phase: dict | None = None
+        self.phases: list = list()
+        # Time and result of the tasks finished in the last minutes
+        self.recent: deque = deque()
+
+    @staticmethod
+    def _new_phase(name: str, total: int) -> dict:
+        return {
+            "name": name,
+            "total": total,
+            "done": 0,
+            "failed": 0,
+            "retried": 0,
+            "in_flight": 0,
+            "started_at": time(),
+            "ended_at": None
+        }
+
+    def start_run(self) -> None:
+        """Reset the counters and start the reporter (and the HTTP endpoint)."""
+        with self.lock:
+            self._reset()
+            self.started_at = time()
+        if self.port and self.server is None:
+            self._start_server()
+        if self.reporter is None and (self.interval or self.path):
+            self.stop_event.clear()
+            self.reporter = threading.Thread(target=self._report_loop, daemon=True)
+            self.reporter.start()
+
+    def end_run(self) -> None:
+        """Stop the reporter and write the final status."""
+        with self.lock:
+            self._end_phase()
+        if self.reporter is not None:
+            self.stop_event.set()
+            self.reporter.join()
+            self.reporter = None
+        self._report(final=True)
+
+    def start_phase(self, name: str, total: int) -> None:
+        with self.lock:
+            self._end_phase()
+            self.phase = self._new_phase(name, total)
+
+    def _end_phase(self) -> None:
+        if self.phase is not None:
+            self.phase["ended_at"] = time()
+            self.phases.append(self.phase)
+            self.phase = None
+
+    def end_phase(self) -> None:
+        with self.lock:
+            self._end_phase()
+
+    def task_started(self) -> None:
+        with self.lock:
+            if self.phase is not None:
+                self.phase["in_flight"] += 1
+
+    def task_finished(self, status: str) -> None:
+        """Record the end of a task: `done`, `retried` (it is queued again) or `failed`."""
+        now = time()
+        with self.lock:
+            if self.phase is None:
+                return
+            self.phase["in_flight"] = max(self.phase["in_flight"] - 1, 0)
+            self.phase[status] += 1
+            self.recent.append((now, status))
+            while self.recent and self.recent[0][0] < now - self.window:
+                self.recent.popleft()
+
+    def session_opened(self) -> None:
+        with self.lock:
+            self.sessions += 1
+
+    def session_closed(self) -> None:
+        with self.lock:
+            self.sessions = max(self.sessions - 1, 0)
+
+    def _phase_status(self, phase: dict, now: float, rate: float | None) -> dict:
+        status = {key: value for key, value in phase.items() if key not in ("started_at", "ended_at")}
+        status["queued"] = max(
+            phase["total"] - phase["done"] - phase["failed"] - phase["in_flight"], 0)
+        status["seconds"] = round((phase["ended_at"] or now) - phase["started_at"], 1)
+        if rate is not None:
+            remaining = status["queued"] + phase["in_flight"]
+            status["eta_seconds"] = round(remaining / rate) if rate else None
+        return status
+
+    def status(self) -> dict:
+        """Return the status of the run."""
+        now = time()
+        with self.lock:
+            # Throughput of the tasks finished in the window (or since the run started)
+            span = min(self.window, now - self.started_at) if self.started_at else 0
+            recent = [status for finished_at, status in self.recent
+                      if finished_at >= now - self.window]
+            finished = sum(1 for status in recent if status != "retried")
+            rate = finished / span if span else 0
+            attempts = sum(phase["done"] + phase["failed"] + phase["retried"]
+                           for phase in self.phases + ([self.phase] if self.phase else []))
+            failures = sum(phase["failed"] + phase["retried"]
+                           for phase in self.phases + ([self.phase] if self.phase else []))
+            return {
+                "running": self.reporter is not None,
+                "updated_at": now,
+                "elapsed_seconds": round(now - self.started_at, 1) if self.started_at else 0,
+                "sessions": self.sessions,
+                "products_per_minute": round(recent.count("done") / span * 60, 1) if span else 0,
+                "failure_rate": round(failures / attempts, 3) if attempts else 0,
+                "phase": self._phase_status(self.phase, now, rate) if self.phase else None,
+                "phases": [self._phase_status(phase, now, None) for phase in self.phases]
+            }
+
+    def status_line(self, status: dict | None = None) -> str:
+        status = status or self.status()
+        phase = status["phase"]
+        line = f"{self.colors['cyan']}[Progress] "
+        if phase:
+            eta = phase.get("eta_seconds")
+            line += (
+                f"{phase['name']}: {phase['done']}/{phase['total']} done, "
+                f"{phase['queued']} queued, {phase['in_flight']} in flight, "
+                f"ETA {f'{eta // 60:.0f}m{eta % 60:02.0f}s' if eta is not None else '-'} | ")
+        line += (
+            f"{status['products_per_minute']} products/min, {status['sessions']} sessions, "
+            f"{status['failure_rate']:.1%} failures{self.colors['reset']}")
+        return line
+
+    def _write(self, status: dict) -> None:
+        # Write and rename, so a reader never gets a half written file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(status, f, indent=4)
+        os.replace(temporary, self.path)
+
+    def _report(self, final: bool = False) -> None:
+        status = self.status()
+        if final:
+            status["running"] = False
+        elif self.interval:
+            print(self.status_line(status))
+        if self.path:
+            try:
+                self._write(status)
+            except OSError as e:
+                print(
+                    f"{self.colors['red']}[ERROR] Writing progress file: {e}{self.colors['reset']}")
+
+    def _report_loop(self) -> None:
+        while not self.stop_event.wait(self.interval or 10):
+            self._report()
+
+    def _start_server(self) -> None:
+        tracker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/status"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(tracker.status()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(
+            f"{self.colors['purple']}Progress status on http://127.0.0.1:{self.port}/status{self.colors['reset']}")
+
+    def close(self) -> None:
+        if self.reporter is not None:
+            self.end_run()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,72 @@
+"""
+Refresh Tiers
+This module decides which ASINs are refreshed in a run. Every ASIN of the mirror is assigned a
+tier from its ranking and its observed price-change frequency. Each tier has its own refresh
+interval and a budget of ASINs per run, so the grid time goes to the products whose data changes.
+"""
+
+from time import time
+
+from config import config
+
+
+class RefreshScheduler():
+    """Select the ASINs due for a refresh, tier by tier."""
+
+    def __init__(self, asin_mirror, tiers: list | None = None):
+        """Initialize the scheduler with the ASIN mirror and the tiers configuration."""
+        self.colors: dict = config["colors"]
+        self.asin_mirror = asin_mirror
+        self.tiers: list = tiers or config["refresh_tiers"]
+
+    @staticmethod
+    def volatility(row: dict) -> float:
+        """Share of the scrapes in which the price changed."""
+        if row["scrapes"] < 2:
+            return 0.0
+        return row["price_changes"] / (row["scrapes"] - 1)
+
+    def _matches(self, tier: dict, row: dict) -> bool:
+        """Check the conditions of a tier. A tier without conditions matches nothing,
+        it is only used as the default (last) tier."""
+        volatility = self.volatility(row)
+        if tier.get("max_ranking") and 0 < row["ranking"] <= tier["max_ranking"]:
+            return True
+        if tier.get("min_volatility") is not None and row["scrapes"] >= 2 \
+                and volatility >= tier["min_volatility"]:
+            return True
+        if tier.get("max_volatility") is not None and row["scrapes"] >= tier.get("min_scrapes", 2) \
+                and volatility <= tier["max_volatility"]:
+            return True
+        return False
+
+    def tier_of(self, row: dict) -> dict:
+        """Return the first tier whose conditions the ASIN meets (the last tier by default)."""
+        for tier in self.tiers:
+            if self._matches(tier, row):
+                return tier
+        return self.tiers[-1]
+
+    def due_asins(self, now: float | None = None) -> list:
+        """Return the ASINs due for a refresh. Hotter tiers go first and,
+        inside a tier, the stalest ASINs go first. Each tier is capped by its budget."""
+        now = now or time()
+        by_tier = {tier["name"]: list() for tier in self.tiers}
+
+        # The rows come ordered by staleness
+        for row in self.asin_mirror.rows():
+            tier = self.tier_of(row)
+            # Refresh a little early, so a run on the hour doesn't skip a product by seconds
+            interval = tier["interval"] * 60 * 0.9
+            if row["last_scraped"] is None or now - row["last_scraped"] >= interval:
+                by_tier[tier["name"]].append(row["asin"])
+
+        due = list()
+        for tier in self.tiers:
+            asins = by_tier[tier["name"]]
+            if tier.get("budget"):
+                asins = asins[:tier["budget"]]
+            print(
+                f"{self.colors['purple']}Tier {tier['name']}: {len(asins)}/{len(by_tier[tier['name']])} ASINs due.{self.colors['reset']}")
+            due.extend(asins)
+        return due
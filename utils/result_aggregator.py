@@ -0,0 +1,99 @@
+"""
+Result Aggregator
+This module merges the output of the brand search workers. The search cards and the new ASINs
+are indexed by ASIN, so every upsert and membership check is O(1) however big the catalog and
+the top 100 overlap get. The merge rules are explicit:
+- A card only fills the card fields. A field already set is not overwritten by an empty value.
+- The ranking of a card comes from the top 100 rankings (0 when the product is not in the top).
+- A new ASIN belongs to the first brand that finds it, and the top 100 ASINs are not assigned
+  to any brand (they are scraped in their own phase).
+- The ASINs whose page was scraped in the run don't need their card patched.
+"""
+
+import threading
+
+
+CARD_FIELDS = (
+    "price",
+    "url",
+    "image",
+    "basis_price",
+    "alt",
+    "title",
+    "customers_opinion"
+)
+
+
+class ResultAggregator():
+    """Thread-safe index of the brand search results, keyed by ASIN."""
+
+    def __init__(self, rankings: dict | None = None):
+        """Initialize the aggregator with the top 100 rankings (ASIN: ranking)."""
+        self.lock = threading.Lock()
+        self.rankings: dict = dict(rankings or {})
+        # Search cards by ASIN
+        self.cards: dict = dict()
+        # Brand of each new ASIN, and the new ASINs of each brand (in the order they were found)
+        self.brand_of: dict = dict()
+        self.brands: dict = dict()
+        # ASINs whose product page was scraped
+        self.scraped: set = set()
+
+    def _upsert_card(self, card: dict) -> None:
+        asin = card.get("asin")
+        if not asin:
+            return
+        current = self.cards.get(asin)
+        if current is None:
+            current = self.cards[asin] = dict(card)
+        else:
+            for field in CARD_FIELDS:
+                if card.get(field):
+                    current[field] = card[field]
+        current["ranking"] = self.rankings.get(asin, 0)
+
+    def _assign(self, brand: str, asins: list) -> None:
+        brand_asins = self.brands.setdefault(brand, dict())
+        for asin in asins:
+            if asin in self.rankings or asin in self.brand_of:
+                continue
+            self.brand_of[asin] = brand
+            brand_asins[asin] = None
+
+    def merge(self, asins_by_brand: dict, cards: list) -> None:
+        """Merge the result of a brand search worker (new ASINs by brand and search cards)."""
+        with self.lock:
+            for brand, asins in asins_by_brand.items():
+                self._assign(brand, asins)
+            for card in cards:
+                self._upsert_card(card)
+
+    def mark_scraped(self, products) -> None:
+        """Record the products whose page was scraped."""
+        with self.lock:
+            self.scraped.update(
+                product["asin"] for product in products if product.get("asin"))
+
+    def cards_to_patch(self) -> list:
+        """Return the search cards of the products whose page was not scraped."""
+        with self.lock:
+            return [
+                dict(card) for asin, card in self.cards.items()
+                if asin not in self.scraped
+            ]
+
+    def brand_asins(self) -> dict:
+        """Return the new ASINs of each brand."""
+        with self.lock:
+            return {brand: list(asins) for brand, asins in self.brands.items()}
+
+    def pending(self, asins: list) -> list:
+        """Return the ASINs (in their order) that were not updated by a search card,
+        a scraped page or the top 100."""
+        with self.lock:
+            return [
+                asin for asin in asins
+                if asin not in self.cards
+                and asin not in self.scraped
+                and asin not in self.rankings
+            ]
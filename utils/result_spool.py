@@ -0,0 +1,97 @@
+"""
+Result Spool
+This module keeps the scraped products on disk instead of in memory. Every group of products
+(a brand, the top 100) is an append-only JSONL file where the scrapers write their results as
+soon as they have them, and the upload and reporting steps read the files back in batches.
+The memory used by a run doesn't grow with the number of tracked ASINs.
+"""
+
+import re
+import json
+import shutil
+import tempfile
+import threading
+
+from functools import partial
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from config import config
+
+
+class ResultSpool():
+    """Append-only spool of the scraped products, one JSONL file per group."""
+
+    def __init__(self, path: str | None = None):
+        """Create the spool in a new directory (inside `path` or the temporary directory)."""
+        self.colors: dict = config["colors"]
+        base_path = path or config["spool"]["path"]
+        if base_path:
+            Path(base_path).mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix="spool-", dir=base_path))
+        self.lock = threading.Lock()
+        self.files: dict = dict()
+        self.counts: dict = dict()
+
+    def _file_of(self, group: str) -> Path:
+        name = re.sub(r"[^\w.-]", "_", group)
+        return self.path / f"{len(self.counts)}-{name}.jsonl"
+
+    def append(self, group: str, products: list) -> None:
+        """Write the products at the end of the group file."""
+        if not products:
+            return
+        lines = "".join(json.dumps(product) + "\n" for product in products)
+        with self.lock:
+            if group not in self.files:
+                self.files[group] = self._file_of(group).open("a")
+                self.counts[group] = 0
+            self.files[group].write(lines)
+            self.files[group].flush()
+            self.counts[group] += len(products)
+
+    def sink(self, group: str) -> Callable[[list], None]:
+        """Return a function that appends products to the group (passed to the scrapers)."""
+        return partial(self.append, group)
+
+    def groups(self) -> list:
+        """Return the groups with products, in the order they were created."""
+        with self.lock:
+            return list(self.counts)
+
+    def count(self, group: str | None = None) -> int:
+        """Number of products of a group, or of the whole spool."""
+        with self.lock:
+            if group is None:
+                return sum(self.counts.values())
+            return self.counts.get(group, 0)
+
+    def iter_group(self, group: str) -> Iterator[dict]:
+        """Yield the products of a group, one at a time."""
+        with self.lock:
+            if group not in self.files:
+                return
+            path = Path(self.files[group].name)
+        with path.open("r") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def batches(self, group: str, size: int | None = None) -> Iterator[list]:
+        """Yield the products of a group in lists of `size` products."""
+        size = size or config["spool"]["batch_size"]
+        batch = list()
+        for product in self.iter_group(group):
+            batch.append(product)
+            if len(batch) >= size:
+                yield batch
+                batch = list()
+        if batch:
+            yield batch
+
+    def close(self) -> None:
+        """Close and remove the spool files."""
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files.clear()
+        shutil.rmtree(self.path, ignore_errors=True)
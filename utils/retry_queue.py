@@ -0,0 +1,102 @@
+"""
+Retry Queue
+This module keeps the items that failed with a transient error (a timeout, an interstitial
+loop, a partially loaded page) to be scraped again later. Every failure of an item doubles
+its delay up to a limit, and the item is given up after a number of attempts. The queue is
+shared by the scrapers of a phase, so any scraper with an idle slot can take the retries.
+"""
+
+import heapq
+import threading
+
+from time import time
+from random import uniform
+
+from config import config
+
+
+class RetryQueue():
+    """Delayed queue of the items to retry, with exponential backoff."""
+
+    def __init__(
+            self,
+            max_attempts: int | None = None,
+            base_delay: float | None = None,
+            max_delay: float | None = None):
+        """Initialize the queue with the retry policy."""
+        self.colors: dict = config["colors"]
+        self.max_attempts: int = max_attempts or config["retry"]["max_attempts"]
+        self.base_delay: float = base_delay or config["retry"]["base_delay"]
+        self.max_delay: float = max_delay or config["retry"]["max_delay"]
+        self.lock = threading.Lock()
+        self.heap: list = list()
+        self.sequence: int = 0
+        self.attempts: dict = dict()
+        self.counts: dict = {
+            "queued": 0,
+            "retried": 0,
+            "recovered": 0,
+            "exhausted": 0,
+            "permanent": 0
+        }
+
+    def push(self, key: str, item, reason: str = "") -> bool:
+        """Schedule a failed item. It returns False if the item is out of attempts."""
+        with self.lock:
+            attempts = self.attempts.get(key, 0) + 1
+            self.attempts[key] = attempts
+            if attempts > self.max_attempts:
+                self.counts["exhausted"] += 1
+                print(
+                    f"{self.colors['red']}[{key}] Given up after {self.max_attempts} retries: {reason}{self.colors['reset']}")
+                return False
+
+            delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            # Spread the retries, so the failed items don't hit the site at the same time
+            delay *= uniform(0.8, 1.2)
+            self.sequence += 1
+            heapq.heappush(
+                self.heap, (time() + delay, self.sequence, key, item))
+            self.counts["queued"] += 1
+        print(
+            f"{self.colors['yellow']}[{key}] Retry {attempts}/{self.max_attempts} in {delay:.0f}s: {reason}{self.colors['reset']}")
+        return True
+
+    def pop_ready(self, now: float | None = None) -> tuple | None:
+        """Return the next item whose delay is over as (key, item), or None."""
+        now = now or time()
+        with self.lock:
+            if not self.heap or self.heap[0][0] > now:
+                return None
+            _, _, key, item = heapq.heappop(self.heap)
+            self.counts["retried"] += 1
+        return key, item
+
+    def next_delay(self, now: float | None = None) -> float | None:
+        """Seconds until the next item is ready (None if the queue is empty)."""
+        now = now or time()
+        with self.lock:
+            if not self.heap:
+                return None
+            return max(self.heap[0][0] - now, 0)
+
+    def succeeded(self, key: str) -> None:
+        """Record a successful scrape. It counts as recovered if the item had failed before."""
+        with self.lock:
+            if self.attempts.pop(key, 0):
+                self.counts["recovered"] += 1
+
+    def failed_permanently(self, key: str) -> None:
+        """Record an item discarded for good (wrong category or brand)."""
+        with self.lock:
+            self.attempts.pop(key, None)
+            self.counts["permanent"] += 1
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.heap)
+
+    def report(self) -> dict:
+        """Return the counters of the queue."""
+        with self.lock:
+            return {**self.counts, "pending": len(self.heap)}
@@ -0,0 +1,75 @@
+"""
+Session Store
+This module keeps the cookies (locale preferences and session) of a browser session that got
+past the interstitial pages. New sessions start with them, so they don't go through the
+continue button and authentication handling again. The state expires after a time, and it is
+dropped when a session that uses it trips the interstitial detector. The store is a JSON file,
+so the managers of other hosts can share it.
+"""
+
+import os
+import json
+import threading
+
+from pathlib import Path
+from time import time
+
+from config import config
+
+
+class SessionStore():
+    """Persisted cookies of a browser session in a normal state."""
+
+    def __init__(self, path: str, ttl: float | None = None):
+        """Load the stored state. The ttl is in minutes."""
+        self.colors: dict = config["colors"]
+        self.path = Path(path)
+        self.ttl: float = (ttl or config["session_store"]["ttl"]) * 60
+        self.lock = threading.Lock()
+        self.state: dict | None = self._read()
+
+    def _read(self) -> dict | None:
+        try:
+            with self.path.open("r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _fresh(self, state: dict | None) -> bool:
+        return bool(state) and time() - state["captured_at"] < self.ttl
+
+    def get(self) -> list | None:
+        """Return the stored cookies, if they have not expired."""
+        with self.lock:
+            if not self._fresh(self.state):
+                # Another host may have captured a newer state
+                self.state = self._read()
+            if not self._fresh(self.state):
+                return None
+            now = time()
+            return [
+                cookie for cookie in self.state["cookies"]
+                if not cookie.get("expiry") or cookie["expiry"] > now
+            ]
+
+    def save(self, cookies: list) -> None:
+        """Store the cookies of a session in a normal state."""
+        with self.lock:
+            self.state = {"captured_at": time(), "cookies": cookies}
+            # Write and rename, so a reader never gets a half written file
+            temporary = self.path.with_suffix(f"{self.path.suffix}.tmp")
+            with temporary.open("w") as f:
+                json.dump(self.state, f, indent=4)
+            os.replace(temporary, self.path)
+        print(
+            f"{self.colors['purple']}Session state stored ({len(cookies)} cookies).{self.colors['reset']}")
+
+    def invalidate(self, reason: str) -> None:
+        """Drop the stored state (a session that used it hit an interstitial page)."""
+        with self.lock:
+            if self.state is None:
+                return
+            self.state = None
+            self.path.unlink(missing_ok=True)
+        print(
+            f"{self.colors['yellow']}Session state dropped: {reason}.{self.colors['reset']}")
@@ -0,0 +1,137 @@
+"""
+Token Manager
+This module keeps the API tokens of the scraper. It decodes the expiry of the JWT access token
+and refreshes it shortly before it expires, letting a single thread refresh while the others wait.
+When the refresh fails the scraper logs in again, outside of the token lock.
+"""
+
+import json
+import base64
+import threading
+import requests
+
+from time import time
+from collections.abc import Callable
+from requests.exceptions import JSONDecodeError, RequestException
+
+from config import config
+from custom_exceptions import TokenExpiredError
+
+
+class TokenManager():
+    """Thread-safe holder of the access and refresh tokens."""
+
+    def __init__(self, login_callback: Callable[[], None] | None = None):
+        """Initialize the token manager.
+        `login_callback` is called when both tokens are no longer valid."""
+        self.colors: dict = config["colors"]
+        self.ip: str = config["ip"]
+        self.refresh_endpoint: str = config["refresh_endpoint"]
+        self.refresh_margin: int = config["token_refresh_margin"]
+        self.login_callback = login_callback
+        self.token: str = str()
+        self.refresh_token: str = str()
+        self.expires_at: float | None = None
+        # The header is shared and updated in place, so every holder sees the new token
+        self.header: dict = dict()
+        self.lock = threading.RLock()
+        # A single thread logs in at a time, without holding the token lock
+        self.login_lock = threading.Lock()
+
+    @staticmethod
+    def decode_expiry(token: str) -> float | None:
+        """Return the `exp` claim of a JWT, or None if it can't be decoded."""
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            claims = json.loads(base64.urlsafe_b64decode(payload))
+            return float(claims["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    def set_tokens(self, token: str, refresh_token: str | None = None) -> None:
+        """Store a new access token (and refresh token if given)."""
+        with self.lock:
+            self.token = token or str()
+            if refresh_token is not None:
+                self.refresh_token = refresh_token or str()
+            self.expires_at = self.decode_expiry(self.token)
+            self.header["Authorization"] = f"Bearer {self.token}"
+
+    def _expires_soon(self) -> bool:
+        if not self.token:
+            return True
+        if self.expires_at is None:
+            return False
+        return self.expires_at - time() <= self.refresh_margin
+
+    def get_header(self) -> dict:
+        """Return the authorization header, refreshing the token before it expires."""
+        if self.token and not self._expires_soon():
+            return self.header
+
+        with self.lock:
+            # Another thread may have refreshed the token while this one was waiting
+            if not self._expires_soon():
+                return self.header
+            used_token = self.token
+            if self._refresh():
+                return self.header
+        self._login(used_token)
+        return self.header
+
+    def invalidate(self, used_token: str) -> None:
+        """Handle a rejected token. Only the first thread that reports it refreshes."""
+        with self.lock:
+            if used_token != self.token:
+                return
+            if self._refresh():
+                return
+        self._login(used_token)
+
+    def _refresh(self) -> bool:
+        """Ask for a new access token with the refresh token. Called with the lock held.
+        It returns False when the scraper has to log in again."""
+        refresh_expiry = self.decode_expiry(self.refresh_token)
+        if not self.refresh_token or (refresh_expiry is not None and refresh_expiry <= time()):
+            return False
+        return self._request_new_token()
+
+    def _login(self, used_token: str) -> None:
+        """Log in again when the token can't be refreshed. The login runs without the
+        token lock, so it doesn't block the threads that only read the header."""
+        with self.login_lock:
+            with self.lock:
+                # Another thread may have logged in while this one was waiting
+                if self.token and self.token != used_token and not self._expires_soon():
+                    return
+                self.set_tokens(str(), str())
+            if self.login_callback is None:
+                raise TokenExpiredError("The token has expired.")
+            self.login_callback()
+            if not self.token:
+                raise TokenExpiredError("The token has expired.")
+
+    def _request_new_token(self) -> bool:
+        """Ask the API for a new access token using the refresh token."""
+        if not self.refresh_endpoint:
+            return False
+        try:
+            response = requests.post(
+                url=f"{self.ip}{self.refresh_endpoint}",
+                headers={"Authorization": f"Bearer {self.refresh_token}"}
+            )
+            response_json = response.json()
+        except (RequestException, JSONDecodeError):
+            return False
+
+        if not isinstance(response_json, dict) or not response_json.get("access_token"):
+            return False
+
+        self.set_tokens(
+            response_json["access_token"],
+            response_json.get("refresh_token") or self.refresh_token
+        )
+        print(
+            f"{self.colors['green']}Access token refreshed.{self.colors['reset']}")
+        return True
@@ -0,0 +1,92 @@
+"""
+Variant Graph
+This module keeps the variant families found during a run. Every scraped product adds the
+edges to its twister options (the variants that differ from it in one dimension, with the
+option type and name), and the products joined by an edge form a family. The graph is shared
+by the scrapers of the run, so the variants of the top 100 are expanded once per family,
+and the twister of a product can be completed with the options read from its siblings.
+"""
+
+import threading
+
+
+class VariantGraph():
+    """Run-wide graph of variant families."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Twister options read from the page of each product
+        self.options: dict = dict()
+        # Family of each ASIN (the families are merged when an edge joins them)
+        self.family: dict = dict()
+        self.members: dict = dict()
+
+    def _union(self, asin: str, other: str) -> None:
+        first = self.family.setdefault(asin, asin)
+        second = self.family.setdefault(other, other)
+        self.members.setdefault(first, {first})
+        self.members.setdefault(second, {second})
+        if first == second:
+            return
+        # Merge the smaller family into the bigger one
+        if len(self.members[first]) < len(self.members[second]):
+            first, second = second, first
+        for member in self.members.pop(second):
+            self.family[member] = first
+            self.members[first].add(member)
+
+    def add(self, asin: str, twister: list) -> None:
+        """Record the twister options of a product."""
+        with self.lock:
+            self.options[asin] = list(twister)
+            self._union(asin, asin)
+            for option in twister:
+                self._union(asin, option["asin"])
+
+    def family_of(self, asin: str) -> set:
+        """Return the ASINs of the family of a product (itself if it has no variants)."""
+        with self.lock:
+            family = self.family.get(asin)
+            return set(self.members[family]) if family else {asin}
+
+    def _name_of(self, asin: str, option_type: str, family: str) -> str:
+        """Name of the value of a product in a dimension, as the other members show it."""
+        for member in self.members[family]:
+            for option in self.options.get(member, []):
+                if option["asin"] == asin and option["type"] == option_type:
+                    return option["name"]
+        return ""
+
+    def twister_of(self, asin: str) -> list:
+        """Return the twister options of a product read from its own page or,
+        if the page didn't have them, from the siblings that have it as an option."""
+        with self.lock:
+            if self.options.get(asin):
+                return list(self.options[asin])
+            family = self.family.get(asin)
+            if not family:
+                return []
+            # The options are symmetric: a sibling that differs in one dimension is an option of both
+            twister = list()
+            for member in self.members[family]:
+                if member == asin:
+                    continue
+                for option in self.options.get(member, []):
+                    if option["asin"] == asin:
+                        twister.append({
+                            "type": option["type"],
+                            "asin": member,
+                            "name": self._name_of(member, option["type"], family)
+                        })
+            return twister
+
+    def expand(self, rankings: dict) -> dict:
+        """Return the twister options of the ranked products that are not ranked yet,
+        with the best ranking of the products that point to them."""
+        variants = dict()
+        with self.lock:
+            for asin, ranking in sorted(rankings.items(), key=lambda item: item[1]):
+                for option in self.options.get(asin, []):
+                    if option["asin"] not in rankings and option["asin"] not in variants:
+                        variants[option["asin"]] = ranking
+        return variants
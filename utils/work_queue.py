@@ -0,0 +1,299 @@
+"""
+Work Queue
+This module contains the work queue shared by several scraper managers, so they can split the
+brands and ASINs of a run without duplicating work. The tasks are leased for a visibility
+timeout and acknowledged once they are processed: the tasks of a manager that dies become
+available again when their lease expires. The backends are chosen by the URL scheme
+(`sqlite:///path/to/queue.db`), and new ones are added to `WORK_QUEUE_BACKENDS`.
+The SQLite backend is single-host: its locking (WAL) needs the managers on the same machine
+and doesn't work over a network filesystem. Sharing the queue between hosts needs a
+network backend.
+"""
+
+import json
+import sqlite3
+import threading
+
+from abc import ABC, abstractmethod
+from time import time
+from collections.abc import Iterator
+
+from config import config
+
+
+def task_key(item: str | dict) -> str:
+    """Return the key of a task: the brand or ASIN itself, or the ASIN of a {asin: ranking} item."""
+    if isinstance(item, dict):
+        return next(iter(item))
+    return item
+
+
+class WorkQueue(ABC):
+    """Interface of the work queue backends."""
+
+    @abstractmethod
+    def put(self, kind: str, group: str, items: list) -> int:
+        """Add the items as tasks. Items already queued, leased or recently done are skipped.
+        It returns how many tasks were added."""
+
+    @abstractmethod
+    def lease(self, kind: str, owner: str, limit: int = 1, group: str | None = None) -> list:
+        """Lease up to `limit` available tasks. Each task is a dict with id, key, group,
+        payload and attempts (the number of leases, this one included)."""
+
+    @abstractmethod
+    def ack(self, task_ids: list) -> None:
+        """Mark the tasks as done."""
+
+    @abstractmethod
+    def release(self, task_ids: list) -> None:
+        """Give the tasks back to the queue before their lease expires."""
+
+    @abstractmethod
+    def extend(self, task_ids: list) -> None:
+        """Renew the lease of the tasks still being processed."""
+
+    @abstractmethod
+    def available(self, kind: str, group: str | None = None) -> int:
+        """Number of tasks that can be leased now."""
+
+    @abstractmethod
+    def groups(self, kind: str) -> list:
+        """Return the groups with tasks not done yet."""
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteWorkQueue(WorkQueue):
+    """Work queue stored in a SQLite database shared by the managers of the same host."""
+
+    def __init__(
+            self,
+            path: str,
+            visibility_timeout: int | None = None,
+            dedup_window: int | None = None):
+        """Open (or create) the queue database."""
+        self.visibility_timeout: int = visibility_timeout or config["work_queue"]["visibility_timeout"]
+        self.dedup_window: int = dedup_window or config["work_queue"]["dedup_window"]
+        self.lock = threading.Lock()
+        # The transactions are explicit, so a lease is atomic between processes
+        self.connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    grp TEXT,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    owner TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    done_at REAL,
+                    UNIQUE (kind, key)
+                )""")
+            self.connection.execute("""
+                CREATE INDEX IF NOT EXISTS tasks_available
+                ON tasks (kind, state, grp, lease_until)""")
+
+    def _available_condition(self, group: str | None) -> str:
+        condition = "kind = ? AND (state = 'pending' OR (state = 'leased' AND lease_until < ?))"
+        if group is not None:
+            condition += " AND grp = ?"
+        return condition
+
+    def put(self, kind: str, group: str, items: list) -> int:
+        now = time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                before = self.connection.total_changes
+                # A task done before the dedup window belongs to an older run and is queued again
+                self.connection.executemany("""
+                    INSERT INTO tasks (kind, key, grp, payload) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (kind, key) DO UPDATE SET
+                        state = 'pending',
+                        grp = excluded.grp,
+                        payload = excluded.payload,
+                        owner = NULL,
+                        lease_until = NULL,
+                        attempts = 0,
+                        done_at = NULL
+                    WHERE state = 'done' AND done_at < ?
+                """, [
+                    (kind, task_key(item), group, json.dumps(item), now - self.dedup_window)
+                    for item in items
+                ])
+                added = self.connection.total_changes - before
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return added
+
+    def lease(self, kind: str, owner: str, limit: int = 1, group: str | None = None) -> list:
+        now = time()
+        params = [kind, now] + ([group] if group is not None else [])
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.connection.execute(
+                    f"SELECT id, key, grp, payload, attempts FROM tasks WHERE {self._available_condition(group)} ORDER BY id LIMIT ?",
+                    params + [limit]).fetchall()
+                self.connection.executemany("""
+                    UPDATE tasks SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1
+                    WHERE id = ?
+                """, [(owner, now + self.visibility_timeout, row[0]) for row in rows])
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return [
+            {
+                "id": row[0],
+                "key": row[1],
+                "group": row[2],
+                "payload": json.loads(row[3]),
+                "attempts": row[4] + 1
+            }
+            for row in rows
+        ]
+
+    def ack(self, task_ids: list) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE tasks SET state = 'done', done_at = ?, lease_until = NULL WHERE id = ?",
+                [(time(), task_id) for task_id in task_ids])
+
+    def release(self, task_ids: list) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE tasks SET state = 'pending', owner = NULL, lease_until = NULL WHERE id = ? AND state = 'leased'",
+                [(task_id,) for task_id in task_ids])
+
+    def extend(self, task_ids: list) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE tasks SET lease_until = ? WHERE id = ? AND state = 'leased'",
+                [(time() + self.visibility_timeout, task_id) for task_id in task_ids])
+
+    def available(self, kind: str, group: str | None = None) -> int:
+        params = [kind, time()] + ([group] if group is not None else [])
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT COUNT(*) FROM tasks WHERE {self._available_condition(group)}",
+                params).fetchone()[0]
+
+    def groups(self, kind: str) -> list:
+        with self.lock:
+            return [row[0] for row in self.connection.execute(
+                "SELECT grp FROM tasks WHERE kind = ? AND state != 'done' GROUP BY grp ORDER BY MIN(id)",
+                (kind,))]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+WORK_QUEUE_BACKENDS = {
+    "sqlite": SqliteWorkQueue
+}
+
+
+def open_work_queue(url: str) -> WorkQueue:
+    """Open the work queue of a URL like `sqlite:///path/to/queue.db`."""
+    scheme, _, path = url.partition("://")
+    if scheme not in WORK_QUEUE_BACKENDS:
+        raise ValueError(f"Unknown work queue backend: {scheme}")
+    return WORK_QUEUE_BACKENDS[scheme](path)
+
+
+class QueueFeed():
+    """Iterable over the tasks of a queue for one scraper. The tasks are leased in small
+    batches, and a task is acknowledged when the scraper asks for the next one
+    (or explicitly, with `tasks`, when the scraper reads ahead)."""
+
+    def __init__(
+            self,
+            work_queue: WorkQueue,
+            kind: str,
+            owner: str,
+            group: str | None = None,
+            lease_size: int | None = None):
+        self.work_queue = work_queue
+        self.kind = kind
+        self.owner = owner
+        self.group = group
+        self.lease_size: int = lease_size or config["work_queue"]["lease_size"]
+        self.max_attempts: int = config["work_queue"]["max_attempts"]
+        # Leased tasks not acknowledged yet (explicit mode), with their attempts.
+        # The scrapers of a phase can resolve the tasks of each other (the shared retries).
+        self.pending: dict = dict()
+        self.lock = threading.Lock()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            tasks = self.work_queue.lease(
+                self.kind, self.owner, limit=self.lease_size, group=self.group)
+            if not tasks:
+                return
+            ids = [task["id"] for task in tasks]
+            for index, task in enumerate(tasks):
+                try:
+                    yield task["payload"]
+                except GeneratorExit:
+                    # The scraper stopped: the current and the remaining tasks go back to the queue
+                    self.work_queue.release(ids[index:])
+                    raise
+                self.work_queue.ack([ids[index]])
+                # Keep the rest of the batch leased while this scraper is alive
+                if index + 1 < len(ids):
+                    self.work_queue.extend(ids[index + 1:])
+
+    def tasks(self) -> Iterator[tuple]:
+        """Yield (task id, payload) without acknowledging the tasks. The scraper acks each
+        task once its result is stored and releases the rest when it stops, so it can read
+        ahead of the task it is processing without losing the tasks it didn't process."""
+        while True:
+            tasks = self.work_queue.lease(
+                self.kind, self.owner, limit=self.lease_size, group=self.group)
+            if not tasks:
+                return
+            with self.lock:
+                self.pending.update((task["id"], task["attempts"]) for task in tasks)
+            for task in tasks:
+                yield task["id"], task["payload"]
+
+    def ack(self, task_id) -> None:
+        """Mark a task read with `tasks` as done."""
+        with self.lock:
+            self.pending.pop(task_id, None)
+            pending = list(self.pending)
+        self.work_queue.ack([task_id])
+        # Keep the other tasks leased while this scraper is alive
+        if pending:
+            self.work_queue.extend(pending)
+
+    def fail(self, task_id) -> None:
+        """Give back a task read with `tasks` whose item failed, so it is leased again.
+        After `max_attempts` leases it is marked as done."""
+        with self.lock:
+            attempts = self.pending.pop(task_id, None)
+        if attempts is None:
+            return
+        if attempts >= self.max_attempts:
+            self.work_queue.ack([task_id])
+        else:
+            self.work_queue.release([task_id])
+
+    def release(self) -> None:
+        """Give back the tasks read with `tasks` that were not acknowledged."""
+        with self.lock:
+            pending = list(self.pending)
+            self.pending = dict()
+        if pending:
+            self.work_queue.release(pending)